@@ -1,11 +1,184 @@
 import * as vscode from 'vscode';
-import axios from 'axios';
+import * as crypto from 'crypto';
+import axios, { AxiosResponse } from 'axios';
+
+const RAILWAY_URL = 'https://codesight-production-0b9f.up.railway.app';
+const EXCLUDED_DIRS = ['node_modules', '.git', '.venv', 'venv', 'env', '__pycache__', 'build', 'dist'];
+const MAX_WORKSPACE_FILES = 20000;
+const UPLOAD_BATCH = 100;
+const UPLOAD_BATCH_BYTES = 4 * 1024 * 1024;  // the server rejects uploads over WORKSPACE_MAX_UPLOAD_BYTES (8 MB)
 
 const diagnostics = vscode.languages.createDiagnosticCollection('coderift');
+const sessions = new Map<string, WorkspaceSession>();  // workspace folder uri -> session
+
+/** Git blob SHA-1 of the text, the same key the server caches parsed files under. */
+function blobSha(content: string): string {
+    const data = Buffer.from(content, 'utf8');
+    return crypto.createHash('sha1').update(`blob ${data.length}\0`).update(data).digest('hex');
+}
+
+async function readText(uri: vscode.Uri): Promise<string> {
+    return Buffer.from(await vscode.workspace.fs.readFile(uri)).toString('utf8');
+}
+
+/**
+ * Keeps the server's call graph of one workspace folder in step with the editor.
+ * Registers a manifest of path -> blob hash once and uploads only the files the
+ * server has never parsed; after that only hashes of changed files are sent.
+ */
+class WorkspaceSession {
+    private sessionId: string | undefined;
+    private pending = new Map<string, string | null>();  // relative path -> new hash, null when deleted
+    private syncing: Promise<void> | undefined;
+    private apiKey = '';
+
+    constructor(private readonly folder: vscode.WorkspaceFolder) {}
+
+    get registered(): boolean {
+        return this.sessionId !== undefined;
+    }
+
+    relativePath(uri: vscode.Uri): string | undefined {
+        if (vscode.workspace.getWorkspaceFolder(uri)?.uri.toString() !== this.folder.uri.toString()) {
+            return undefined;
+        }
+        const path = vscode.workspace.asRelativePath(uri, false);
+        if (!path.endsWith('.py') || path.split('/').some(part => EXCLUDED_DIRS.includes(part))) {
+            return undefined;
+        }
+        return path;
+    }
+
+    markChanged(uri: vscode.Uri, content: string | null) {
+        const path = this.relativePath(uri);
+        if (path && this.registered) {
+            this.pending.set(path, content === null ? null : blobSha(content));
+        }
+    }
+
+    reset() {
+        this.sessionId = undefined;
+        this.pending.clear();
+    }
+
+    /** Session id with the server up to date, or undefined when the server can't be reached. */
+    async ensure(apiKey: string): Promise<string | undefined> {
+        this.apiKey = apiKey;
+        if (!this.syncing) {
+            this.syncing = this.sync().finally(() => { this.syncing = undefined; });
+        }
+        await this.syncing;
+        return this.sessionId;
+    }
+
+    private async sync(): Promise<void> {
+        try {
+            if (!this.registered) {
+                await this.register();
+            } else if (this.pending.size > 0) {
+                const changes = Object.fromEntries(this.pending);
+                this.pending.clear();
+                const response = await axios.patch(`${RAILWAY_URL}/workspace/sessions/${this.sessionId}`, {
+                    changes, apiKey: this.apiKey
+                });
+                await this.upload(response.data.missing);
+            }
+        } catch (error: any) {
+            if (error.response?.status === 404) {
+                // Expired on the server; the next review registers the workspace again.
+                this.reset();
+            }
+            console.error(`Coderift: workspace sync failed: ${error.message}`);
+        }
+    }
+
+    private async register(): Promise<void> {
+        const pattern = new vscode.RelativePattern(this.folder, '**/*.py');
+        const exclude = `**/{${EXCLUDED_DIRS.join(',')}}/**`;
+        const manifest: Record<string, string> = {};
+        for (const uri of await vscode.workspace.findFiles(pattern, exclude, MAX_WORKSPACE_FILES)) {
+            const path = this.relativePath(uri);
+            if (path) {
+                manifest[path] = blobSha(await readText(uri));
+            }
+        }
+        const response = await axios.post(`${RAILWAY_URL}/workspace/sessions`, { manifest, apiKey: this.apiKey });
+        this.sessionId = response.data.sessionId;
+        this.pending.clear();
+        await this.upload(response.data.missing);
+    }
+
+    private async upload(missing: string[]): Promise<void> {
+        let files: Record<string, string> = {};
+        let count = 0;
+        let bytes = 0;
+        const send = async () => {
+            if (count > 0) {
+                await axios.post(`${RAILWAY_URL}/workspace/sessions/${this.sessionId}/files`, {
+                    files, apiKey: this.apiKey
+                });
+            }
+            files = {};
+            count = 0;
+            bytes = 0;
+        };
+        for (const path of missing) {
+            let text: string;
+            try {
+                text = await readText(vscode.Uri.joinPath(this.folder.uri, path));
+            } catch {
+                continue;  // Deleted since the manifest was built; the watcher reports it.
+            }
+            const size = Buffer.byteLength(text, 'utf8');
+            if (size > UPLOAD_BATCH_BYTES) {
+                continue;  // Too large to upload; the graph goes without it.
+            }
+            if (count >= UPLOAD_BATCH || bytes + size > UPLOAD_BATCH_BYTES) {
+                await send();
+            }
+            files[path] = text;
+            count += 1;
+            bytes += size;
+        }
+        await send();
+    }
+}
+
+function sessionFor(uri: vscode.Uri, create = false): WorkspaceSession | undefined {
+    const folder = vscode.workspace.getWorkspaceFolder(uri);
+    if (!folder) {
+        return undefined;
+    }
+    let session = sessions.get(folder.uri.toString());
+    if (!session && create) {
+        session = new WorkspaceSession(folder);
+        sessions.set(folder.uri.toString(), session);
+    }
+    return session;
+}
+
+async function markFromDisk(uri: vscode.Uri) {
+    const session = sessionFor(uri);
+    if (!session?.registered) {
+        return;
+    }
+    try {
+        session.markChanged(uri, await readText(uri));
+    } catch {
+        session.markChanged(uri, null);
+    }
+}
 
 export function activate(context: vscode.ExtensionContext) {
     console.log('Coderift is now active!');
 
+    // Saves, creates, deletes and changes made outside the editor (git checkout, formatters).
+    const watcher = vscode.workspace.createFileSystemWatcher('**/*.py');
+    watcher.onDidChange(markFromDisk);
+    watcher.onDidCreate(markFromDisk);
+    watcher.onDidDelete(uri => sessionFor(uri)?.markChanged(uri, null));
+    context.subscriptions.push(watcher);
+
     context.subscriptions.push(
         vscode.languages.registerCodeActionsProvider('python', new CoderiftFixer(), {
             providedCodeActionKinds: CoderiftFixer.providedCodeActionKinds
@@ -37,12 +210,31 @@ export function activate(context: vscode.ExtensionContext) {
             progress.report({ message: "Analyzing code..." });
 
             try {
-                const RAILWAY_URL = 'https://codesight-production-0b9f.up.railway.app'; 
-                const response = await axios.post(`${RAILWAY_URL}/analyze-local`, {
+                const session = sessionFor(document.uri, true);
+                const path = session?.relativePath(document.uri);
+                if (session && path) {
+                    progress.report({ message: "Syncing workspace..." });
+                }
+                const sessionId = session && path ? await session.ensure(userApiKey) : undefined;
+                progress.report({ message: "Analyzing code..." });
+
+                const request = (withSession: boolean) => axios.post(`${RAILWAY_URL}/analyze-local`, {
                     code: document.getText(),
                     fileName: document.fileName,
-                    apiKey: userApiKey
+                    apiKey: userApiKey,
+                    ...(withSession && sessionId ? { sessionId, path } : {})
                 });
+                let response: AxiosResponse;
+                try {
+                    response = await request(true);
+                } catch (error: any) {
+                    if (error.response?.status !== 404 || !sessionId) {
+                        throw error;
+                    }
+                    // Session expired on the server: review without repo context now, re-register next time.
+                    session?.reset();
+                    response = await request(false);
+                }
 
                 const { findings, summary } = response.data;
                 diagnostics.clear();
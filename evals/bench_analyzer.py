@@ -0,0 +1,100 @@
+"""Per-call latency of StaticAnalyzer: legacy subprocess path vs in-process engine.
+
+    python -m evals.bench_analyzer --runs 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.analyzer import StaticAnalyzer  # noqa: E402
+
+SAMPLE = '''
+import os
+
+def load(path, retries=3):
+    for attempt in range(retries):
+        if os.path.exists(path):
+            with open(path) as fh:
+                return fh.read()
+        elif attempt > 1:
+            return undefined_name
+    return None
+
+class Store:
+    def get(self, key):
+        if key is None:
+            return self.missing()
+        return self.data[key]
+'''
+
+
+def subprocess_analysis(code_string: str) -> dict:
+    """The pre-engine implementation: temp file + pylint and radon subprocesses."""
+    with tempfile.NamedTemporaryFile(suffix=".py", delete=False) as tmp:
+        tmp.write(code_string.encode("utf-8"))
+        tmp_path = tmp.name
+    try:
+        out = subprocess.run(["pylint", "--errors-only", "--output-format=json", tmp_path],
+                             capture_output=True, text=True, check=False).stdout
+        pylint_issues = [{"line": i["line"], "msg": i["message"]} for i in json.loads(out or "[]")]
+        out = subprocess.run(["radon", "cc", "-s", "--json", tmp_path],
+                             capture_output=True, text=True, check=False).stdout
+        blocks = next(iter(json.loads(out).values()), [])
+        complexity = [{"name": i["name"], "score": i["complexity"]} for i in blocks if i["complexity"] > 5]
+        return {"pylint_issues": pylint_issues, "complexity": complexity}
+    finally:
+        os.remove(tmp_path)
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, result
+
+
+def report(label, samples):
+    print(f"{label:<22} p50={statistics.median(samples):8.1f} ms  "
+          f"max={max(samples):8.1f} ms  runs={len(samples)}")
+
+
+async def pooled(runs):
+    await StaticAnalyzer.run_analysis_async(SAMPLE)  # warm the worker pool
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = await StaticAnalyzer.run_analysis_async(SAMPLE)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    legacy, legacy_result = timed(lambda: subprocess_analysis(SAMPLE), args.runs)
+    StaticAnalyzer.run_analysis(SAMPLE)  # first call loads checkers
+    inproc, inproc_result = timed(lambda: StaticAnalyzer.run_analysis(SAMPLE), args.runs)
+    pool, pool_result = asyncio.run(pooled(args.runs))
+    StaticAnalyzer.shutdown()
+
+    report("subprocess", legacy)
+    report("in-process (warm)", inproc)
+    report("process pool (warm)", pool)
+    if not (legacy_result == inproc_result == pool_result):
+        print("WARNING: results differ")
+        print(json.dumps({"subprocess": legacy_result, "in_process": inproc_result, "pool": pool_result}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
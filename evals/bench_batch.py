@@ -0,0 +1,72 @@
+"""Whole-project review: one /analyze-local call per file vs one analyze_batch.
+
+Reviews every .py file of a directory (the fixture repo by default, optionally
+repeated to include duplicates) against the LLM stub, first one file after
+another as the extension and CI scripts do today, then as a single batch.
+
+    python -m evals.bench_batch --llm-latency-ms 400 --copies 2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from evals.bench_pipeline import FIXTURES, load_snapshot, start_llm_stub  # noqa: E402
+
+
+async def run(args, stub):
+    from reviewer import analyze_code, analyze_batch
+    from utils.analyzer import StaticAnalyzer
+    from utils.graph_manager import GraphManager
+
+    files = {p: c.decode() for p, c in load_snapshot(args.repo).items() if p.endswith(".py")}
+    items = [{"id": f"{p}#{k}", "path": p, "code": c} for k in range(args.copies) for p, c in files.items()]
+    # Start the analyzer processes up front so neither run pays for the spawn.
+    await StaticAnalyzer.run_batch_async(["x = 1"] * 4)
+    print(f"{len(items)} items ({len(files)} distinct files)")
+
+    calls = stub["requests"]
+    start = time.perf_counter()
+    for item in items:
+        await analyze_code(item["code"], GraphManager(), path=item["path"])
+    sequential = time.perf_counter() - start
+    print(f"per-file calls   {sequential:7.2f} s   {stub['requests'] - calls} LLM calls")
+
+    calls = stub["requests"]
+    start, slowest = time.perf_counter(), 0.0
+    async for index, result in analyze_batch(items, GraphManager(), max_parallel=args.parallel):
+        slowest = time.perf_counter() - start
+        if isinstance(result, Exception):
+            print(f"  {items[index]['id']}: {result}")
+    print(f"analyze_batch    {slowest:7.2f} s   {stub['requests'] - calls} LLM calls")
+    StaticAnalyzer.shutdown()
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repo", default=os.path.join(FIXTURES, "repo"), help="directory of files to review")
+    parser.add_argument("--copies", type=int, default=2, help="times each file appears in the batch")
+    parser.add_argument("--parallel", type=int, default=8, help="batch concurrency limit")
+    parser.add_argument("--llm-port", type=int, default=8767)
+    parser.add_argument("--llm-latency-ms", type=float, default=400)
+    parser.add_argument("--llm-ms-per-token", type=float, default=2)
+    parser.add_argument("--completion-tokens", type=int, default=150)
+    args = parser.parse_args()
+    args.llm_throttle_every = 0
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}/v1"
+    os.environ["REVIEW_CACHE_BACKEND"] = "none"
+
+    server, _, app = start_llm_stub(args)
+    try:
+        asyncio.run(run(args, app.state.stats))
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,134 @@
+"""Context size before/after symbol resolution on a real repository checkout.
+
+For every function in the repo, builds the dependency + impact context the reviewer
+would receive, once with the old bare-name graph and once with the qualified
+symbol index, and reports the payload sizes.
+
+    python -m evals.bench_context /path/to/checkout --hops 2
+"""
+import argparse
+import ast
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.graph_manager import GraphManager  # noqa: E402
+
+
+class BareNameGraph:
+    """The previous GraphBuilder semantics: edges keyed by bare callee/attribute names."""
+
+    def __init__(self):
+        self.nodes, self.edges, self.reverse_edges = {}, {}, {}
+
+    def add(self, path, tree):
+        def visit(node, scope):
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, ast.ClassDef):
+                    self.nodes[child.name] = (path, ast.unparse(child))
+                    bases = {b.id for b in child.bases if isinstance(b, ast.Name)}
+                    self._link(child.name, bases)
+                    visit(child, child.name)
+                elif isinstance(child, ast.FunctionDef):
+                    name = f"{scope}.{child.name}" if scope else child.name
+                    self.nodes[name] = (path, ast.unparse(child))
+                    visit(child, name)
+                else:
+                    if isinstance(child, ast.Call) and scope:
+                        func = child.func
+                        callee = func.id if isinstance(func, ast.Name) else getattr(func, "attr", None)
+                        if callee:
+                            self._link(scope, {callee})
+                    visit(child, scope)
+        visit(tree, None)
+
+    def _link(self, caller, callees):
+        self.edges.setdefault(caller, set()).update(callees)
+        for callee in callees:
+            self.reverse_edges.setdefault(callee, set()).add(caller)
+
+    def walk(self, names, edge_map, hops, label):
+        context, visited = [], set()
+        queue = [(t, 0) for t in names if t in self.nodes or t in edge_map]
+        while queue:
+            name, dist = queue.pop(0)
+            if name in visited or dist > hops:
+                continue
+            visited.add(name)
+            if name in self.nodes:
+                path, code = self.nodes[name]
+                context.append(f"--- {label}: {name} ({path}) ---\n{code}")
+            for neighbor in edge_map.get(name, []):
+                queue.append((neighbor, dist + 1))
+        return "\n\n".join(context)
+
+
+def load_repo(root):
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".") and d not in ("node_modules", "venv", ".venv")]
+        for filename in filenames:
+            if filename.endswith(".py"):
+                full = os.path.join(dirpath, filename)
+                try:
+                    with open(full, encoding="utf-8") as fh:
+                        files.append({"path": os.path.relpath(full, root).replace(os.sep, "/"), "content": fh.read()})
+                except (UnicodeDecodeError, OSError):
+                    pass
+    return files
+
+
+def summarize(label, sizes, elapsed):
+    ordered = sorted(sizes)
+    p95 = ordered[int(len(ordered) * 0.95) - 1] if ordered else 0
+    print(f"{label:<10} total={sum(sizes):>12,} chars  mean={statistics.mean(sizes) if sizes else 0:>10,.0f}  "
+          f"p95={p95:>10,}  max={max(sizes, default=0):>10,}  time={elapsed:6.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", nargs="?", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    parser.add_argument("--hops", type=int, default=2)
+    parser.add_argument("--limit", type=int, default=2000, help="max functions to sample")
+    args = parser.parse_args()
+
+    files = load_repo(args.root)
+    legacy = BareNameGraph()
+    graph = GraphManager(context_budget=10**9)
+    snippets = []
+    for file_data in files:
+        try:
+            tree = ast.parse(file_data["content"])
+        except SyntaxError:
+            continue
+        legacy.add(file_data["path"], tree)
+        graph.add_file(file_data)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.FunctionDef) and len(snippets) < args.limit:
+                snippets.append((file_data["path"], node.name, ast.unparse(node)))
+    print(f"{len(files)} files, {len(snippets)} sampled functions, hops={args.hops}")
+
+    start = time.perf_counter()
+    before = [
+        len(legacy.walk([name], legacy.edges, args.hops, "DEPENDENCY"))
+        + len(legacy.walk([name], legacy.reverse_edges, 1, "IMPACTED NODE"))
+        for _, name, _ in snippets
+    ]
+    summarize("bare-name", before, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    after = [
+        len(graph.get_context(code, hops=args.hops, path=path))
+        + len(graph.get_impact_analysis(code, hops=1, path=path))
+        for path, _, code in snippets
+    ]
+    summarize("resolved", after, time.perf_counter() - start)
+
+    if sum(before):
+        print(f"context reduction: {100 * (1 - sum(after) / sum(before)):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
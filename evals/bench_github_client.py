@@ -0,0 +1,99 @@
+"""Mock GitHub server harness for GitHubClient.
+
+Serves a synthetic repository through httpx.MockTransport with per-request latency,
+ETag validators and an optional burst of 429s, then reports request counts and
+wall time for a cold fetch and a warm one, where the tree is revalidated and the
+blobs fetched cold are skipped as already indexed.
+
+    python -m evals.bench_github_client --files 500 --latency-ms 40 --throttle 5
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.github_client import GitHubClient  # noqa: E402
+
+REPO = "bench/repo"
+
+
+class MockGitHub:
+    def __init__(self, files: int, latency_ms: float, throttle: int):
+        self.latency = latency_ms / 1000
+        self.throttle = throttle
+        self.files = {f"pkg/mod_{i}.py": f"def f_{i}():\n    return f_{i + 1}()\n" for i in range(files)}
+        self.counts = {"total": 0, "200": 0, "304": 0, "429": 0}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def _respond(self, request: httpx.Request, body: bytes) -> httpx.Response:
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            self.counts["304"] += 1
+            return httpx.Response(304, headers={"ETag": etag})
+        self.counts["200"] += 1
+        return httpx.Response(200, headers={"ETag": etag}, content=body)
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.counts["total"] += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.throttle > 0:
+                self.throttle -= 1
+                self.counts["429"] += 1
+                return httpx.Response(429, headers={"Retry-After": "0"})
+
+            path = request.url.path
+            if path.endswith("/git/trees/main"):
+                tree = [{"path": p, "type": "blob", "sha": hashlib.sha1(c.encode()).hexdigest()}
+                        for p, c in self.files.items()]
+                return self._respond(request, json.dumps({"tree": tree}).encode())
+            if "/contents/" in path:
+                file_path = path.split("/contents/", 1)[1]
+                content = base64.b64encode(self.files[file_path].encode()).decode()
+                return self._respond(request, json.dumps({"content": content}).encode())
+            return httpx.Response(404)
+        finally:
+            self.in_flight -= 1
+
+
+async def run(args):
+    server = MockGitHub(args.files, args.latency_ms, args.throttle)
+    client = GitHubClient(transport=httpx.MockTransport(server.handler))
+    client.max_backoff = 0.05
+
+    indexed = set()
+
+    async def known(blobs):
+        return indexed & set(blobs)
+
+    for label in ("cold", "warm"):
+        before = dict(server.counts)
+        start = time.perf_counter()
+        files = await client.get_repo_contents(REPO, "main", known=known)
+        indexed |= {(f["path"], f["sha"]) for f in files}
+        elapsed = time.perf_counter() - start
+        delta = {k: server.counts[k] - before[k] for k in server.counts}
+        print(f"{label:>5}: {len(files)} files in {elapsed * 1000:.0f} ms | "
+              f"requests={delta['total']} 200={delta['200']} 304={delta['304']} 429={delta['429']}")
+
+    print(f"peak in-flight requests: {server.peak_in_flight} (cap {client.max_concurrency})")
+    print(f"client stats: {client.stats}")
+    await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--throttle", type=int, default=0, help="initial requests answered with 429")
+    asyncio.run(run(parser.parse_args()))
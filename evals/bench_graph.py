@@ -0,0 +1,125 @@
+"""Memory and traversal benchmark for GraphManager on a synthetic call graph.
+
+Generates N functions spread over files, each calling a few others, then compares
+the compact CSR core against the previous dict-of-sets layout.
+
+    python -m evals.bench_graph --functions 100000 --queries 2000
+"""
+import argparse
+import ast
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.graph_manager import GraphManager  # noqa: E402
+
+
+def synthetic_repo(functions: int, per_file: int, fan_out: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    files = []
+    for start in range(0, functions, per_file):
+        body, imports = [], set()
+        for i in range(start, min(start + per_file, functions)):
+            callees = [rng.randrange(functions) for _ in range(fan_out)]
+            for c in callees:
+                if c // per_file != start // per_file:
+                    imports.add(f"from pkg.mod_{c // per_file} import fn_{c}")
+            calls = "\n".join(f"    total += fn_{c}(x)" for c in callees)
+            body.append(f"def fn_{i}(x):\n    total = 0\n{calls}\n    return total\n")
+        content = "\n".join(sorted(imports)) + "\n\n" + "\n".join(body)
+        files.append({"path": f"pkg/mod_{start // per_file}.py", "content": content})
+    return files
+
+
+class LegacyGraph:
+    """The pre-CSR layout: unparsed source per node, sets of names, list-based BFS."""
+
+    def __init__(self):
+        self.nodes, self.edges, self.reverse_edges = {}, {}, {}
+
+    def build(self, files):
+        for file_data in files:
+            tree = ast.parse(file_data["content"])
+            for node in tree.body:
+                if isinstance(node, ast.FunctionDef):
+                    self.nodes[node.name] = {"source": file_data["path"], "code": ast.unparse(node), "type": "function"}
+                    for call in ast.walk(node):
+                        if isinstance(call, ast.Call) and isinstance(call.func, ast.Name):
+                            self.edges.setdefault(node.name, set()).add(call.func.id)
+                            self.reverse_edges.setdefault(call.func.id, set()).add(node.name)
+
+    def walk(self, snippet, edge_map, max_hops):
+        start = [n.name for n in ast.walk(ast.parse(snippet)) if isinstance(n, ast.FunctionDef)]
+        context, visited = [], set()
+        queue = [(t, 0) for t in start if t in self.nodes or t in edge_map]
+        while queue:
+            name, dist = queue.pop(0)
+            if name in visited or dist > max_hops:
+                continue
+            visited.add(name)
+            node = self.nodes.get(name)
+            if node:
+                context.append(f"--- DEPENDENCY: {name} ({node['source']}) ---\n{node['code']}")
+            for neighbor in edge_map.get(name, []):
+                queue.append((neighbor, dist + 1))
+        return "\n\n".join(context)
+
+
+def measure(label, build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    graph = build()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<8} build={elapsed:6.2f} s  retained={current / 2**20:7.1f} MiB  peak={peak / 2**20:7.1f} MiB")
+    return graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--functions", type=int, default=100_000)
+    parser.add_argument("--per-file", type=int, default=100)
+    parser.add_argument("--fan-out", type=int, default=4)
+    parser.add_argument("--hops", type=int, default=2)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    files = synthetic_repo(args.functions, args.per_file, args.fan_out)
+    rng = random.Random(11)
+    queries = [f"fn_{rng.randrange(args.functions)}" for _ in range(args.queries)]
+
+    def build_compact():
+        graph = GraphManager(context_budget=10**9)
+        graph.build_from_contents(files)
+        graph.index  # freeze the CSR arrays inside the measurement
+        return graph
+
+    compact = measure("compact", build_compact)
+    start = time.perf_counter()
+    compact_bytes = sum(len(compact.get_context(f"def {q}(x): pass", hops=args.hops)) for q in queries)
+    compact_walk = time.perf_counter() - start
+
+    if not args.skip_legacy:
+        def build_legacy():
+            graph = LegacyGraph()
+            graph.build(files)
+            return graph
+
+        legacy = measure("legacy", build_legacy)
+        start = time.perf_counter()
+        legacy_bytes = sum(len(legacy.walk(f"def {q}(x): pass", legacy.edges, args.hops)) for q in queries)
+        legacy_walk = time.perf_counter() - start
+        print(f"legacy   traversal: {legacy_walk / len(queries) * 1000:7.3f} ms/query  ({legacy_bytes} chars)")
+
+    print(f"compact  traversal: {compact_walk / len(queries) * 1000:7.3f} ms/query  ({compact_bytes} chars)")
+
+
+if __name__ == "__main__":
+    main()
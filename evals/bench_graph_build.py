@@ -0,0 +1,92 @@
+"""Graph build scaling benchmark: serial on-loop build vs the chunked process pool.
+
+Generates a synthetic repository (10k+ files by default), then builds it once with
+build_from_contents on the event loop and once per worker count with
+build_from_stream, reporting wall time and the worst event-loop stall seen by a
+10 ms ticker while the build runs.
+
+    python -m evals.bench_graph_build --files 12000 --workers 1,2,4,8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from evals.bench_graph import synthetic_repo  # noqa: E402
+from utils import graph_manager  # noqa: E402
+from utils.graph_manager import GraphManager, parse_chunk  # noqa: E402
+
+
+async def loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def files_arriving(files: list, batch: int, delay: float):
+    """Yields files the way an archive stream would: in bursts, with network gaps."""
+    for i, file_data in enumerate(files):
+        if delay and i % batch == 0:
+            await asyncio.sleep(delay)
+        yield file_data
+
+
+async def timed(label: str, build) -> GraphManager:
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(loop_lag(stop))
+    await asyncio.sleep(0.02)
+    start = time.perf_counter()
+    graph = await build()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    lag = await ticker
+    print(f"{label:<22} {elapsed:7.2f} s   worst loop stall {lag * 1000:8.1f} ms   "
+          f"{len(graph.files)} files, {len(graph.names)} nodes")
+    return graph
+
+
+async def run(args):
+    functions = args.files * args.per_file
+    files = synthetic_repo(functions, args.per_file, args.fan_out)
+    delay = args.arrival_ms / 1000
+    print(f"{len(files)} files, {functions} functions, {os.cpu_count()} CPUs, chunk={args.chunk}")
+
+    async def serial():
+        graph = GraphManager()
+        graph.build_from_contents(files)
+        return graph
+
+    await timed("serial (on loop)", serial)
+
+    for workers in [int(w) for w in args.workers.split(",")]:
+        graph_manager.shutdown_parse_pool()
+        executor = graph_manager._get_parse_executor(workers)
+        # Start every worker process before timing so spawn cost is not counted.
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(executor, parse_chunk, []) for _ in range(workers * 2)])
+
+        async def pooled():
+            graph = GraphManager()
+            graph.build_workers = workers
+            graph.parse_chunk_size = args.chunk
+            await graph.build_from_stream(files_arriving(files, args.chunk, delay))
+            return graph
+
+        await timed(f"pool x{workers}", pooled)
+    graph_manager.shutdown_parse_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=12000)
+    parser.add_argument("--per-file", type=int, default=8, help="functions per file")
+    parser.add_argument("--fan-out", type=int, default=3)
+    parser.add_argument("--chunk", type=int, default=64)
+    parser.add_argument("--workers", default=",".join(str(w) for w in (1, 2, 4, 8) if w <= (os.cpu_count() or 1)) or "1")
+    parser.add_argument("--arrival-ms", type=float, default=0, help="simulated network gap per chunk of files")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,99 @@
+"""Graph memory across worker processes: per-worker GraphManager vs one mapped snapshot.
+
+Builds a synthetic repository graph, writes it as a snapshot, then starts N
+worker processes that either build their own graph or map the snapshot, run the
+same context queries, and report their proportional (PSS) and private memory
+from /proc/self/smaps_rollup. Linux only.
+
+    python -m evals.bench_graph_snapshot --functions 100000 --workers 1,2,4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from evals.bench_graph import synthetic_repo  # noqa: E402
+from utils.graph_manager import GraphManager  # noqa: E402
+from utils.graph_snapshot import SnapshotGraph, write_snapshot  # noqa: E402
+
+
+def memory_kb() -> dict:
+    fields = {}
+    with open("/proc/self/smaps_rollup") as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {"pss": fields.get("Pss", 0), "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)}
+
+
+def worker(mode: str, files: list, snapshot: str, queries: int, ready, results, go):
+    baseline = memory_kb()
+    if mode == "snapshot":
+        graph = SnapshotGraph(snapshot)
+    else:
+        graph = GraphManager()
+        graph.build_from_contents(files)
+        graph.index
+    rng = random.Random(os.getpid())
+    start = time.perf_counter()
+    for f in rng.sample(files, min(queries, len(files))):
+        graph.get_context_chunks(f["content"], path=f["path"])
+    elapsed = time.perf_counter() - start
+    ready.put(None)
+    go.wait()  # measure only once every worker has its graph, so shared pages are split fairly
+    used = memory_kb()
+    results.put({"pss": used["pss"] - baseline["pss"], "private": used["private"] - baseline["private"],
+                 "query_ms": elapsed * 1000 / queries})
+
+
+def run_workers(mode: str, count: int, files: list, snapshot: str, queries: int) -> list:
+    ctx = multiprocessing.get_context("fork")  # children share the parent's copy of `files`
+    ready, results, go = ctx.Queue(), ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=worker, args=(mode, files, snapshot, queries, ready, results, go))
+             for _ in range(count)]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        ready.get()
+    go.set()
+    out = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return out
+
+
+def main(args):
+    files = synthetic_repo(args.functions, args.per_file, args.fan_out)
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-snapshot-"), "repo.graph")
+    graph = GraphManager()
+    graph.build_from_contents(files)
+    start = time.perf_counter()
+    write_snapshot(graph, path)
+    print(f"{len(files)} files, {args.functions} functions; snapshot {os.path.getsize(path) / 1e6:.1f} MB "
+          f"written in {time.perf_counter() - start:.2f} s")
+    del graph
+
+    print(f"\n{'mode':<10}{'workers':>8}{'total PSS MB':>14}{'private MB/worker':>19}{'ms/query':>10}")
+    for count in [int(w) for w in args.workers.split(",")]:
+        for mode in ("per-worker", "snapshot"):
+            stats = run_workers(mode, count, files, path, args.queries)
+            pss = sum(s["pss"] for s in stats) / 1024
+            private = sum(s["private"] for s in stats) / 1024 / count
+            query_ms = sum(s["query_ms"] for s in stats) / count
+            print(f"{mode:<10}{count:>8}{pss:>14.1f}{private:>19.1f}{query_ms:>10.2f}")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--functions", type=int, default=100000)
+    parser.add_argument("--per-file", type=int, default=8)
+    parser.add_argument("--fan-out", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--workers", default="1,2,4")
+    main(parser.parse_args())
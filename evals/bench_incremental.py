@@ -0,0 +1,159 @@
+"""Cost of re-reviewing a PR on every push: full re-review vs only the new commits.
+
+Simulates a PR against the fixture repository that receives N pushes, each
+adding a small function to one file, and runs process_review_task after every
+push against a mock GitHub (PR diff, compare API, comment create/edit) and the
+LLM stub. Reports LLM calls, prompt tokens and GitHub requests per push.
+
+    python -m evals.bench_incremental --pushes 8
+"""
+import argparse
+import asyncio
+import difflib
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from evals.bench_pipeline import FIXTURES, MockGitHub, load_snapshot, start_llm_stub  # noqa: E402
+
+
+def git_diff(old: dict, new: dict) -> str:
+    out = []
+    for path in sorted(set(old) | set(new)):
+        a, b = old.get(path, ""), new.get(path, "")
+        if a != b:
+            out.append(f"diff --git a/{path} b/{path}")
+            out.extend(difflib.unified_diff(a.split("\n"), b.split("\n"), f"a/{path}", f"b/{path}", lineterm=""))
+    return "\n".join(out) + "\n" if out else ""
+
+
+def compare_files(old: dict, new: dict) -> list:
+    """The "files" list of a compare response: one hunk-only patch per changed file."""
+    files = []
+    for path in sorted(set(old) | set(new)):
+        a, b = old.get(path, ""), new.get(path, "")
+        if a != b:
+            lines = list(difflib.unified_diff(a.split("\n"), b.split("\n"), lineterm=""))[2:]
+            status = "added" if path not in old else "removed" if path not in new else "modified"
+            files.append({"filename": path, "status": status, "changes": len(lines), "patch": "\n".join(lines)})
+    return files
+
+
+def pr_heads(base: dict, pushes: int) -> list:
+    """File contents at each PR head: head 0 is the opened PR, then one commit per push."""
+    paths = sorted(p for p in base if p.endswith(".py") and not p.endswith("__init__.py"))
+    heads = [dict(base)]
+    heads[0][paths[0]] += "\n\ndef opened_helper(items):\n    return [i for i in items if i]\n"
+    for k in range(1, pushes + 1):
+        head = dict(heads[-1])
+        path = paths[k % len(paths)]
+        head[path] += f"\n\ndef push_{k}(values, limit={k}):\n    return sorted(values)[:limit]\n"
+        heads.append(head)
+    return heads
+
+
+class PushedPR(MockGitHub):
+    """MockGitHub whose PR head moves with every push; serves compare and comment edits."""
+
+    def __init__(self, base: dict, heads: list, latency_ms: float):
+        super().__init__({p: c.encode() for p, c in base.items()}, "", latency_ms)
+        self.base = base
+        self.heads = {self.sha(h): h for h in heads}
+        self.head = heads[0]
+        self.requests = 0
+
+    @staticmethod
+    def sha(files: dict) -> str:
+        return hashlib.sha1(json.dumps(files, sort_keys=True).encode()).hexdigest()
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        path = request.url.path
+        if path.endswith(".diff"):
+            await asyncio.sleep(self.latency)
+            return httpx.Response(200, text=git_diff(self.base, self.head))
+        if "/compare/" in path:
+            await asyncio.sleep(self.latency)
+            old, new = (self.heads.get(sha) for sha in path.split("/compare/", 1)[1].split("..."))
+            if old is None or new is None:
+                return httpx.Response(404)
+            if "diff" in request.headers.get("Accept", ""):
+                return httpx.Response(200, text=git_diff(old, new))
+            return httpx.Response(200, json={"status": "identical" if old == new else "ahead",
+                                             "files": compare_files(old, new)})
+        if "/issues/comments/" in path and request.method == "PATCH":
+            await asyncio.sleep(self.latency)
+            index = int(path.rsplit("/", 1)[1]) - 1
+            self.comments[index] = json.loads(request.content)
+            return httpx.Response(200, json={"id": index + 1})
+        return await super().handler(request)
+
+
+async def run(args, stub):
+    import main
+    from utils.analyzer import StaticAnalyzer
+    from utils.github_client import GitHubClient
+    from utils.pr_state import PRStateStore
+
+    base = {p: c.decode() for p, c in load_snapshot(args.repo).items()}
+    heads = pr_heads(base, args.pushes)
+    base_sha = hashlib.sha1(b"base").hexdigest()
+    totals = {}
+
+    for pr_number, mode in enumerate(("full", "incremental"), start=1):
+        mock = PushedPR(base, heads, args.github_latency_ms)
+        main.github = GitHubClient(transport=httpx.MockTransport(mock.handler))
+        main.pr_states = PRStateStore(os.path.join(args.work_dir, f"{mode}.sqlite")) if mode == "incremental" else None
+        print(f"\n{mode}\n{'push':>5}{'llm calls':>11}{'prompt tok':>12}{'github reqs':>13}{'comments':>10}")
+        for k, head in enumerate(heads):
+            mock.head = head
+            llm_before, tokens_before, gh_before = stub["requests"], stub["prompt_tokens"], mock.requests
+            await main.process_review_task("bench/shop", pr_number, "https://github.com/bench/shop/pull/1.diff",
+                                           "main", base_sha, PushedPR.sha(head))
+            row = (stub["requests"] - llm_before, stub["prompt_tokens"] - tokens_before, mock.requests - gh_before)
+            totals[mode] = [a + b for a, b in zip(totals.get(mode, (0, 0, 0)), row)]
+            print(f"{k:>5}{row[0]:>11}{row[1]:>12}{row[2]:>13}{len(mock.comments):>10}")
+        await main.github.close()
+    StaticAnalyzer.shutdown()
+
+    print(f"\n{'total':<12}{'llm calls':>11}{'prompt tok':>12}{'github reqs':>13}")
+    for mode, (calls, tokens, requests) in totals.items():
+        print(f"{mode:<12}{calls:>11}{tokens:>12}{requests:>13}")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repo", default=os.path.join(FIXTURES, "repo"), help="repository snapshot directory")
+    parser.add_argument("--pushes", type=int, default=8)
+    parser.add_argument("--github-latency-ms", type=float, default=0)
+    parser.add_argument("--llm-port", type=int, default=8766)
+    parser.add_argument("--llm-latency-ms", type=float, default=0)
+    parser.add_argument("--llm-ms-per-token", type=float, default=0)
+    parser.add_argument("--completion-tokens", type=int, default=150)
+    args = parser.parse_args()
+    args.llm_throttle_every = 0
+
+    args.work_dir = tempfile.mkdtemp(prefix="bench-incremental-")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}/v1"
+    os.environ["REVIEW_CACHE_BACKEND"] = "none"
+    os.environ["GITHUB_FETCH_MODE"] = "contents"
+    os.environ["GRAPH_CACHE_PATH"] = os.path.join(args.work_dir, "graph.sqlite")
+    os.environ["GRAPH_SNAPSHOT_DIR"] = os.path.join(args.work_dir, "snapshots")
+    os.environ["PR_STATE_PATH"] = os.path.join(args.work_dir, "pr_state.sqlite")
+
+    server, _, app = start_llm_stub(args)
+    try:
+        asyncio.run(run(args, app.state.stats))
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main_cli()
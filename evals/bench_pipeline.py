@@ -0,0 +1,183 @@
+"""Offline end-to-end benchmark of process_review_task.
+
+Replays the webhook payload, diff and repository snapshot under evals/fixtures
+against a mock GitHub (httpx.MockTransport) and the deterministic LLM stub, runs
+N PRs concurrently for a few rounds and reports per-stage timings, p50/p95
+end-to-end latency and reviews/minute.
+
+    python -m evals.bench_pipeline --concurrency 8 --rounds 3 --llm-latency-ms 400
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "evals", "fixtures")
+sys.path.insert(0, ROOT)
+
+STAGES = ("fetch", "graph_build", "graph_context", "static_analysis", "reviewer", "auditor", "comment_post")
+
+
+def load_snapshot(repo_dir: str) -> dict:
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(repo_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".") and d != "__pycache__"]
+        for filename in filenames:
+            full = os.path.join(dirpath, filename)
+            with open(full, "rb") as fh:
+                files[os.path.relpath(full, repo_dir).replace(os.sep, "/")] = fh.read()
+    return files
+
+
+class MockGitHub:
+    """Serves the snapshot for every repo name, plus the fixture diff and comment posts."""
+
+    def __init__(self, files: dict, diff: str, latency_ms: float):
+        self.files = files
+        self.diff = diff
+        self.latency = latency_ms / 1000
+        self.comments = []
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.latency)
+        path = request.url.path
+        if path.endswith(".diff"):
+            return httpx.Response(200, text=self.diff)
+        if "/git/trees/" in path:
+            tree = [{"path": p, "type": "blob", "sha": hashlib.sha1(b"blob %d\0" % len(c) + c).hexdigest()}
+                    for p, c in self.files.items()]
+            return httpx.Response(200, json={"tree": tree})
+        if "/contents/" in path:
+            content = self.files.get(path.split("/contents/", 1)[1])
+            if content is None:
+                return httpx.Response(404)
+            return httpx.Response(200, json={"content": base64.b64encode(content).decode()})
+        if path.endswith("/comments") and request.method == "POST":
+            self.comments.append(json.loads(request.content))
+            return httpx.Response(201, json={"id": len(self.comments)})
+        return httpx.Response(404)
+
+
+def start_llm_stub(args) -> tuple:
+    """Runs the stub on its own thread and loop so it does not share the pipeline's."""
+    import uvicorn
+    from evals.llm_stub import create_app
+
+    app = create_app(args.llm_latency_ms, args.llm_ms_per_token, args.completion_tokens, args.llm_throttle_every)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.llm_port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, app
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run(args):
+    import main
+    from utils import tracing
+    from utils.analyzer import StaticAnalyzer
+    from utils.github_client import GitHubClient
+
+    with open(os.path.join(FIXTURES, "pull_request.json")) as fh:
+        payload = json.load(fh)
+    with open(os.path.join(FIXTURES, "pull_request.diff")) as fh:
+        diff = fh.read()
+    mock = MockGitHub(load_snapshot(args.repo), diff, args.github_latency_ms)
+    main.github = GitHubClient(transport=httpx.MockTransport(mock.handler))
+
+    repo = payload["repository"]["full_name"]
+    pr = payload["pull_request"]
+    traces, e2e, rounds = [], [], []
+
+    async def one(index: int):
+        # Distinct repo names give every concurrent PR its own graph to build.
+        repo_name = f"{repo}-{index}" if args.distinct_repos else repo
+        with tracing.trace() as spans:
+            start = time.perf_counter()
+            await main.process_review_task(repo_name, pr["number"] + index, pr["diff_url"], pr["base"]["ref"],
+                                          None if args.no_snapshots else pr["base"]["sha"])
+            e2e.append(time.perf_counter() - start)
+        traces.append(tracing.totals(spans))
+
+    for round_no in range(args.rounds):
+        start = time.perf_counter()
+        await asyncio.gather(*[one(i) for i in range(args.concurrency)])
+        rounds.append(time.perf_counter() - start)
+        print(f"round {round_no + 1}: {args.concurrency} reviews in {rounds[-1]:.2f} s")
+
+    await main.github.close()
+    StaticAnalyzer.shutdown()
+
+    print(f"\n{'stage':<16}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}   (per review, summed over shards)")
+    for name in STAGES + tuple(sorted({k for t in traces for k in t} - set(STAGES))):
+        values = [t.get(name, 0.0) * 1000 for t in traces]
+        print(f"{name:<16}{statistics.mean(values):>10.1f}{percentile(values, 50):>10.1f}{percentile(values, 95):>10.1f}")
+
+    total = len(e2e)
+    print(f"\nend-to-end  p50={percentile(e2e, 50) * 1000:.0f} ms  p95={percentile(e2e, 95) * 1000:.0f} ms  "
+          f"max={max(e2e) * 1000:.0f} ms")
+    print(f"throughput  {total / sum(rounds) * 60:.1f} reviews/min at concurrency {args.concurrency}")
+    print(f"comments posted: {len(mock.comments)}")
+    if args.dump_metrics:
+        from utils import metrics
+        await metrics.collect()
+        print("\n" + metrics.render().decode())
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repo", default=os.path.join(FIXTURES, "repo"), help="repository snapshot directory")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--distinct-repos", action="store_true")
+    parser.add_argument("--github-latency-ms", type=float, default=30)
+    parser.add_argument("--llm-port", type=int, default=8765)
+    parser.add_argument("--llm-url", help="use an already running stub instead of starting one")
+    parser.add_argument("--llm-latency-ms", type=float, default=400)
+    parser.add_argument("--llm-ms-per-token", type=float, default=2)
+    parser.add_argument("--completion-tokens", type=int, default=150)
+    parser.add_argument("--llm-throttle-every", type=int, default=0, help="stub answers every Nth call with a 429")
+    parser.add_argument("--no-snapshots", action="store_true", help="keep per-worker graphs instead of snapshots")
+    parser.add_argument("--dump-metrics", action="store_true", help="print the /metrics exposition afterwards")
+    args = parser.parse_args()
+
+    # Must be set before reviewer/main are imported: both read config at import time.
+    cache_dir = tempfile.mkdtemp(prefix="bench-pipeline-")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    os.environ["OPENAI_BASE_URL"] = args.llm_url or f"http://127.0.0.1:{args.llm_port}/v1"
+    os.environ["REVIEW_CACHE_BACKEND"] = "none"
+    os.environ["GITHUB_FETCH_MODE"] = "contents"
+    os.environ["GRAPH_CACHE_PATH"] = os.path.join(cache_dir, "graph.sqlite")
+    os.environ["GRAPH_SNAPSHOT_DIR"] = os.path.join(cache_dir, "snapshots")
+    os.environ["PR_STATE_PATH"] = os.path.join(cache_dir, "pr_state.sqlite")
+
+    server = app = None
+    if not args.llm_url:
+        server, _, app = start_llm_stub(args)
+    try:
+        asyncio.run(run(args))
+    finally:
+        if server is not None:
+            print(f"llm stub: {app.state.stats}")
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    main_cli()
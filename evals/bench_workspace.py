@@ -0,0 +1,80 @@
+"""Save-to-context latency for editor workspace sessions.
+
+Registers a synthetic workspace, then simulates saves of single files and
+measures the graph update plus the context lookup a review would do. Compared
+with rebuilding the graph from an upload of the whole workspace on every save.
+
+    python -m evals.bench_workspace --files 4000 --saves 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from evals.bench_graph import synthetic_repo  # noqa: E402
+from utils.graph_cache import GraphCache, blob_sha  # noqa: E402
+from utils.graph_manager import GraphManager, shutdown_parse_pool  # noqa: E402
+from utils.workspace_sessions import WorkspaceSessions  # noqa: E402
+
+
+def edited(file_data: dict, k: int) -> str:
+    return file_data["content"] + f"\n\ndef saved_{k}(x):\n    return x\n"
+
+
+async def run(args):
+    work_dir = tempfile.mkdtemp(prefix="bench-workspace-")
+    files = synthetic_repo(args.files * args.per_file, args.per_file, args.fan_out)
+    cache = GraphCache(os.path.join(work_dir, "graph.sqlite"))
+    # One upload call for the whole workspace, where the extension sends several.
+    sessions = WorkspaceSessions(os.path.join(work_dir, "sessions.sqlite"), cache=cache, max_upload_bytes=1 << 40)
+
+    start = time.perf_counter()
+    session = await sessions.create({f["path"]: blob_sha(f["content"]) for f in files})
+    missing = await session.missing()
+    await sessions.update(session.id, uploads={f["path"]: f["content"] for f in files if f["path"] in missing})
+    print(f"{len(files)} files; register + upload {len(missing)} files: {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    sessions._sessions.clear()
+    await sessions.get(session.id)
+    print(f"rebuild on another worker from the fragment cache: {time.perf_counter() - start:.2f} s")
+
+    rng = random.Random(3)
+    session_ms, full_ms = [], []
+    for k in range(args.saves):
+        file_data = rng.choice(files)
+        code = edited(file_data, k)
+
+        start = time.perf_counter()
+        session = await sessions.update(session.id, uploads={file_data["path"]: code})
+        session.graph.get_context_chunks(code, path=file_data["path"])
+        session_ms.append((time.perf_counter() - start) * 1000)
+
+        if k < args.full_saves:
+            start = time.perf_counter()
+            graph = GraphManager()
+            await graph.build_from_contents_async(
+                [f if f is not file_data else {"path": f["path"], "content": code} for f in files])
+            graph.get_context_chunks(code, path=file_data["path"])
+            full_ms.append((time.perf_counter() - start) * 1000)
+
+    print(f"\n{'per save':<28}{'p50 ms':>10}{'max ms':>10}")
+    print(f"{'session delta':<28}{statistics.median(session_ms):>10.1f}{max(session_ms):>10.1f}")
+    if full_ms:
+        print(f"{'whole-workspace upload':<28}{statistics.median(full_ms):>10.1f}{max(full_ms):>10.1f}")
+    shutdown_parse_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=4000)
+    parser.add_argument("--per-file", type=int, default=8, help="functions per file")
+    parser.add_argument("--fan-out", type=int, default=3)
+    parser.add_argument("--saves", type=int, default=20)
+    parser.add_argument("--full-saves", type=int, default=3, help="saves also timed with a full rebuild")
+    asyncio.run(run(parser.parse_args()))
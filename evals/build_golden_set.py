@@ -0,0 +1,240 @@
+"""Mines bug-fix commits from git repositories into a sharded JSONL golden set.
+
+Commits are listed once per repository with `git log` and filtered by message,
+then split into chunks that a process pool turns into samples (code before the
+fix, the fix, the diff). Each chunk streams into its own shard under --out and
+is recorded in checkpoint.json when it completes, so an interrupted run picks
+up with the chunks that are still missing.
+
+Repositories are local clones (bare or not). URLs are mirrored into
+--clone-dir first; mining a mirror avoids the network and a working tree.
+
+    python -m evals.build_golden_set --repo ~/clones/fastapi.git --out evals/golden_set
+    python -m evals.build_golden_set --repo https://github.com/tiangolo/fastapi --merge evals/golden_set.jsonl
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import signal
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+CHECKPOINT = "checkpoint.json"
+
+_repos = {}  # path -> pydriller.Git, one per repository per worker process
+_open_lock = None
+
+
+def _init_worker(lock):
+    global _open_lock
+    _open_lock = lock
+    # Ctrl-C is handled by the parent, which lets running chunks finish and stops there.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def git(repo: str, *args: str) -> str:
+    return subprocess.run(["git", "-C", repo, *args], check=True, capture_output=True, text=True).stdout
+
+
+def local_clone(repo: str, clone_dir: str, fetch: bool) -> str:
+    """`repo` itself if it is a local path, otherwise the path of its mirror in `clone_dir`."""
+    if "://" not in repo and not repo.startswith("git@"):
+        return os.path.abspath(os.path.expanduser(repo))
+    name = re.sub(r"[^\w.-]+", "_", repo.split("://", 1)[-1].rstrip("/"))
+    path = os.path.abspath(os.path.join(clone_dir, name if name.endswith(".git") else name + ".git"))
+    if not os.path.isdir(path):
+        print(f"cloning {repo} -> {path}")
+        os.makedirs(clone_dir, exist_ok=True)
+        subprocess.run(["git", "clone", "--mirror", "--quiet", repo, path], check=True)
+    elif fetch:
+        git(path, "remote", "update", "--prune")
+    return path
+
+
+def candidate_commits(repo: str, rev: str, args) -> list:
+    """Non-merge commits of `rev` that touch a mined file type and whose message matches."""
+    log = ["log", "--no-merges", "--format=%H%x1f%B%x1e"]
+    if args.since:
+        log.append(f"--since={args.since}")
+    if args.until:
+        log.append(f"--until={args.until}")
+    log += [rev, "--"] + [f"*{ext}" for ext in args.ext]
+    include = re.compile(args.message, re.IGNORECASE)
+    exclude = re.compile(args.exclude_message, re.IGNORECASE) if args.exclude_message else None
+    commits = []
+    for record in git(repo, *log).split("\x1e"):
+        sha, _, msg = record.strip().partition("\x1f")
+        if sha and include.search(msg) and not (exclude and exclude.search(msg)):
+            commits.append(sha)
+    return commits
+
+
+def mine_chunk(repo: str, shas: list, filters: dict, shard: str) -> tuple:
+    """Writes the samples of one chunk of commits to `shard`. Returns (samples, commits)."""
+    from pydriller import Git
+    from pydriller.domain.commit import ModificationType
+
+    if repo not in _repos:
+        # Opening a pydriller.Git rewrites the repository's config; workers must take turns.
+        with _open_lock:
+            _repos[repo] = Git(repo)
+    repository = _repos[repo]
+    exts = tuple(filters["ext"])
+    samples = 0
+    with open(shard + ".tmp", "w") as out:
+        for sha in shas:
+            commit = repository.get_commit(sha)
+            files = commit.modified_files
+            if not filters["min_files"] <= len(files) <= filters["max_files"]:
+                continue
+            changed = sum(m.added_lines + m.deleted_lines for m in files)
+            if changed < filters["min_diff_lines"] or (filters["max_diff_lines"] and changed > filters["max_diff_lines"]):
+                continue
+            for m in files:
+                # A fix needs code to fix and code after it: skip added, deleted and binary files.
+                if m.change_type not in (ModificationType.MODIFY, ModificationType.RENAME) or not m.filename.endswith(exts):
+                    continue
+                if m.source_code_before is None or m.source_code is None:
+                    continue
+                out.write(json.dumps({
+                    "commit_hash": commit.hash,
+                    "issue_description": commit.msg,
+                    "code_before": m.source_code_before,  # The "Test Input"
+                    "fix_code": m.source_code,            # The "Ground Truth"
+                    "diff": m.diff,
+                    "repo": os.path.basename(repo),
+                    "path": m.new_path,
+                }) + "\n")
+                samples += 1
+            out.flush()
+    os.replace(shard + ".tmp", shard)
+    return samples, len(shas)
+
+
+class Checkpoint:
+    """Completed chunks of one mining run, keyed to the configuration that produced them."""
+
+    def __init__(self, out_dir: str, config: dict, restart: bool = False):
+        self.path = os.path.join(out_dir, CHECKPOINT)
+        self.config = config
+        self.done = {}  # shard name -> samples
+        if os.path.exists(self.path) and not restart:
+            with open(self.path) as fh:
+                state = json.load(fh)
+            if state["config"] != config:
+                raise SystemExit(f"{self.path} was written with other repositories or filters; "
+                                 f"use another --out or pass --restart")
+            self.done = state["done"]
+
+    def record(self, shard: str, samples: int):
+        self.done[shard] = samples
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fh:
+            json.dump({"config": self.config, "done": self.done}, fh)
+        os.replace(tmp, self.path)
+
+    @property
+    def samples(self) -> int:
+        return sum(self.done.values())
+
+
+def plan(args) -> tuple:
+    """(config, chunks): the run's identity for the checkpoint and its (repo, shas, shard) chunks."""
+    filters = {k: getattr(args, k) for k in ("ext", "min_files", "max_files", "min_diff_lines", "max_diff_lines")}
+    config = {"filters": filters, "message": args.message, "exclude_message": args.exclude_message,
+              "since": args.since, "until": args.until, "chunk_size": args.chunk_size, "repos": {}}
+    chunks = []
+    for repo in args.repo:
+        path = local_clone(repo, args.clone_dir, args.fetch)
+        head = git(path, "rev-parse", args.rev).strip()
+        shas = candidate_commits(path, head, args)
+        key = hashlib.sha1(path.encode()).hexdigest()[:8]
+        config["repos"][path] = head
+        print(f"{path} @ {head[:10]}: {len(shas)} candidate commits")
+        for k in range(0, len(shas), args.chunk_size):
+            chunks.append((path, shas[k:k + args.chunk_size], f"{key}-{k // args.chunk_size:05d}.jsonl"))
+    return config, chunks
+
+
+def merge(out_dir: str, checkpoint: Checkpoint, target: str, limit: int):
+    written = 0
+    with open(target, "w") as out:
+        for shard in sorted(checkpoint.done):
+            with open(os.path.join(out_dir, shard)) as fh:
+                for line in fh:
+                    if limit and written >= limit:
+                        break
+                    out.write(line)
+                    written += 1
+    print(f"merged {written} samples into {target}")
+
+
+def run(args):
+    os.makedirs(args.out, exist_ok=True)
+    config, chunks = plan(args)
+    checkpoint = Checkpoint(args.out, config, restart=args.restart)
+    pending = [c for c in chunks if c[2] not in checkpoint.done]
+    print(f"{len(chunks)} chunks, {len(chunks) - len(pending)} already done ({checkpoint.samples} samples)")
+
+    if pending and not (args.max_samples and checkpoint.samples >= args.max_samples):
+        start, commits = time.perf_counter(), 0
+        # spawn: same as the service's pools; GitPython keeps subprocesses around that must not be forked.
+        context = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(max_workers=args.workers, mp_context=context,
+                                       initializer=_init_worker, initargs=(context.Lock(),))
+        try:
+            futures = {executor.submit(mine_chunk, repo, shas, config["filters"], os.path.join(args.out, shard)): shard
+                       for repo, shas, shard in pending}
+            for future in as_completed(futures):
+                samples, examined = future.result()
+                checkpoint.record(futures[future], samples)
+                commits += examined
+                elapsed = time.perf_counter() - start
+                print(f"[{len(checkpoint.done)}/{len(chunks)}] {futures[future]}: {samples} samples "
+                      f"(total {checkpoint.samples}, {commits / elapsed:.0f} commits/s)")
+                if args.max_samples and checkpoint.samples >= args.max_samples:
+                    print(f"reached --max-samples {args.max_samples}")
+                    break
+        except KeyboardInterrupt:
+            print("interrupted; waiting for running chunks, rerun with the same arguments to resume")
+            raise SystemExit(130)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    if args.merge:
+        merge(args.out, checkpoint, args.merge, args.max_samples)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repo", action="append", required=True, help="local clone or URL; repeatable")
+    parser.add_argument("--rev", default="HEAD", help="revision whose history is mined")
+    parser.add_argument("--since", help="only commits after this date (git log --since)")
+    parser.add_argument("--until", help="only commits before this date (git log --until)")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden_set"),
+                        help="directory for shards and the checkpoint")
+    parser.add_argument("--merge", help="also concatenate all shards into this JSONL file")
+    parser.add_argument("--clone-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".clones"))
+    parser.add_argument("--fetch", action="store_true", help="update existing mirrors before mining")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=200, help="commits per shard")
+    parser.add_argument("--max-samples", type=int, default=0, help="stop once this many samples exist (0: no limit)")
+    parser.add_argument("--message", default=r"fix", help="regex a commit message must match (case-insensitive)")
+    parser.add_argument("--exclude-message", default="", help="regex that rejects a commit message")
+    parser.add_argument("--ext", action="append", help="file extension to mine; repeatable (default .py)")
+    parser.add_argument("--min-files", type=int, default=1, help="fewest files a commit may modify")
+    parser.add_argument("--max-files", type=int, default=1, help="most files a commit may modify")
+    parser.add_argument("--min-diff-lines", type=int, default=1, help="fewest added + deleted lines")
+    parser.add_argument("--max-diff-lines", type=int, default=0, help="most added + deleted lines (0: no limit)")
+    args = parser.parse_args()
+    args.ext = sorted(set(args.ext or [".py"]))
+    run(args)
+
+
+if __name__ == "__main__":
+    main_cli()
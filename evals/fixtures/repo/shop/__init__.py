@@ -0,0 +1,4 @@
+from .cart import Cart
+from .pricing import apply_discount, total_price
+
+__all__ = ["Cart", "apply_discount", "total_price"]
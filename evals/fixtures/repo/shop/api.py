@@ -0,0 +1,20 @@
+from .cart import Cart
+
+SESSIONS = {}
+
+
+def open_cart(customer):
+    cart = SESSIONS.setdefault(customer, Cart(customer))
+    return cart
+
+
+def add_to_cart(customer, sku, qty):
+    cart = open_cart(customer)
+    cart.add(sku, qty)
+    return cart.total()
+
+
+def checkout(customer, code=None):
+    cart = open_cart(customer)
+    discount = 10 if code == "WELCOME10" else 0
+    return cart.checkout(discount)
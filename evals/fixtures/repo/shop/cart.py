@@ -0,0 +1,26 @@
+from .inventory import in_stock, reserve
+from .pricing import total_price
+
+
+class Cart:
+    def __init__(self, customer):
+        self.customer = customer
+        self.items = {}
+
+    def add(self, sku, qty=1):
+        if not in_stock(sku, qty):
+            raise ValueError(f"{sku} is out of stock")
+        self.items[sku] = self.items.get(sku, 0) + qty
+
+    def remove(self, sku):
+        self.items.pop(sku, None)
+
+    def total(self, discount=0):
+        return total_price(self.items, discount)
+
+    def checkout(self, discount=0):
+        for sku, qty in self.items.items():
+            reserve(sku, qty)
+        amount = self.total(discount)
+        self.items = {}
+        return amount
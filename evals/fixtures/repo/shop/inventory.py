@@ -0,0 +1,16 @@
+PRICES = {"apple": 0.5, "pear": 0.75, "melon": 2.0}
+STOCK = {"apple": 100, "pear": 40, "melon": 8}
+
+
+def unit_price(sku):
+    return PRICES[sku]
+
+
+def in_stock(sku, qty):
+    return STOCK.get(sku, 0) >= qty
+
+
+def reserve(sku, qty):
+    if not in_stock(sku, qty):
+        raise ValueError(f"Not enough {sku}")
+    STOCK[sku] -= qty
@@ -0,0 +1,17 @@
+from .inventory import unit_price
+
+TAX_RATE = 0.2
+
+
+def apply_discount(amount, percent):
+    if percent <= 0:
+        return amount
+    return amount * (1 - percent / 100)
+
+
+def total_price(items, discount=0):
+    subtotal = 0
+    for sku, qty in items.items():
+        subtotal += unit_price(sku) * qty
+    subtotal = apply_discount(subtotal, discount)
+    return round(subtotal * (1 + TAX_RATE), 2)
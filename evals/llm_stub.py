@@ -0,0 +1,157 @@
+"""Deterministic OpenAI-compatible chat completions server for offline runs.
+
+Answers /v1/chat/completions with a canned reviewer draft or auditor verdict
+derived from a hash of the prompt, after a configurable delay, and reports token
+usage like the real API. Point the pipeline at it with OPENAI_BASE_URL.
+
+    python -m evals.llm_stub --port 8765 --latency-ms 400 --ms-per-token 5
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+AUDITOR_MARKER = "### REVIEWER DRAFT:"
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _first_def_line(code: str) -> int:
+    for i, line in enumerate(code.split("\n"), start=1):
+        if re.match(r"\s*(async\s+)?def |\s*class ", line):
+            return i
+    return 1
+
+
+def _target_code(content: str) -> str:
+    match = re.search(r"### TARGET CODE:\n(.*?)\n\n### ", content, re.S)
+    return match.group(1) if match else content
+
+
+def canned_reply(messages: list, completion_tokens: int) -> str:
+    """Reviewer draft or auditor verdict, stable for identical prompts."""
+    prompt = "\n".join(m.get("content") or "" for m in messages)
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    line = _first_def_line(_target_code(prompt))
+    finding = {"type": "bug", "line": line, "issue": f"stub finding {digest[:8]}", "fix": "n/a"}
+    # Pad so the completion carries roughly the configured number of tokens.
+    padding = "x" * max(0, completion_tokens * 4 - 200)
+
+    if AUDITOR_MARKER in prompt:
+        return json.dumps({
+            "verdict": "approved",
+            "audit_findings": [{"finding_ref": 0, "judgment": "CONFIRMED", "reason": "stub"}],
+            "missed_bugs": [],
+            "final_findings": [finding],
+            "summary": f"Stub audit {digest[:8]}.",
+            "fixed_code": padding,
+        })
+    return json.dumps({
+        "thought_process": f"Stub review {digest[:8]}. {padding}",
+        "findings": [finding],
+        "summary": "Stub summary.",
+        "fixed_code": "",
+    })
+
+
+def cached_prefix_tokens(messages: list, seen: set, block: int = 512) -> int:
+    """Mimics provider prompt caching: the longest already-seen prompt prefix, in
+    ~128-token (512-char) blocks, counted once it reaches 1024 tokens."""
+    text = "".join(m.get("role", "") + "\x00" + (m.get("content") or "") + "\x00" for m in messages)
+    cached, prefix, hit = 0, hashlib.sha256(), True
+    for start in range(0, len(text) - block + 1, block):
+        prefix.update(text[start:start + block].encode("utf-8"))
+        key = prefix.hexdigest()
+        if hit and key in seen:
+            cached += block // 4
+        else:
+            hit = False
+            seen.add(key)
+    return cached if cached >= 1024 else 0
+
+
+def create_app(latency_ms: float = 0, ms_per_token: float = 0, completion_tokens: int = 150,
+               throttle_every: int = 0) -> FastAPI:
+    app = FastAPI()
+    app.state.stats = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "throttled": 0}
+    seen_prefixes = set()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        app.state.stats["requests"] += 1
+        if throttle_every and app.state.stats["requests"] % throttle_every == 0:
+            app.state.stats["throttled"] += 1
+            return JSONResponse({"error": {"message": "Rate limit reached (stub)", "type": "requests"}},
+                                status_code=429, headers={"retry-after": "0.2"})
+        content = canned_reply(messages, completion_tokens)
+        usage = {
+            "prompt_tokens": sum(estimate_tokens(m.get("content") or "") for m in messages),
+            "completion_tokens": estimate_tokens(content),
+            "prompt_tokens_details": {"cached_tokens": cached_prefix_tokens(messages, seen_prefixes)},
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        stats = app.state.stats
+        stats["prompt_tokens"] += usage["prompt_tokens"]
+        stats["completion_tokens"] += usage["completion_tokens"]
+        stats["cached_tokens"] += usage["prompt_tokens_details"]["cached_tokens"]
+
+        created = int(time.time())
+        model = body.get("model", "stub")
+        delay = (latency_ms + ms_per_token * usage["completion_tokens"]) / 1000
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return JSONResponse({
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        async def chunks():
+            pieces = [content[i:i + 64] for i in range(0, len(content), 64)]
+            await asyncio.sleep(latency_ms / 1000)
+            for piece in pieces:
+                await asyncio.sleep(ms_per_token * estimate_tokens(piece) / 1000)
+                chunk = {
+                    "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunk = {
+                    "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [], "usage": usage,
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.stats
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=400, help="time to first token")
+    parser.add_argument("--ms-per-token", type=float, default=5)
+    parser.add_argument("--completion-tokens", type=int, default=150)
+    parser.add_argument("--throttle-every", type=int, default=0, help="answer every Nth request with a 429")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.ms_per_token, args.completion_tokens, args.throttle_every),
+                host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,22 @@
+"""Gunicorn settings picked up from the working directory (see Dockerfile).
+
+Workers write metrics to prometheus_client's multiprocess directory so /metrics
+answers for the whole host, whichever worker serves the scrape.
+"""
+import os
+import glob
+
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/codereview-metrics")
+
+
+def on_starting(server):
+    # Values left by a previous run would otherwise be summed into this one.
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(path, exist_ok=True)
+    for name in glob.glob(os.path.join(path, "*.db")):
+        os.remove(name)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,20 +1,71 @@
 import os
+import json
+import asyncio
 import hmac
 import hashlib
 import logging
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks, Header
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
 
 from utils.github_client import GitHubClient
-from utils.graph_manager import GraphManager
-from reviewer import analyze_code
+from utils.graph_manager import GraphManager, shutdown_parse_pool
+from utils.graph_cache import GraphCache
+from utils.graph_snapshot import SnapshotStore
+from utils.pr_state import PRState, PRStateStore
+from utils.diff_parser import parse_diff
+from utils.workspace_sessions import WorkspaceSessions, SessionNotFound
+from utils.analyzer import StaticAnalyzer
+from utils.review_queue import ReviewQueue, QUEUED, RUNNING, DONE, FAILED, SUPERSEDED
+from utils.review_cache import SQLiteBackend
+from utils.tracing import stage
+from utils import metrics
+from utils.prompt_packer import count_tokens
+from utils.factory import client_pool
+from reviewer import analyze_code, analyze_code_stream, analyze_batch, review_cache, build_shards, carry_forward
+from schemas import ReviewResponse
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("api-suite")
 
-app = FastAPI()
+#Fix the prompts.py, llm as a judge pipeline and benchmarking pipeline
+github = GitHubClient()
+graph_cache = GraphCache()
+# (repo full name, base branch) -> (lock, GraphManager), least recently used first. A graph
+# is patched in place by each review, so the lock is held from its build to the end of analysis.
+repo_graphs = OrderedDict()
+GRAPH_MAX_REPOS = int(os.getenv("GRAPH_MAX_REPOS", "8"))
+graph_snapshots = SnapshotStore.from_env()  # None when GRAPH_SNAPSHOTS=0
+pr_states = PRStateStore.from_env()         # None when INCREMENTAL_REVIEW=0
+workspace_sessions = WorkspaceSessions.from_env(graph_cache)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    metrics.enable_otel()
+    # Loading tiktoken's tables may hit the network; do it once, off the event loop.
+    await asyncio.to_thread(count_tokens, "warm up")
+    await github.start()
+    await review_queue.start()
+    if metrics.MULTIPROCESS:
+        publisher = asyncio.create_task(metrics.collect_periodically(metrics.METRICS_PUBLISH_INTERVAL))
+    yield
+    if metrics.MULTIPROCESS:
+        publisher.cancel()
+    await review_queue.stop()
+    await github.close()
+    await client_pool.close()
+    StaticAnalyzer.shutdown()
+    shutdown_parse_pool()
+    if graph_snapshots is not None:
+        graph_snapshots.close()
+    metrics.shutdown_otel()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,17 +75,17 @@ app.add_middleware(
     allow_headers=["*"], 
 )
 
-#Fix the prompts.py, llm as a judge pipeline and benchmarking pipeline
-github = GitHubClient()
-
 WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
+QUEUE_STATUS_TOKEN = os.getenv("QUEUE_STATUS_TOKEN")
+BATCH_MAX_ITEMS = int(os.getenv("REVIEW_BATCH_MAX_ITEMS", "200"))
 
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
         "service": "code-reviewer-ai",
-        "version": "1.1.0"
+        "version": "1.1.0",
+        "review_cache": await review_cache.stats() if review_cache else None
     }
 
 async def verify_signature(request: Request, signature: str):
@@ -45,73 +96,376 @@ async def verify_signature(request: Request, signature: str):
     if not hmac.compare_digest(expected, signature.split('=')[-1]):
         raise HTTPException(status_code=401, detail="Invalid signature")
 
-async def process_review_task(repo_name: str, pr_number: int, diff_url: str, base_branch: str):
-    try:
-        local_graph = GraphManager()  
-        repo_files = await github.get_repo_contents(repo_name, base_branch)
-        local_graph.build_from_contents(repo_files)
-
-        diff_text = await github.get_diff(diff_url)
-        review_result = await analyze_code(diff_text, local_graph)
-
-        findings_md = ""
-        for f in review_result.findings:
-            findings_md += f"- **{f.category.upper()}** (Line {f.line_number}): {f.issue}\n"
-
-        comment_body = (
-            f"## 🤖 Graph-Augmented AI Review\n\n"
-            f"### 📋 Summary\n{review_result.summary}\n\n"
-            f"### 🔍 Key Findings\n{findings_md}\n\n"
-            f"### 🧠 Thought Process\n> {review_result.thought_process}\n\n"
-            f"### ✅ Suggested Improvement\n```python\n{review_result.fixed_code}\n```"
-        )
+async def build_graph(local_graph: GraphManager, repo_name: str, ref: str) -> GraphManager:
+    """Brings `local_graph` up to date with the repository at `ref` and freezes its index."""
+    if github.use_archive(repo_name):
+        # Download and parse overlap here, so the whole stream counts as graph build.
+        with stage("graph_build"):
+            await local_graph.build_from_stream(github.iter_repo_archive(repo_name, ref))
+            await asyncio.to_thread(lambda: local_graph.index)
+    else:
+        with stage("fetch"):
+            repo_files = await github.get_repo_contents(repo_name, ref, known=local_graph.known_blobs)
+        with stage("graph_build"):
+            await local_graph.build_from_contents_async(repo_files)
+            # Freeze the CSR arrays here, off the loop, rather than in the first shard's lookup.
+            await asyncio.to_thread(lambda: local_graph.index)
+    return local_graph
 
-        await github.post_comment(repo_name, pr_number, comment_body)
-    except Exception as e:
-        logger.error(f"Pipeline Error: {e}")
+@asynccontextmanager
+async def repo_graph(repo_name: str, base_branch: str, base_sha: str = None):
+    """Yields the graph of the PR's base, which stays unchanged until the block exits."""
+    if graph_snapshots is not None and base_sha:
+        # Built once per base commit by whichever worker gets there first, then
+        # mapped read-only by all of them. The fragment cache keeps rebuilds cheap.
+        yield await graph_snapshots.get(
+            repo_name, base_sha, lambda: build_graph(GraphManager(cache=graph_cache), repo_name, base_sha))
+        return
+    key = (repo_name, base_branch)
+    if key not in repo_graphs:
+        repo_graphs[key] = (asyncio.Lock(), GraphManager(cache=graph_cache))
+    repo_graphs.move_to_end(key)
+    lock, local_graph = repo_graphs[key]
+    async with lock:
+        _evict_graphs()
+        yield await build_graph(local_graph, repo_name, base_branch)
+
+def _evict_graphs():
+    """Drops the least recently used graphs over GRAPH_MAX_REPOS that no review is using."""
+    for key in list(repo_graphs):
+        if len(repo_graphs) <= GRAPH_MAX_REPOS:
+            break
+        if not repo_graphs[key][0].locked():
+            del repo_graphs[key]
+
+async def process_review_task(repo_name: str, pr_number: int, diff_url: str, base_branch: str,
+                              base_sha: str = None, head_sha: str = None):
+    """Reviews one PR; run by the review queue, which records failures.
+
+    When the bot already reviewed an earlier head of this PR, only the commits
+    since then are reviewed, findings on untouched lines are carried over, and
+    the existing comment is edited instead of a new one being posted.
+    """
+    state = None
+    if pr_states is not None and head_sha:
+        state = await asyncio.to_thread(pr_states.get, repo_name, pr_number)
+        if state is not None and state.head_sha == head_sha:
+            logger.info(f"{repo_name}#{pr_number} already reviewed at {head_sha[:7]}")
+            metrics.REVIEW_SCOPES.labels(scope="unchanged").inc()
+            return
+
+    delta = None
+    if state is not None:
+        with stage("fetch"):
+            delta = await github.compare(repo_name, state.head_sha, head_sha)
+
+    note = None
+    if delta is not None:
+        previous = ReviewResponse.model_validate(state.review)
+        carried = carry_forward(previous.findings, parse_diff(delta))
+        if build_shards(delta):
+            async with repo_graph(repo_name, base_branch, base_sha) as local_graph:
+                update = await analyze_code(delta, local_graph)
+            review_result = update.model_copy(update={"findings": update.findings + carried})
+        else:
+            update = None
+            review_result = previous.model_copy(update={"findings": carried})
+        new_findings = len(update.findings) if update else 0
+        note = (f"Updated for {state.head_sha[:7]}..{head_sha[:7]}: {new_findings} new finding(s), "
+                f"{len(carried)} carried over from the previous review.")
+        metrics.REVIEW_SCOPES.labels(scope="incremental").inc()
+    else:
+        with stage("fetch"):
+            diff_text = await github.get_diff(diff_url)
+        async with repo_graph(repo_name, base_branch, base_sha) as local_graph:
+            review_result = await analyze_code(diff_text, local_graph)
+        metrics.REVIEW_SCOPES.labels(scope="full").inc()
+
+    comment_body = render_comment(review_result, note)
+    comment_id = state.comment_id if state is not None else None
+    with stage("comment_post"):
+        if comment_id is None or not await github.update_comment(repo_name, comment_id, comment_body):
+            comment_id = await github.post_comment(repo_name, pr_number, comment_body)
+
+    if pr_states is not None and head_sha:
+        new_state = PRState(head_sha=head_sha, comment_id=comment_id, review=review_result.model_dump(mode="json"))
+        await asyncio.to_thread(pr_states.put, repo_name, pr_number, new_state)
+
+def render_comment(review_result: ReviewResponse, note: str = None) -> str:
+    findings_md = ""
+    for f in review_result.findings:
+        location = f"`{f.file_path}` line {f.line_number}" if f.file_path else f"Line {f.line_number}"
+        findings_md += f"- **{f.category.upper()}** ({location}): {f.issue}\n"
+
+    return (
+        f"## 🤖 Graph-Augmented AI Review\n\n"
+        + (f"_{note}_\n\n" if note else "")
+        + f"### 📋 Summary\n{review_result.summary}\n\n"
+        f"### 🔍 Key Findings\n{findings_md}\n\n"
+        f"### 🧠 Thought Process\n> {review_result.thought_process}\n\n"
+        f"### ✅ Suggested Improvement\n```python\n{review_result.fixed_code}\n```"
+    )
+
+review_queue = ReviewQueue.from_env(process_review_task)
+
+# Gauges sum over live workers, except host-wide values from a shared SQLite backend,
+# which every worker reports alike.
+_SHARED_CACHE = review_cache is not None and isinstance(review_cache.backend, SQLiteBackend)
+CACHE_ENTRIES = metrics.Gauge("codereview_review_cache_entries", "Reviews held in the review cache.",
+                              multiprocess_mode="livemax" if _SHARED_CACHE else "livesum")
+CACHE_LOOKUPS = metrics.Gauge(
+    "codereview_review_cache_lookups", "Review cache lookups since start, by result.", ("result",),
+    multiprocess_mode="livesum")
+QUEUE_JOBS = metrics.Gauge("codereview_queue_jobs", "Review jobs known to the queue, by state.", ("state",),
+                           multiprocess_mode="livemax" if review_queue.backend.blocking else "livesum")
+QUEUE_WORKERS = metrics.Gauge("codereview_queue_workers", "Review queue worker tasks.", multiprocess_mode="livesum")
+GRAPH_REPOS = metrics.Gauge("codereview_graph_repos", "Repository graphs held in memory.", multiprocess_mode="livesum")
+GRAPH_FILES = metrics.Gauge("codereview_graph_files", "Files indexed across in-memory repository graphs.",
+                            multiprocess_mode="livesum")
+WORKSPACE_SESSIONS = metrics.Gauge("codereview_workspace_sessions",
+                                   "Editor workspace sessions with a live graph in a worker.", multiprocess_mode="livesum")
+GRAPH_SNAPSHOTS = metrics.Gauge("codereview_graph_snapshots_open", "Graph snapshots mapped by the workers.",
+                                multiprocess_mode="livesum")
+GRAPH_SNAPSHOT_BYTES = metrics.Gauge("codereview_graph_snapshot_mapped_bytes",
+                                     "Size of the graph snapshots mapped by the workers.", multiprocess_mode="livesum")
+
+async def collect_gauges():
+    if review_cache is not None:
+        stats = await review_cache.stats()
+        CACHE_ENTRIES.set(stats["entries"])
+        CACHE_LOOKUPS.labels(result="hit").set(stats["hits"])
+        CACHE_LOOKUPS.labels(result="miss").set(stats["misses"])
+    # Every state is set, not just the current ones: multiprocess gauges can't be cleared.
+    counts = (await review_queue.status())["states"]
+    for state in (QUEUED, RUNNING, DONE, FAILED, SUPERSEDED):
+        QUEUE_JOBS.labels(state=state).set(counts.get(state, 0))
+    QUEUE_WORKERS.set(review_queue.concurrency)
+    GRAPH_REPOS.set(len(repo_graphs))
+    GRAPH_FILES.set(sum(len(g.files) for _, g in list(repo_graphs.values())))
+    WORKSPACE_SESSIONS.set(workspace_sessions.stats()["sessions"])
+    if graph_snapshots is not None:
+        stats = graph_snapshots.stats()
+        GRAPH_SNAPSHOTS.set(stats["open"])
+        GRAPH_SNAPSHOT_BYTES.set(stats["mapped_bytes"])
+
+metrics.add_collector(collect_gauges)
 
 @app.post("/webhook")
-async def github_webhook(request: Request, background_tasks: BackgroundTasks, x_hub_signature_256: str = Header(None)):
+async def github_webhook(request: Request, x_hub_signature_256: str = Header(None)):
     await verify_signature(request, x_hub_signature_256)
     payload = await request.json()
     event_type = request.headers.get("X-GitHub-Event")
     action = payload.get("action")
 
     if event_type == "pull_request" and action in ["opened", "synchronize", "reopened"]:
-        background_tasks.add_task(
-            process_review_task,
-            payload["repository"]["full_name"],
-            payload["pull_request"]["number"],
-            payload["pull_request"]["diff_url"],
-            payload["pull_request"]["base"]["ref"]
-        )
-        return {"status": "accepted"}
+        repo_name = payload["repository"]["full_name"]
+        pr_number = payload["pull_request"]["number"]
+        job = await review_queue.enqueue(repo_name, pr_number, {
+            "repo_name": repo_name,
+            "pr_number": pr_number,
+            "diff_url": payload["pull_request"]["diff_url"],
+            "base_branch": payload["pull_request"]["base"]["ref"],
+            "base_sha": payload["pull_request"]["base"]["sha"],
+            "head_sha": payload["pull_request"]["head"]["sha"]
+        })
+        return {"status": "accepted", "job_id": job.id}
 
     return {"status": "ignored"}
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape target: stage timings, GitHub/LLM usage, cache and queue gauges.
+
+    Under gunicorn prometheus_client's multiprocess mode aggregates every worker,
+    so this answers for the whole host whichever worker serves the scrape.
+    """
+    await metrics.collect()
+    text = await asyncio.to_thread(metrics.render)
+    return Response(text, media_type=metrics.CONTENT_TYPE_LATEST)
+
+@app.get("/queue")
+async def queue_status(authorization: str = Header(None)):
+    """Queue depth and job counts per state. The recent jobs, with repo names and
+    errors, only for `Authorization: Bearer $QUEUE_STATUS_TOKEN`."""
+    token = (authorization or "").removeprefix("Bearer ").strip()
+    detailed = bool(QUEUE_STATUS_TOKEN and token and hmac.compare_digest(token, QUEUE_STATUS_TOKEN))
+    return await review_queue.status(jobs=detailed)
+
+def _require_user_key(data: dict) -> str:
+    user_key = data.get("apiKey")
+    if not user_key or user_key.strip() == "":
+        raise HTTPException(
+            status_code=400,
+            detail="API Key is missing. Please enter your key in Coderift settings."
+        )
+    return user_key
+
+async def _workspace_call(call):
+    try:
+        return await call
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Unknown or expired workspace session")
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@app.post("/workspace/sessions")
+async def create_workspace_session(request: Request):
+    """
+    Registers an editor workspace from {"manifest": {path: git blob sha}}.
+    Replies with the session id and the paths the server has no parse for yet;
+    the extension uploads only those to /workspace/sessions/{id}/files.
+    Like /analyze-local, every workspace call carries the user's apiKey.
+    """
+    data = await request.json()
+    _require_user_key(data)
+    if not isinstance(data.get("manifest"), dict):
+        raise HTTPException(status_code=400, detail="manifest must map paths to blob SHAs")
+    session = await _workspace_call(workspace_sessions.create(data["manifest"]))
+    return {"sessionId": session.id, "missing": await session.missing()}
+
+@app.patch("/workspace/sessions/{session_id}")
+async def update_workspace_session(session_id: str, request: Request):
+    """Manifest changes after saves, creates and deletes: {"changes": {path: sha or null}}."""
+    data = await request.json()
+    _require_user_key(data)
+    session = await _workspace_call(workspace_sessions.update(session_id, changes=data.get("changes") or {}))
+    return {"sessionId": session.id, "missing": await session.missing()}
+
+@app.post("/workspace/sessions/{session_id}/files")
+async def upload_workspace_files(session_id: str, request: Request):
+    """File contents the server asked for: {"files": {path: content}}, at most WORKSPACE_MAX_UPLOAD_BYTES."""
+    data = await request.json()
+    _require_user_key(data)
+    session = await _workspace_call(workspace_sessions.update(session_id, uploads=data.get("files") or {}))
+    return {"sessionId": session.id, "missing": await session.missing()}
+
+async def _local_graph(session_id: str, uploads: dict = None) -> tuple:
+    """(graph, release): the workspace session's graph with the reviewed buffers applied,
+    or an empty one. The session stays locked until `await release()`, so edits and
+    other reviews of it wait instead of changing the graph under this review."""
+    if not session_id:
+        return GraphManager(), _released
+    session = await _workspace_call(workspace_sessions.update(session_id, uploads=uploads, hold=True))
+    held = True
+
+    async def release():
+        nonlocal held
+        if held:
+            held = False
+            session.lock.release()
+    return session.graph, release
+
+async def _released():
+    pass
+
+def _buffer(data: dict) -> dict:
+    return {data["path"]: data["code"]} if data.get("path") and data.get("code") else {}
+
 @app.post("/analyze-local")
 async def analyze_local(request: Request):
     """
     Endpoint for VS Code Extension.
     Uses the API key provided by the USER to protect limits.
+    With a sessionId and the file's workspace-relative path, the review gets
+    dependency and impact context from that workspace's graph.
     """
     data = await request.json()
     user_code = data.get("code")
-    user_key = data.get("apiKey")
-    if not user_key or user_key.strip() == "":
-        raise HTTPException(
-            status_code=400,
-            detail="API Key is missing. Please enter your key in Coderift settings."
-        )
+    user_key = _require_user_key(data)
+    local_graph, release = await _local_graph(data.get("sessionId"), _buffer(data))
 
     try:
-        local_graph = GraphManager() 
-        review_result = await analyze_code(user_code, local_graph, api_key=user_key)
+        review_result = await analyze_code(user_code, local_graph, api_key=user_key, path=data.get("path"))
         return review_result.dict()
     except Exception as e:
         logger.error(f"Local Analysis Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await release()
+
+@app.post("/analyze-local/stream")
+async def analyze_local_stream(request: Request):
+    """
+    Streaming variant of /analyze-local.
+    Emits Server-Sent Events (or NDJSON when the client accepts application/x-ndjson):
+    static analysis, reviewer draft tokens, then the final audited review.
+    """
+    data = await request.json()
+    user_code = data.get("code")
+    user_key = _require_user_key(data)
+    ndjson = "application/x-ndjson" in request.headers.get("accept", "")
+    local_graph, release = await _local_graph(data.get("sessionId"), _buffer(data))
+
+    async def events():
+        try:
+            async for event in analyze_code_stream(user_code, local_graph, api_key=user_key, path=data.get("path")):
+                yield _format_event(event, ndjson)
+        except Exception as e:
+            logger.error(f"Local Analysis Error: {e}")
+            yield _format_event({"event": "error", "shard": None, "data": str(e)}, ndjson)
+        finally:
+            await release()
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson" if ndjson else "text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also releases the session when the stream never started.
+        background=BackgroundTask(release),
+    )
+
+@app.post("/analyze-batch")
+async def analyze_batch_endpoint(request: Request):
+    """
+    Reviews many files or snippets in one request:
+    {"apiKey", "items": [{"id", "code", "path"}], "sessionId"}.
+    Streams NDJSON, one {"event": "review" | "error", "id", "data"} line per item
+    in completion order, then {"event": "done"}. One item failing does not
+    affect the others.
+    """
+    data = await request.json()
+    user_key = _require_user_key(data)
+    items = data.get("items")
+    if not isinstance(items, list) or not all(isinstance(i, dict) and isinstance(i.get("code"), str) for i in items):
+        raise HTTPException(status_code=400, detail="items must be a list of {code, path?, id?} objects")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
+    uploads = {}
+    for item in items:
+        uploads.update(_buffer(item))
+    local_graph, release = await _local_graph(data.get("sessionId"), uploads)
+
+    async def events():
+        errors = 0
+        try:
+            async for index, result in analyze_batch(items, local_graph, api_key=user_key):
+                item_id = items[index].get("id", index)
+                if isinstance(result, Exception):
+                    errors += 1
+                    event = {"event": "error", "id": item_id, "data": str(result)}
+                else:
+                    event = {"event": "review", "id": item_id, "data": result.model_dump(mode="json")}
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            logger.error(f"Batch Analysis Error: {e}")
+            yield json.dumps({"event": "error", "id": None, "data": str(e)}) + "\n"
+            return
+        finally:
+            await release()
+        yield json.dumps({"event": "done", "id": None, "data": {"items": len(items), "errors": errors}}) + "\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release),
+    )
+
+def _format_event(event: dict, ndjson: bool) -> str:
+    if ndjson:
+        return json.dumps(event) + "\n"
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
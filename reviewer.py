@@ -1,88 +1,385 @@
 import json
 import os
-from openai import AsyncOpenAI  
+import asyncio
+import hashlib
+import logging
 from utils.analyzer import StaticAnalyzer
-from schemas import ReviewResponse, AuditResponse
+from utils.review_cache import ReviewCache
+from utils.diff_parser import Shard, parse_diff, shard_diff
+from utils.tracing import stage
+from utils.metrics import PROMPT_CONTEXT_TOKENS, AUDIT_DECISIONS
+from utils.prompt_packer import pack_context, count_tokens
+from utils.review_policy import ReviewPolicy, SKIP, LIGHT
+from utils.factory import LLMBackend
+from schemas import ReviewResponse, ReviewFinding, AuditResponse
 from prompts import SYSTEM_PROMPT, AUDITOR_PROMPT
 
-async def analyze_code(diff_text: str, graph: object, api_key: str = None) -> ReviewResponse:
-    print("🚀 BACKGROUND TASK: analyze_code started", flush=True)
-    
-    if api_key is not None:
-        current_key = api_key
-    else:
-        current_key = os.getenv("OPENAI_API_KEY")
+reviewer_llm = LLMBackend.from_env("reviewer", "gpt-4o")
+auditor_llm = LLMBackend.from_env("auditor", reviewer_llm.model)
+light_auditor_llm = LLMBackend.from_env("auditor_light", os.getenv("AUDITOR_LIGHT_MODEL", "gpt-4o-mini"))
+MODEL = reviewer_llm.model
+# Any prompt edit changes this hash and therefore invalidates cached reviews.
+PROMPT_VERSION = hashlib.sha256((SYSTEM_PROMPT + AUDITOR_PROMPT).encode("utf-8")).hexdigest()[:16]
+review_cache = ReviewCache.from_env()
+review_policy = ReviewPolicy.from_env(auditor_llm.model, light_auditor_llm.model)
+MAX_PARALLEL_SHARDS = int(os.getenv("REVIEW_MAX_PARALLEL", "4"))
+BATCH_MAX_PARALLEL = int(os.getenv("REVIEW_BATCH_MAX_PARALLEL", "8"))
+SHARD_MAX_LINES = int(os.getenv("REVIEW_SHARD_MAX_LINES", "300"))
+# Providers only cache prompt prefixes of at least this many tokens.
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
 
-    if not current_key or current_key.strip() == "":
-        raise ValueError("No valid OpenAI API key provided.")
+logger = logging.getLogger("reviewer")
 
-    client = AsyncOpenAI(api_key=current_key)
+SKIPPED_REVIEW = ReviewResponse(
+    thought_process="Analysis skipped: No valid code content detected.",
+    findings=[],
+    summary="No new code detected for analysis.",
+    fixed_code=""
+)
 
+def resolve_api_key(api_key: str = None) -> str:
+    """The caller's key, else OPENAI_API_KEY. Only required while some stage calls
+    api.openai.com without a key of its own; None when every stage has one."""
+    current_key = api_key if api_key is not None else os.getenv("OPENAI_API_KEY")
+    if not current_key or current_key.strip() == "":
+        if any(llm.needs_caller_key for llm in (reviewer_llm, auditor_llm, light_auditor_llm)):
+            raise ValueError("No valid OpenAI API key provided.")
+        return None
+    return current_key
+
+def build_shards(diff_text: str, path: str = None) -> list:
+    """Splits a PR diff into per-file/hunk shards; plain code becomes a single shard for `path`."""
     is_diff = diff_text.startswith("diff --git") or "@@" in diff_text
 
     if is_diff:
-        lines = diff_text.split('\n')
-        clean_lines = []
-        for line in lines:
-            stripped_line = line.strip()
-            if stripped_line.startswith('+') and not stripped_line.startswith('+++'):
-                clean_lines.append(line[1:])  # Fix: was line[line.find('+')+1:], which breaks when '+' not at index 0
-        clean_code = "\n".join(clean_lines).strip()
+        shards = shard_diff(parse_diff(diff_text), max_lines=SHARD_MAX_LINES)
     else:
-        clean_code = diff_text.strip()
-
-    if not clean_code:
-        return ReviewResponse(
-            thought_process="Analysis skipped: No valid code content detected.",
-            findings=[],
-            summary="No new code detected for analysis.",
-            fixed_code=""
-        )
+        lines = diff_text.split("\n")
+        shards = [Shard(path=path, lines=lines, line_numbers=list(range(1, len(lines) + 1)))]
+    return [s for s in shards if s.code.strip()]
 
-    # --- CONTEXT & ANALYSIS ---
-    dependency_context = graph.get_context(clean_code, hops=2)
-    impact_context = graph.get_impact_analysis(clean_code, hops=1)
-    static_data = StaticAnalyzer.run_analysis(clean_code)
-    
-    # Agent 1: Reviewer
-    payload = (
-        f"### TARGET CODE:\n{clean_code}\n\n"
-        f"### STATIC ANALYSIS:\n{static_data if static_data else 'No static analysis issues found.'}\n\n"
-        f"### REPOSITORY CONTEXT:\nDependencies: {dependency_context}\nImpact: {impact_context}"
-    )
+async def analyze_code(diff_text: str, graph: object, api_key: str = None, path: str = None,
+                       static_results: dict = None, semaphore: asyncio.Semaphore = None) -> ReviewResponse:
+    """Reviews every shard of a diff or snippet and merges the results.
+
+    `static_results` maps shard code to precomputed static analysis, and
+    `semaphore` lets a caller share one concurrency limit across many calls.
+    """
+    print("🚀 BACKGROUND TASK: analyze_code started", flush=True)
     
-    resp1 = await client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT}, 
-            {"role": "user", "content": payload}
-        ],
-        response_format={"type": "json_object"}
+    current_key = resolve_api_key(api_key)
+
+    shards = build_shards(diff_text, path)
+    if not shards:
+        return SKIPPED_REVIEW
+
+    semaphore = semaphore or asyncio.Semaphore(MAX_PARALLEL_SHARDS)
+    static_results = static_results or {}
+
+    async def run(shard):
+        async with semaphore:
+            return await review_snippet(shard.code, graph, current_key, path=shard.path,
+                                        static_data=static_results.get(shard.code))
+
+    results = await asyncio.gather(*[run(s) for s in shards], return_exceptions=True)
+
+    reviewed = []
+    for shard, result in zip(shards, results):
+        if isinstance(result, Exception):
+            logger.error(f"Shard review failed for {shard.path or 'snippet'}: {result}")
+            continue
+        reviewed.append((shard, result))
+    if not reviewed:
+        raise results[0]
+    return merge_reviews(reviewed)
+
+async def analyze_batch(items: list, graph: object, api_key: str = None, max_parallel: int = None):
+    """Reviews many files or snippets, yielding (input index, ReviewResponse or Exception)
+    as each one finishes.
+
+    Identical inputs are reviewed once, static analysis for every shard runs as
+    a single batch, and all shards share one concurrency limit, so a batch takes
+    about as long as its slowest item rather than the sum of all of them.
+    """
+    current_key = resolve_api_key(api_key)
+    unique = {}  # (path, code) -> indexes of the inputs that carry it
+    for index, item in enumerate(items):
+        unique.setdefault((item.get("path"), item["code"]), []).append(index)
+
+    codes = list(dict.fromkeys(s.code for path, code in unique for s in build_shards(code, path)))
+    with stage("static_analysis"):
+        static_results = dict(zip(codes, await StaticAnalyzer.run_batch_async(codes)))
+    semaphore = asyncio.Semaphore(max_parallel or BATCH_MAX_PARALLEL)
+
+    async def run(key):
+        path, code = key
+        try:
+            return key, await analyze_code(code, graph, current_key, path=path,
+                                           static_results=static_results, semaphore=semaphore)
+        except Exception as e:
+            logger.error(f"Batch review failed for {path or 'snippet'}: {e}")
+            return key, e
+
+    tasks = [asyncio.create_task(run(key)) for key in unique]
+    try:
+        for future in asyncio.as_completed(tasks):
+            key, result = await future
+            for index in unique[key]:
+                yield index, result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def merge_reviews(reviewed: list) -> ReviewResponse:
+    """Maps shard-relative finding lines back to file lines and folds shards into one review."""
+    findings = []
+    for shard, review in reviewed:
+        for f in review.findings:
+            findings.append(f.model_copy(update={
+                "line_number": shard.to_file_line(f.line_number),
+                "file_path": shard.path,
+            }))
+
+    if len(reviewed) == 1:
+        review = reviewed[0][1]
+        return review.model_copy(update={"findings": findings})
+
+    def label(shard):
+        return shard.path or "snippet"
+
+    return ReviewResponse(
+        thought_process="\n\n".join(f"[{label(sh)}] {r.thought_process}" for sh, r in reviewed),
+        findings=findings,
+        summary="\n".join(f"{label(sh)}: {r.summary}" for sh, r in reviewed),
+        fixed_code="\n\n".join(f"# --- {label(sh)} ---\n{r.fixed_code}" for sh, r in reviewed if r.fixed_code)
     )
+
+def carry_forward(findings: list, delta_files: list) -> list:
+    """Earlier findings moved to their lines after a push; ones on lines the push
+    changed, or in files it deleted, are dropped for the new review to re-judge."""
+    changed = {(f.old_path or f.path): f for f in delta_files}
+    kept = []
+    for finding in findings:
+        file_diff = changed.get(finding.file_path)
+        if file_diff is None:
+            kept.append(finding)
+            continue
+        line = file_diff.map_old_line(finding.line_number) if file_diff.path else None
+        if line is not None:
+            kept.append(finding.model_copy(update={"line_number": line, "file_path": file_diff.path}))
+    return kept
+
+async def analyze_code_stream(diff_text: str, graph: object, api_key: str = None, path: str = None):
+    """Streaming analyze_code: yields {"event", "shard", "data"} dicts as stages finish.
+
+    Events are "static", "token" (reviewer draft deltas), "draft", "error" and a
+    final "review" carrying the merged, audited ReviewResponse.
+    """
+    current_key = resolve_api_key(api_key)
+    shards = build_shards(diff_text, path)
+    if not shards:
+        yield {"event": "review", "shard": None, "data": SKIPPED_REVIEW.model_dump(mode="json")}
+        return
+
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_SHARDS)
+    events = asyncio.Queue()
+    results = [None] * len(shards)
+
+    async def run(index, shard):
+        try:
+            async with semaphore:
+                async for event, data in review_snippet_events(shard.code, graph, current_key, path=shard.path):
+                    if event == "review":
+                        results[index] = data
+                    else:
+                        await events.put({"event": event, "shard": shard.path, "data": data})
+        except Exception as e:
+            logger.error(f"Shard review failed for {shard.path or 'snippet'}: {e}")
+            await events.put({"event": "error", "shard": shard.path, "data": str(e)})
+        finally:
+            await events.put(None)
+
+    tasks = [asyncio.create_task(run(i, shard)) for i, shard in enumerate(shards)]
+    try:
+        pending = len(tasks)
+        while pending:
+            item = await events.get()
+            if item is None:
+                pending -= 1
+                continue
+            yield item
+    finally:
+        # Client went away mid-stream: stop paying for the remaining completions.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    reviewed = [(shard, r) for shard, r in zip(shards, results) if r is not None]
+    if reviewed:
+        yield {"event": "review", "shard": None, "data": merge_reviews(reviewed).model_dump(mode="json")}
+
+async def review_snippet(clean_code: str, graph: object, current_key: str, path: str = None,
+                         static_data: dict = None) -> ReviewResponse:
+    """Context, static analysis and the two-agent review for one piece of code."""
+    context = await _prepare(clean_code, graph, path, static_data)
+    if context["cached"] is not None:
+        return context["cached"]
+
+    with stage("reviewer"):
+        resp1 = await reviewer_llm.complete(
+            current_key,
+            messages=_reviewer_messages(clean_code, context),
+            response_format={"type": "json_object"}
+        )
     draft = json.loads(resp1.choices[0].message.content)
+    return await _audit(current_key, clean_code, context, draft)
 
-    # Agent 2: Auditor
-    final_payload = (
-        f"### TARGET CODE:\n{clean_code}\n\n"
-        f"### STATIC ANALYSIS:\n{static_data}\n\n"
-        f"### REPOSITORY CONTEXT:\nDependencies: {dependency_context}\nImpact: {impact_context}\n\n"
-        f"### REVIEWER DRAFT:\n{json.dumps(draft, indent=2)}"
+async def review_snippet_events(clean_code: str, graph: object, current_key: str, path: str = None):
+    """review_snippet as (event, data) pairs, streaming the reviewer's tokens."""
+    context = await _prepare(clean_code, graph, path)
+    yield "static", context["static_data"]
+    if context["cached"] is not None:
+        yield "review", context["cached"]
+        return
+
+    parts = []
+    with stage("reviewer"):
+        stream = reviewer_llm.stream(
+            current_key,
+            messages=_reviewer_messages(clean_code, context),
+            response_format={"type": "json_object"}
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield "token", delta
+    draft = json.loads("".join(parts))
+    yield "draft", draft
+    yield "review", await _audit(current_key, clean_code, context, draft)
+
+async def _prepare(clean_code: str, graph: object, path: str = None, static_data: dict = None) -> dict:
+    # --- CONTEXT & ANALYSIS ---
+    with stage("graph_context"):
+        chunks = graph.get_context_chunks(clean_code, hops=2, impact_hops=1, path=path)
+        fan_in = graph.get_fan_in(clean_code, path=path)
+    with stage("prompt_packing"):
+        packed = pack_context(chunks, clean_code)
+    if static_data is None:
+        with stage("static_analysis"):
+            static_data = await StaticAnalyzer.run_analysis_async(clean_code)
+
+    cache_key, cached = None, None
+    if review_cache is not None:
+        cache_key = ReviewCache.make_key(
+            code=clean_code,
+            context=packed.text,
+            static=static_data,
+            model=MODEL,
+            auditors=f"{auditor_llm.model}/{light_auditor_llm.model}",
+            prompts=PROMPT_VERSION,
+        )
+        hit = await review_cache.get(cache_key)
+        if hit is not None:
+            cached = ReviewResponse.model_validate(hit["review"])
+
+    if cached is None:
+        # Reviewer and auditor both carry the context, so every token counts twice.
+        PROMPT_CONTEXT_TOKENS.labels(result="sent").inc(2 * packed.tokens)
+        PROMPT_CONTEXT_TOKENS.labels(result="dropped").inc(2 * packed.saved)
+        if packed.saved:
+            logger.info(
+                f"Packed {packed.chunks_used}/{packed.chunks_total} context chunks for {path or 'snippet'}: "
+                f"{packed.tokens} tokens, {2 * packed.saved} saved across both calls"
+            )
+
+    context = {
+        "repository_context": packed.text,
+        "packing": packed,
+        "fan_in": fan_in,
+        "static_data": static_data,
+        "cache_key": cache_key,
+        "cached": cached,
+    }
+    context["context_first"] = (
+        cached is None and count_tokens(_shared_context(clean_code, context)) >= PROMPT_CACHE_MIN_TOKENS
     )
+    return context
 
-    resp2 = await client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": AUDITOR_PROMPT}, 
-            {"role": "user", "content": final_payload}
-        ],
-        response_format={"type": "json_object"}
+def _shared_context(clean_code: str, context: dict) -> str:
+    """Target code, static analysis and repository context, the same for both agents."""
+    static_data = context["static_data"]
+    return (
+        f"### TARGET CODE:\n{clean_code}\n\n"
+        f"### STATIC ANALYSIS:\n{static_data if static_data else 'No static analysis issues found.'}\n\n"
+        f"### REPOSITORY CONTEXT:\n{context['repository_context'] or 'No related definitions found.'}"
     )
 
-    audit_result = AuditResponse.model_validate_json(resp2.choices[0].message.content)
+def _agent_messages(prompt: str, clean_code: str, context: dict, task: str) -> list:
+    """Messages laid out for the provider's prompt cache.
+
+    When the shared context is long enough to be cached it goes first, as a system
+    message identical for the reviewer and the auditor, so the auditor reuses the
+    prefix cached for the reviewer; the agent's instructions follow with its task.
+    A shorter context could not be cached, so the agent's static instructions lead
+    instead and are reused across every call of that agent.
+    """
+    shared = _shared_context(clean_code, context)
+    if context["context_first"]:
+        return [
+            {"role": "system", "content": shared},
+            {"role": "user", "content": f"{prompt}\n\n{task}"}
+        ]
+    return [
+        {"role": "system", "content": f"{prompt}\n\n{shared}"},
+        {"role": "user", "content": task}
+    ]
+
+def _reviewer_messages(clean_code: str, context: dict) -> list:
+    # Agent 1: Reviewer
+    return _agent_messages(SYSTEM_PROMPT, clean_code, context, "Review the TARGET CODE above.")
+
+async def _audit(current_key: str, clean_code: str, context: dict, draft: dict) -> ReviewResponse:
+    # Agent 2: Auditor, on the model the review policy picks for this draft (or not at all)
+    decision = review_policy.decide(clean_code, draft, context["static_data"], context["fan_in"])
+    AUDIT_DECISIONS.labels(path=decision.path).inc()
 
+    if decision.path == SKIP:
+        review = _draft_review(draft, decision)
+    else:
+        final_payload = f"### REVIEWER DRAFT:\n{json.dumps(draft, separators=(',', ':'))}"
+
+        backend = light_auditor_llm if decision.path == LIGHT else auditor_llm
+        with stage("auditor"):
+            resp2 = await backend.complete(
+                current_key,
+                messages=_agent_messages(AUDITOR_PROMPT, clean_code, context, final_payload),
+                response_format={"type": "json_object"}
+            )
+
+        audit_result = AuditResponse.model_validate_json(resp2.choices[0].message.content)
+
+        review = ReviewResponse(
+            thought_process=f"[{decision}] [Verdict: {audit_result.verdict.value}] {draft.get('thought_process', '')}",
+            findings=audit_result.final_findings,
+            summary=audit_result.summary,
+            fixed_code=audit_result.fixed_code
+        )
+    if context["cache_key"] is not None:
+        await review_cache.set(context["cache_key"], review.model_dump(mode="json"), draft)
+    return review
+
+def _draft_review(draft: dict, decision) -> ReviewResponse:
+    """The reviewer's draft as the final review, for shards the policy lets skip the audit."""
+    findings = []
+    for f in draft.get("findings") or []:
+        try:
+            findings.append(ReviewFinding.model_validate(f))
+        except Exception as e:
+            logger.warning(f"Dropping malformed draft finding {f!r}: {e}")
     return ReviewResponse(
-        thought_process=f"[Verdict: {audit_result.verdict}] {draft.get('thought_process', '')}",
-        findings=audit_result.final_findings,
-        summary=audit_result.summary,
-        fixed_code=audit_result.fixed_code
-    )
\ No newline at end of file
+        thought_process=f"[{decision}] {draft.get('thought_process', '')}",
+        findings=findings,
+        summary=draft.get("summary") or "No issues found.",
+        fixed_code=draft.get("fixed_code") or ""
+    )
@@ -19,6 +19,7 @@ class ReviewFinding(BaseModel):
     line_number: int = Field(..., alias="line")
     issue: str = Field(..., description="Specific technical failure, no vague terms")
     suggestion: Optional[str] = Field(None, alias="fix")
+    file_path: Optional[str] = Field(None, alias="path", description="File the line belongs to; filled in by the server")
 
     model_config = ConfigDict(
         populate_by_name=True,
@@ -1,41 +1,126 @@
-import subprocess
-import tempfile
 import os
-import json
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger("static-analyzer")
+
+# Pylint reads the snippet through its --from-stdin path under this display name.
+SNIPPET_NAME = "snippet.py"
+PYLINT_ARGS = ["--errors-only", "--from-stdin", "--persistent=n", "--score=n", SNIPPET_NAME]
+
+_linter = None    # Configured PyLinter, reused for every call in this process
+_source = ""      # Code handed to pylint's stdin hook for the current call
+_executor = None
+ANALYZER_WORKERS = int(os.getenv("ANALYZER_WORKERS", "2"))
+
+
+def _read_source():
+    return _source
+
+
+def _get_linter():
+    global _linter
+    if _linter is None:
+        from pylint import __version__ as pylint_version
+        from pylint.lint import Run, pylinter
+        from pylint.reporters import CollectingReporter
+
+        # Private hook, present through the pylint range pinned in requirements.txt.
+        if not callable(getattr(pylinter, "_read_stdin", None)):
+            raise RuntimeError(f"pylint {pylint_version} has no pylinter._read_stdin to feed snippets through")
+        pylinter._read_stdin = _read_source
+        # One Run parses options and loads checkers; later calls only re-check.
+        _linter = Run(PYLINT_ARGS, reporter=CollectingReporter(), exit=False).linter
+    return _linter
+
+
+def _init_worker():
+    try:
+        _get_linter()
+    except Exception as e:
+        logger.error(f"Pylint warm-up failed: {e}")
+
 
 class StaticAnalyzer:
     @staticmethod
     def run_analysis(code_string: str) -> dict:
-        with tempfile.NamedTemporaryFile(suffix=".py", delete=False) as tmp:
-            tmp.write(code_string.encode('utf-8'))
-            tmp_path = tmp.name
+        return {
+            "pylint_issues": StaticAnalyzer._get_pylint_data(code_string),
+            "complexity": StaticAnalyzer._get_radon_data(code_string)
+        }
 
-        try:
-            return {
-                "pylint_issues": StaticAnalyzer._get_pylint_data(tmp_path),
-                "complexity": StaticAnalyzer._get_radon_data(tmp_path)
-            }
-        finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+    @staticmethod
+    async def run_analysis_async(code_string: str) -> dict:
+        """Runs run_analysis in the bounded worker pool so the event loop stays free."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), StaticAnalyzer.run_analysis, code_string)
 
     @staticmethod
-    def _get_pylint_data(file_path: str) -> list:
+    def run_batch(code_strings: list) -> list:
+        return [StaticAnalyzer.run_analysis(code) for code in code_strings]
+
+    @staticmethod
+    async def run_batch_async(code_strings: list) -> list:
+        """run_analysis for many snippets in one pass: one pool task per worker
+        instead of one per snippet. Results keep the input order."""
+        if not code_strings:
+            return []
+        loop = asyncio.get_running_loop()
+        executor = _get_executor()
+        size = -(-len(code_strings) // ANALYZER_WORKERS)
+        chunks = [code_strings[i:i + size] for i in range(0, len(code_strings), size)]
+        results = await asyncio.gather(*[loop.run_in_executor(executor, StaticAnalyzer.run_batch, c) for c in chunks])
+        return [r for chunk in results for r in chunk]
+
+    @staticmethod
+    def shutdown():
+        global _executor
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+    @staticmethod
+    def _get_pylint_data(code_string: str) -> list:
+        global _source
         try:
-            cmd = ["pylint", "--errors-only", "--output-format=json", file_path]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-            data = json.loads(result.stdout)
-            return [{"line": i['line'], "msg": i['message']} for i in data]
-        except Exception:
+            from pylint.reporters import CollectingReporter
+            from astroid import MANAGER
+
+            linter = _get_linter()
+            reporter = CollectingReporter()
+            linter.set_reporter(reporter)
+            _source = code_string
+            try:
+                linter.check([SNIPPET_NAME])
+            finally:
+                _source = ""
+                # Never let one snippet's module shadow the next one in astroid's cache.
+                MANAGER.astroid_cache.pop(SNIPPET_NAME[:-3], None)
+            return [{"line": m.line, "msg": m.msg} for m in reporter.messages]
+        except Exception as e:
+            logger.error(f"Pylint failed, reporting no issues for this snippet: {e!r}")
             return []
 
     @staticmethod
-    def _get_radon_data(file_path: str) -> list:
+    def _get_radon_data(code_string: str) -> list:
         try:
-            cmd = ["radon", "cc", "-s", "--json", file_path]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-            data = json.loads(result.stdout)
-            file_key = list(data.keys())[0]
-            return [{"name": i['name'], "score": i['complexity']} for i in data[file_key] if i['complexity'] > 5]
-        except Exception:
-            return []
\ No newline at end of file
+            from radon.complexity import cc_visit
+
+            return [{"name": b.name, "score": b.complexity} for b in cc_visit(code_string) if b.complexity > 5]
+        except Exception as e:
+            logger.error(f"Radon failed, reporting no complexity for this snippet: {e!r}")
+            return []
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=ANALYZER_WORKERS,
+            # spawn: the web worker already runs threads (event loop, sqlite), unsafe to fork.
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    return _executor
@@ -0,0 +1,184 @@
+import zlib
+import asyncio
+import logging
+
+logger = logging.getLogger("repo-archive")
+
+BLOCK = 512
+
+
+class ArchiveError(RuntimeError):
+    """The archive could not be read to its end, so the file list is incomplete."""
+
+
+def _parse_number(field: bytes) -> int:
+    if field and field[0] & 0x80:  # GNU base-256 for very large members
+        value = field[0] & 0x7F
+        for b in field[1:]:
+            value = (value << 8) | b
+        return value
+    field = field.rstrip(b"\0 ").strip()
+    return int(field, 8) if field else 0
+
+
+def _parse_pax(data: bytes) -> dict:
+    records, pos = {}, 0
+    while pos < len(data):
+        space = data.find(b" ", pos)
+        if space < 0:
+            break
+        length = int(data[pos:space])
+        key, _, value = data[space + 1:pos + length - 1].partition(b"=")
+        records[key.decode("utf-8", "replace")] = value.decode("utf-8", "replace")
+        pos += length
+    return records
+
+
+class TarStreamReader:
+    """Incremental ustar/pax reader: feed raw (or gzip) bytes, get finished members back.
+
+    Only members accepted by `want(path)` are buffered; everything else is skipped
+    block by block, so memory stays bounded by the largest wanted file.
+    """
+
+    def __init__(self, want=None, gzip: bool = False, strip_components: int = 0):
+        self.want = want or (lambda path: True)
+        self.strip_components = strip_components
+        self._inflate = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzip else None
+        self._buf = bytearray()
+        self._member = None      # (path, size, kind) of the member being read
+        self._data = bytearray()
+        self._remaining = 0
+        self._next_path = None   # long name announced by a pax/GNU header
+        self.done = False
+
+    def feed(self, chunk: bytes) -> list:
+        if self._inflate is not None:
+            chunk = self._inflate.decompress(chunk)
+        self._buf += chunk
+        members = []
+        while not self.done:
+            if self._member is None:
+                if len(self._buf) < BLOCK:
+                    break
+                header = bytes(self._buf[:BLOCK])
+                del self._buf[:BLOCK]
+                self._start_member(header)
+                continue
+
+            path, size, kind = self._member
+            take = min(len(self._buf), self._remaining)
+            if kind is not None and len(self._data) < size:
+                self._data += self._buf[:min(take, size - len(self._data))]
+            del self._buf[:take]
+            self._remaining -= take
+            if self._remaining:
+                break
+
+            data = bytes(self._data)
+            self._member, self._data = None, bytearray()
+            if kind == "file":
+                members.append((path, data))
+            elif kind == "pax":
+                self._next_path = _parse_pax(data).get("path", self._next_path)
+            elif kind == "longname":
+                self._next_path = data.rstrip(b"\0").decode("utf-8", "replace")
+        return members
+
+    def _start_member(self, header: bytes):
+        if header == b"\0" * BLOCK:
+            # Two zero blocks end the archive; one is enough to stop reading.
+            self.done = True
+            return
+
+        name = header[0:100].rstrip(b"\0").decode("utf-8", "replace")
+        prefix = header[345:500].rstrip(b"\0").decode("utf-8", "replace")
+        if header[257:262] == b"ustar" and prefix:
+            name = f"{prefix}/{name}"
+        size = _parse_number(header[124:136])
+        typeflag = header[156:157]
+
+        kind = None
+        if typeflag == b"x":
+            kind = "pax"
+        elif typeflag == b"L":
+            kind = "longname"
+        elif typeflag in (b"0", b"\0", b"7"):
+            if self._next_path:
+                name = self._next_path
+            self._next_path = None
+            name = self._strip(name)
+            if name and self.want(name):
+                kind = "file"
+        elif typeflag != b"g":
+            self._next_path = None
+
+        self._member = (name, size, kind)
+        self._remaining = size + (-size % BLOCK)
+        self._data = bytearray()
+
+    def _strip(self, name: str) -> str:
+        parts = name.split("/")
+        return "/".join(parts[self.strip_components:])
+
+
+def _decode(path: str, data: bytes):
+    try:
+        return {"path": path, "content": data.decode("utf-8")}
+    except UnicodeDecodeError:
+        logger.error(f"Skipping non UTF-8 file {path}")
+        return None
+
+
+async def iter_tar_stream(chunks, want=None, gzip: bool = False, strip_components: int = 0):
+    """Yields {"path", "content"} dicts from an async iterator of archive bytes.
+
+    Raises ArchiveError when the bytes end before the archive's end marker.
+    """
+    reader = TarStreamReader(want=want, gzip=gzip, strip_components=strip_components)
+    async for chunk in chunks:
+        for path, data in reader.feed(chunk):
+            file_data = _decode(path, data)
+            if file_data:
+                yield file_data
+        if reader.done:
+            break
+    if not reader.done:
+        raise ArchiveError("Archive ended before its end-of-archive marker")
+
+
+async def iter_local_archive(repo_path: str, ref: str = "HEAD", want=None):
+    """Streams `git archive` of a local (bare) clone through the same tar reader.
+
+    Raises ArchiveError when git fails, e.g. for an unknown ref.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "git", "-C", repo_path, "archive", "--format=tar", ref,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def chunks():
+        while True:
+            chunk = await proc.stdout.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+    try:
+        async for file_data in iter_tar_stream(chunks(), want=want):
+            yield file_data
+    except ArchiveError:
+        await proc.wait()
+        if proc.returncode == 0:
+            raise
+    finally:
+        if proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        await proc.wait()
+    if proc.returncode not in (0, -9):
+        err = (await proc.stderr.read()).decode("utf-8", "replace").strip()
+        raise ArchiveError(f"git archive failed for {repo_path}@{ref}: {err}")
@@ -0,0 +1,151 @@
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+@dataclass
+class Hunk:
+    old_start: int
+    old_count: int
+    new_start: int
+    new_count: int
+    added: List[tuple] = field(default_factory=list)    # (new_line_number, text)
+    removed: List[int] = field(default_factory=list)    # old line numbers
+    context: List[tuple] = field(default_factory=list)  # (old_line_number, new_line_number)
+
+
+@dataclass
+class FileDiff:
+    path: Optional[str]
+    old_path: Optional[str] = None
+    hunks: List[Hunk] = field(default_factory=list)
+
+    def map_old_line(self, line: int) -> Optional[int]:
+        """Where an old-file line ends up in the new file; None if the diff removed it."""
+        shift = 0
+        for hunk in self.hunks:
+            # A zero count means the hunk sits after line `start`, so it ends one line later.
+            old_end = hunk.old_start + (hunk.old_count or 1)
+            if line < hunk.old_start or (line == hunk.old_start and not hunk.old_count):
+                break
+            if line < old_end:
+                if line in hunk.removed:
+                    return None
+                return dict(hunk.context).get(line, line + shift)
+            shift = hunk.new_start + (hunk.new_count or 1) - old_end
+        return line + shift
+
+
+@dataclass
+class Shard:
+    """A reviewable slice of one file: its added lines and their new-file line numbers."""
+    path: Optional[str]
+    lines: List[str] = field(default_factory=list)
+    line_numbers: List[int] = field(default_factory=list)
+
+    @property
+    def code(self) -> str:
+        return "\n".join(self.lines)
+
+    def to_file_line(self, snippet_line: int) -> int:
+        if 1 <= snippet_line <= len(self.line_numbers):
+            return self.line_numbers[snippet_line - 1]
+        return snippet_line
+
+
+def _strip_prefix(path: str) -> Optional[str]:
+    path = path.split("\t", 1)[0].strip()
+    if path == "/dev/null":
+        return None
+    if path.startswith(("a/", "b/")):
+        return path[2:]
+    return path
+
+
+def parse_diff(diff_text: str) -> List[FileDiff]:
+    """Parses a unified (git) diff into files and hunks, keeping real line numbers."""
+    files: List[FileDiff] = []
+    current: Optional[FileDiff] = None
+    hunk: Optional[Hunk] = None
+    old_left = new_left = 0
+    old_line = new_line = 0
+
+    for line in diff_text.split("\n"):
+        if hunk is not None and (old_left > 0 or new_left > 0):
+            if line.startswith("+"):
+                hunk.added.append((new_line, line[1:]))
+                new_line += 1
+                new_left -= 1
+            elif line.startswith("-"):
+                hunk.removed.append(old_line)
+                old_line += 1
+                old_left -= 1
+            elif line.startswith("\\"):
+                pass  # "\ No newline at end of file"
+            else:
+                hunk.context.append((old_line, new_line))
+                old_line += 1
+                new_line += 1
+                old_left -= 1
+                new_left -= 1
+            continue
+
+        if line.startswith("diff --git "):
+            parts = line.split(" b/", 1)
+            current = FileDiff(path=parts[1] if len(parts) == 2 else None)
+            files.append(current)
+            hunk = None
+        elif line.startswith("--- ") and hunk is None:
+            if current is None:
+                current = FileDiff(path=None)
+                files.append(current)
+            current.old_path = _strip_prefix(line[4:])
+        elif line.startswith("+++ ") and hunk is None:
+            if current is None:
+                current = FileDiff(path=None)
+                files.append(current)
+            current.path = _strip_prefix(line[4:])
+        elif line.startswith("@@"):
+            match = HUNK_HEADER.match(line)
+            if not match:
+                continue
+            if current is None:
+                current = FileDiff(path=None)
+                files.append(current)
+            old_start, old_count, new_start, new_count = match.groups()
+            hunk = Hunk(
+                old_start=int(old_start),
+                old_count=int(old_count) if old_count is not None else 1,
+                new_start=int(new_start),
+                new_count=int(new_count) if new_count is not None else 1,
+            )
+            current.hunks.append(hunk)
+            old_left, new_left = hunk.old_count, hunk.new_count
+            old_line, new_line = hunk.old_start, hunk.new_start
+    return files
+
+
+def shard_diff(files: List[FileDiff], max_lines: int = 300) -> List[Shard]:
+    """Groups each file's added lines into shards of at most `max_lines` lines.
+
+    Hunks of the same file share a shard until it is full; a hunk larger than
+    the cap is split. Shards never span files, so findings map back cleanly.
+    """
+    shards = []
+    for file_diff in files:
+        shard = Shard(path=file_diff.path)
+        for hunk in file_diff.hunks:
+            if shard.lines and len(shard.lines) + len(hunk.added) > max_lines:
+                shards.append(shard)
+                shard = Shard(path=file_diff.path)
+            for number, text in hunk.added:
+                if len(shard.lines) >= max_lines:
+                    shards.append(shard)
+                    shard = Shard(path=file_diff.path)
+                shard.lines.append(text)
+                shard.line_numbers.append(number)
+        if shard.lines:
+            shards.append(shard)
+    return shards
@@ -1,6 +1,182 @@
 import os
-from openai import AsyncOpenAI
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from openai import AsyncOpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
 from dotenv import load_dotenv
+from .metrics import record_usage
 
 load_dotenv()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
\ No newline at end of file
+
+logger = logging.getLogger("llm-backend")
+
+RETRYABLE = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+class PooledClient:
+    """One AsyncOpenAI client (and its connection pool) plus the concurrency cap for its key."""
+
+    def __init__(self, api_key: str, base_url: str, max_concurrency: int):
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.active = 0
+        self.evicted = False
+
+    @property
+    def saturated(self) -> bool:
+        return self.semaphore.locked()
+
+    async def release(self):
+        self.active -= 1
+        if self.evicted and self.active == 0:
+            await self.client.close()
+
+
+class ClientPool:
+    """LRU of clients keyed by (api key, base url), so users bringing their own key
+    reuse connections instead of opening a fresh client per request."""
+
+    def __init__(self, max_clients: int = None, max_concurrency: int = None):
+        self.max_clients = max_clients or int(os.getenv("LLM_CLIENT_POOL_SIZE", "64"))
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY_PER_KEY", "8"))
+        self._clients = OrderedDict()
+
+    def get(self, api_key: str, base_url: str = None) -> PooledClient:
+        key = (api_key, base_url)
+        pooled = self._clients.get(key)
+        if pooled is None:
+            pooled = self._clients[key] = PooledClient(api_key, base_url, self.max_concurrency)
+            while len(self._clients) > self.max_clients:
+                _, old = self._clients.popitem(last=False)
+                # Requests may still be running on it; the last one out closes it.
+                old.evicted = True
+                if old.active == 0:
+                    asyncio.create_task(old.client.close())
+        self._clients.move_to_end(key)
+        return pooled
+
+    async def close(self):
+        clients, self._clients = list(self._clients.values()), OrderedDict()
+        await asyncio.gather(*[c.client.close() for c in clients], return_exceptions=True)
+
+
+client_pool = ClientPool()
+
+
+class Target:
+    """One OpenAI-compatible endpoint: api.openai.com by default, or a local llama.cpp/vLLM server."""
+
+    def __init__(self, model: str, base_url: str = None, api_key: str = None):
+        self.model = model
+        self.base_url = base_url
+        self.api_key = api_key  # fixed key for this endpoint; None means use the caller's
+
+    @property
+    def needs_caller_key(self) -> bool:
+        """Only the default endpoint without a fixed key has nothing to send but the caller's."""
+        return not self.api_key and not self.base_url
+
+    def key_for(self, caller_key: str) -> str:
+        # Self-hosted servers often check no key, but the client still needs one.
+        return self.api_key or caller_key or "local"
+
+
+class LLMBackend:
+    """Chat completions for one pipeline stage, with pooled clients, a per-key
+    concurrency cap, retry/backoff on rate limits and an optional overflow
+    endpoint used while the primary's slots for that key are all taken."""
+
+    def __init__(self, stage: str, primary: Target, overflow: Target = None, pool: ClientPool = None,
+                 max_retries: int = None, max_backoff: float = None):
+        self.stage = stage
+        self.primary = primary
+        self.overflow = overflow
+        self.pool = pool or client_pool
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "3")) if max_retries is None else max_retries
+        self.max_backoff = float(os.getenv("LLM_MAX_BACKOFF", "30")) if max_backoff is None else max_backoff
+
+    @property
+    def model(self) -> str:
+        return self.primary.model
+
+    @property
+    def needs_caller_key(self) -> bool:
+        # The overflow endpoint always has a key of its own (OVERFLOW_API_KEY, default "local").
+        return self.primary.needs_caller_key
+
+    @classmethod
+    def from_env(cls, stage: str, default_model: str) -> "LLMBackend":
+        """LLM_<STAGE>_MODEL / _BASE_URL / _API_KEY, plus the same with _OVERFLOW_ for the spill-over endpoint."""
+        prefix = f"LLM_{stage.upper()}_"
+        primary = Target(
+            model=os.getenv(prefix + "MODEL", default_model),
+            base_url=os.getenv(prefix + "BASE_URL"),
+            api_key=os.getenv(prefix + "API_KEY"),
+        )
+        overflow = None
+        if os.getenv(prefix + "OVERFLOW_BASE_URL"):
+            overflow = Target(
+                model=os.getenv(prefix + "OVERFLOW_MODEL", primary.model),
+                base_url=os.getenv(prefix + "OVERFLOW_BASE_URL"),
+                api_key=os.getenv(prefix + "OVERFLOW_API_KEY", "local"),
+            )
+        return cls(stage, primary, overflow)
+
+    def _route(self, caller_key: str) -> tuple:
+        pooled = self.pool.get(self.primary.key_for(caller_key), self.primary.base_url)
+        if self.overflow is not None and pooled.saturated:
+            logger.info(f"{self.stage}: primary saturated, sending to {self.overflow.base_url}")
+            return self.overflow, self.pool.get(self.overflow.key_for(caller_key), self.overflow.base_url)
+        return self.primary, pooled
+
+    async def complete(self, api_key: str, **kwargs):
+        """chat.completions.create on the routed endpoint; usage is recorded per stage."""
+        target, pooled = self._route(api_key)
+        pooled.active += 1
+        try:
+            async with pooled.semaphore:
+                resp = await self._with_retries(pooled, target, kwargs)
+        finally:
+            await pooled.release()
+        record_usage(self.stage, target.model, resp.usage)
+        return resp
+
+    async def stream(self, api_key: str, **kwargs):
+        """Streaming variant: yields chunks while holding the key's slot until the stream ends."""
+        target, pooled = self._route(api_key)
+        pooled.active += 1
+        usage = None
+        try:
+            async with pooled.semaphore:
+                stream = await self._with_retries(pooled, target, {
+                    **kwargs, "stream": True, "stream_options": {"include_usage": True}
+                })
+                async for chunk in stream:
+                    usage = getattr(chunk, "usage", None) or usage
+                    yield chunk
+        finally:
+            await pooled.release()
+        record_usage(self.stage, target.model, usage)
+
+    async def _with_retries(self, pooled: PooledClient, target: Target, kwargs: dict):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await pooled.client.chat.completions.create(model=target.model, **kwargs)
+            except RETRYABLE as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                logger.warning(f"{self.stage} call to {target.model} failed ({e.__class__.__name__}); "
+                               f"retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        return min(2 ** attempt + random.random(), self.max_backoff)
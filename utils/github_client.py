@@ -1,52 +1,289 @@
 import httpx
 import os
+import time
 import base64
 import logging
 import asyncio
+from collections import OrderedDict
+from .archive import ArchiveError, iter_tar_stream, iter_local_archive
+from .metrics import GITHUB_REQUESTS, GITHUB_RETRIES
 
 logger = logging.getLogger("github-client")
 
+try:
+    import h2  # noqa: F401  (enables httpx HTTP/2 support)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class FetchError(ArchiveError):
+    """GitHub did not return a repository's files, so no graph should be built from them."""
+
+
 class GitHubClient:
-    def __init__(self):
+    def __init__(self, transport: httpx.AsyncBaseTransport = None):
         self.token = os.getenv("GITHUB_TOKEN")
         self.headers = {
             "Authorization": f"token {self.token}",
             "Accept": "application/vnd.github.v3+json",
             "User-Agent": "CodeSight-Reviewer-Bot"
         }
+        self.api_url = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+        # "contents" fetches file by file; "archive" streams one tarball per review.
+        self.fetch_mode = os.getenv("GITHUB_FETCH_MODE", "contents")
+        # Directory of local mirrors laid out as <owner>/<repo>.git, used before the API.
+        self.local_mirrors = os.getenv("LOCAL_REPO_MIRRORS")
 
-    async def get_diff(self, diff_url: str) -> str:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                diff_url, 
-                headers={**self.headers, "Accept": "application/vnd.github.v3.diff"}, 
-                follow_redirects=True
+        self.max_concurrency = int(os.getenv("GITHUB_MAX_CONCURRENCY", "16"))
+        self.max_retries = int(os.getenv("GITHUB_MAX_RETRIES", "3"))
+        self.max_backoff = float(os.getenv("GITHUB_MAX_BACKOFF", "60"))
+        # Bodies kept for conditional GETs of trees, compares and diffs, in bytes per worker.
+        self.etag_cache_bytes = int(os.getenv("GITHUB_ETAG_CACHE_BYTES", str(32 * 1024 * 1024)))
+        self.http2 = HTTP2_AVAILABLE and os.getenv("GITHUB_HTTP2", "1") == "1"
+
+        self._transport = transport
+        self._client = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._validators = OrderedDict()  # (url, accept) -> (etag, last_modified, headers, content)
+        self._validator_bytes = 0
+        self.stats = {"requests": 0, "not_modified": 0, "retries": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """One pooled client per worker; created lazily for scripts that skip start()."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                transport=self._transport,
+                follow_redirects=True,
+                timeout=httpx.Timeout(30.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
             )
-            return response.text if response.status_code == 200 else ""
-
-    async def get_repo_contents(self, repo_full_name: str, branch: str = "main"):
-        url = f"https://api.github.com/repos/{repo_full_name}/git/trees/{branch}?recursive=1"
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, headers=self.headers)
-            if resp.status_code != 200:
-                return []
-            
-            tree = resp.json().get("tree", [])
-            files_to_index = [i["path"] for i in tree if i["path"].endswith(".py") and i["type"] == "blob"]
-
-            async def fetch_file(path):
-                file_url = f"https://api.github.com/repos/{repo_full_name}/contents/{path}?ref={branch}"
-                f_resp = await client.get(file_url, headers=self.headers)
-                if f_resp.status_code == 200:
-                    data = f_resp.json()
-                    decoded = base64.b64decode(data["content"]).decode('utf-8')
-                    return {"path": path, "content": decoded}
+        return self._client
+
+    async def start(self):
+        """Opens the pool at app startup so the first review pays no connection setup."""
+        return self.client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, url: str, headers: dict = None, revalidate: bool = False,
+                       **kwargs) -> httpx.Response:
+        """Sends through the shared pool with a concurrency cap and rate-limit retries.
+
+        `revalidate` GETs are conditional: their body is kept, and a 304 is replayed
+        from it as a 200. Meant for trees, compares and diffs, which are fetched
+        again unchanged; file contents rarely are, and would only fill memory.
+        """
+        headers = {**self.headers, **(headers or {})}
+        key = (url, headers.get("Accept")) if method == "GET" and revalidate else None
+        cached = self._validators.get(key) if key else None
+        if cached:
+            etag, last_modified, _, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                resp = await self.client.request(method, url, headers=headers, **kwargs)
+            self.stats["requests"] += 1
+            GITHUB_REQUESTS.labels(method=method, status=resp.status_code).inc()
+
+            if resp.status_code in (403, 429) and attempt < self.max_retries and _is_rate_limited(resp):
+                delay = self._retry_delay(resp, attempt)
+                self.stats["retries"] += 1
+                GITHUB_RETRIES.inc()
+                logger.warning(f"GitHub rate limited on {url}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            break
+
+        if resp.status_code == 304 and cached:
+            self.stats["not_modified"] += 1
+            self._validators.move_to_end(key)
+            return httpx.Response(200, headers=cached[2], content=cached[3], request=resp.request)
+
+        if key and resp.status_code == 200:
+            etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+            if etag or last_modified:
+                # Body is stored decoded, so drop headers describing the wire encoding.
+                replay_headers = {
+                    k: v for k, v in resp.headers.items()
+                    if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+                }
+                self._remember(key, (etag, last_modified, replay_headers, resp.content))
+        return resp
+
+    def _remember(self, key: tuple, entry: tuple):
+        """Adds a validator entry, evicting the least recently used over etag_cache_bytes."""
+        old = self._validators.pop(key, None)
+        if old is not None:
+            self._validator_bytes -= len(old[3])
+        if len(entry[3]) > self.etag_cache_bytes:
+            return
+        self._validators[key] = entry
+        self._validator_bytes += len(entry[3])
+        while self._validator_bytes > self.etag_cache_bytes:
+            _, evicted = self._validators.popitem(last=False)
+            self._validator_bytes -= len(evicted[3])
+
+    def _retry_delay(self, resp: httpx.Response, attempt: int) -> float:
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        reset = resp.headers.get("X-RateLimit-Reset")
+        if resp.headers.get("X-RateLimit-Remaining") == "0" and reset and reset.isdigit():
+            return min(max(int(reset) - time.time(), 1.0), self.max_backoff)
+        return min(2 ** attempt, self.max_backoff)
+
+    async def get_diff(self, diff_url: str) -> str:
+        response = await self._request(
+            "GET", diff_url, headers={"Accept": "application/vnd.github.v3.diff"}, revalidate=True
+        )
+        return response.text if response.status_code == 200 else ""
+
+    async def get_repo_contents(self, repo_full_name: str, branch: str = "main", known=None):
+        """Lists .py blobs with their git SHA.
+
+        `await known([(path, sha), ...])` returns the blobs the caller already has
+        indexed; those come back without "content" and cost no request. Raises
+        FetchError when the tree or a file cannot be fetched.
+        """
+        url = f"{self.api_url}/repos/{repo_full_name}/git/trees/{branch}?recursive=1"
+        resp = await self._request("GET", url, revalidate=True)
+        if resp.status_code != 200:
+            raise FetchError(f"Tree fetch failed for {repo_full_name}@{branch}: {resp.status_code}")
+
+        tree = resp.json().get("tree", [])
+        blobs = [i for i in tree if i["path"].endswith(".py") and i["type"] == "blob"]
+        skip = await known([(i["path"], i["sha"]) for i in blobs]) if known else set()
+
+        async def fetch_file(item):
+            path, sha = item["path"], item["sha"]
+            if (path, sha) in skip:
+                return {"path": path, "sha": sha}
+            file_url = f"{self.api_url}/repos/{repo_full_name}/contents/{path}?ref={branch}"
+            f_resp = await self._request("GET", file_url)
+            if f_resp.status_code != 200:
+                raise FetchError(f"File fetch failed for {repo_full_name}/{path}@{branch}: {f_resp.status_code}")
+            data = f_resp.json()
+            try:
+                decoded = base64.b64decode(data["content"]).decode('utf-8')
+            except UnicodeDecodeError:
+                logger.error(f"Skipping non UTF-8 file {path}")
                 return None
+            return {"path": path, "sha": sha, "content": decoded}
+
+        results = await asyncio.gather(*[fetch_file(item) for item in blobs])
+        return [r for r in results if r is not None]
+
+    async def iter_repo_archive(self, repo_full_name: str, ref: str = "main", local_path: str = None):
+        """Yields {"path", "content"} for every .py file in one streamed archive.
+
+        Reads a local (bare) clone when `local_path` is given or a mirror exists,
+        otherwise streams /tarball/{ref} and extracts members as bytes arrive.
+        Raises ArchiveError (FetchError for the API) when the archive cannot be read.
+        """
+        local_path = local_path or self._local_mirror(repo_full_name)
+        if local_path:
+            async for file_data in iter_local_archive(local_path, ref, want=_is_python):
+                yield file_data
+            return
+
+        url = f"{self.api_url}/repos/{repo_full_name}/tarball/{ref}"
+        async with self._semaphore:
+            async with self.client.stream("GET", url, headers=self.headers) as resp:
+                self.stats["requests"] += 1
+                if resp.status_code != 200:
+                    raise FetchError(f"Tarball fetch failed for {repo_full_name}@{ref}: {resp.status_code}")
+                # GitHub wraps the tree in a single "<owner>-<repo>-<sha>/" directory.
+                async for file_data in iter_tar_stream(
+                    resp.aiter_bytes(), want=_is_python, gzip=True, strip_components=1
+                ):
+                    yield file_data
+
+    def use_archive(self, repo_full_name: str) -> bool:
+        return self.fetch_mode == "archive" or self._local_mirror(repo_full_name) is not None
+
+    def _local_mirror(self, repo_full_name: str):
+        if not self.local_mirrors:
+            return None
+        path = os.path.join(self.local_mirrors, f"{repo_full_name}.git")
+        return path if os.path.isdir(path) else None
 
-            results = await asyncio.gather(*[fetch_file(path) for path in files_to_index])
-            return [r for r in results if r is not None]
+    async def compare(self, repo_full_name: str, base: str, head: str):
+        """Diff of the commits from `base` to `head`, or None unless head simply extends base.
+
+        A force-push or rebase leaves the two diverged, and the delta would then
+        include unrelated history; the caller reviews the whole PR again instead.
+        """
+        url = f"{self.api_url}/repos/{repo_full_name}/compare/{base}...{head}"
+        # per_page only pages the commit list; every changed file comes back on page 1.
+        resp = await self._request("GET", f"{url}?per_page=1", revalidate=True)
+        if resp.status_code != 200:
+            return None
+        data = resp.json()
+        status = data.get("status")
+        if status == "identical":
+            return ""
+        if status != "ahead":
+            logger.info(f"{repo_full_name}: {head[:7]} is {status} from {base[:7]}")
+            return None
+        diff = _patches_to_diff(data.get("files", []))
+        if diff is None:
+            # Patches are omitted for very large files and capped at 300 files.
+            resp = await self._request("GET", url, headers={"Accept": "application/vnd.github.v3.diff"},
+                                       revalidate=True)
+            diff = resp.text if resp.status_code == 200 else None
+        return diff
 
     async def post_comment(self, repo_full_name: str, pr_number: int, body: str):
-        url = f"https://api.github.com/repos/{repo_full_name}/issues/{pr_number}/comments"
-        async with httpx.AsyncClient() as client:
-            await client.post(url, headers=self.headers, json={"body": body})
\ No newline at end of file
+        """Returns the new comment's id, or None if GitHub did not create it."""
+        url = f"{self.api_url}/repos/{repo_full_name}/issues/{pr_number}/comments"
+        resp = await self._request("POST", url, json={"body": body})
+        return resp.json().get("id") if resp.status_code == 201 else None
+
+    async def update_comment(self, repo_full_name: str, comment_id: int, body: str) -> bool:
+        url = f"{self.api_url}/repos/{repo_full_name}/issues/comments/{comment_id}"
+        resp = await self._request("PATCH", url, json={"body": body})
+        return resp.status_code == 200
+
+
+def _patches_to_diff(files: list):
+    """Rebuilds a git diff from a compare response's per-file patches; None if any are missing."""
+    if len(files) >= 300:
+        return None
+    parts = []
+    for f in files:
+        new = f["filename"]
+        old = f.get("previous_filename", new)
+        if "patch" not in f:
+            if f.get("changes") and _is_python(new):
+                return None
+            continue
+        parts.append(
+            f"diff --git a/{old} b/{new}\n"
+            f"--- {'/dev/null' if f.get('status') == 'added' else 'a/' + old}\n"
+            f"+++ {'/dev/null' if f.get('status') == 'removed' else 'b/' + new}\n"
+            f"{f['patch']}"
+        )
+    return "\n".join(parts) + "\n" if parts else ""
+
+
+def _is_python(path: str) -> bool:
+    return path.endswith(".py")
+
+
+def _is_rate_limited(resp: httpx.Response) -> bool:
+    if resp.status_code == 429 or "Retry-After" in resp.headers:
+        return True
+    return resp.headers.get("X-RateLimit-Remaining") == "0" or "rate limit" in resp.text.lower()
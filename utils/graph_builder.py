@@ -1,52 +1,157 @@
 import ast
 
+
+def module_name(path: str) -> str:
+    """Dotted module for a repo-relative path: pkg/mod.py -> pkg.mod, pkg/__init__.py -> pkg."""
+    name = path[:-3] if path.endswith(".py") else path
+    parts = [p for p in name.split("/") if p]
+    if parts and parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
 class CodeGraph:
     def __init__(self):
-        self.nodes = {}  # name -> {"source": str, "code": str, "type": str}
-        self.edges = {}  # name -> set(callee_names)
+        self.nodes = {}    # qualname -> {"type": str, "start": int, "end": int} byte span in the file
+        self.edges = {}    # qualname -> set(refs); ref is (None, local qualname) or (module, qualname)
+        self.imports = {}  # bound name -> (module, qualname); qualname "" when the name is a module
 
 class GraphBuilder(ast.NodeVisitor):
-    def __init__(self, source_path: str):
+    """Records definitions by qualified name and calls as resolvable symbol references.
+
+    Calls that cannot be tied to a definition in this file or an import
+    (builtins, methods on arbitrary objects) are dropped instead of being
+    linked to whatever node happens to share the attribute name.
+    """
+
+    def __init__(self, source_path: str, source: bytes = b""):
         self.source_path = source_path
-        self.current_scope = None
+        self.module = module_name(source_path)
+        self.package = self.module if source_path.endswith("__init__.py") else self.module.rpartition(".")[0]
+        self.scopes = []       # stack of (qualname, "class" | "function")
+        self.defined = set()   # every qualname defined in this file
+        self.class_bases = {}  # class qualname -> [refs]
         self.graph = CodeGraph()
+        # Byte offset of each line start; ast col offsets are UTF-8 byte offsets too.
+        self.line_offsets = [0]
+        pos = source.find(b"\n")
+        while pos != -1:
+            self.line_offsets.append(pos + 1)
+            pos = source.find(b"\n", pos + 1)
+
+    def build(self, tree: ast.Module) -> CodeGraph:
+        """Two passes: definitions and imports first, so calls to later names resolve."""
+        self._collect(tree, "")
+        self.visit(tree)
+        return self.graph
+
+    def _collect(self, node, prefix: str):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                qualname = f"{prefix}{child.name}"
+                self.defined.add(qualname)
+                self._collect(child, qualname + ".")
+            else:
+                if isinstance(child, ast.Import):
+                    for alias in child.names:
+                        if alias.asname:
+                            self.graph.imports[alias.asname] = (alias.name, "")
+                        else:
+                            root = alias.name.split(".")[0]
+                            self.graph.imports[root] = (root, "")
+                elif isinstance(child, ast.ImportFrom):
+                    base = self._import_base(child)
+                    for alias in child.names:
+                        if alias.name != "*":
+                            self.graph.imports[alias.asname or alias.name] = (base, alias.name)
+                self._collect(child, prefix)
+
+    def _import_base(self, node: ast.ImportFrom) -> str:
+        if not node.level:
+            return node.module or ""
+        base = self.package
+        for _ in range(node.level - 1):
+            base = base.rpartition(".")[0]
+        if node.module:
+            return f"{base}.{node.module}" if base else node.module
+        return base
+
+    def _span(self, node) -> tuple:
+        first_line = min([d.lineno for d in node.decorator_list] + [node.lineno])
+        start = self.line_offsets[first_line - 1] + node.col_offset
+        end = self.line_offsets[node.end_lineno - 1] + node.end_col_offset
+        return start, end
+
+    def _qualname(self, name: str) -> str:
+        return f"{self.scopes[-1][0]}.{name}" if self.scopes else name
+
+    def _lookup(self, name: str) -> list:
+        """Resolves a bare name the way Python does: enclosing functions, then module, then imports."""
+        for qualname, kind in reversed(self.scopes):
+            if kind == "function" and f"{qualname}.{name}" in self.defined:
+                return [(None, f"{qualname}.{name}")]
+        if name in self.defined:
+            return [(None, name)]
+        if name in self.graph.imports:
+            return [self.graph.imports[name]]
+        return []
+
+    def _resolve(self, expr) -> list:
+        chain = []
+        while isinstance(expr, ast.Attribute):
+            chain.append(expr.attr)
+            expr = expr.value
+        if not isinstance(expr, ast.Name):
+            return []
+        chain.reverse()
+        root = expr.id
+
+        if root in ("self", "cls") and chain:
+            cls = next((q for q, kind in reversed(self.scopes) if kind == "class"), None)
+            if cls is None or len(chain) != 1:
+                return []
+            if f"{cls}.{chain[0]}" in self.defined:
+                return [(None, f"{cls}.{chain[0]}")]
+            # Inherited method: point at the same name on each resolvable base.
+            return [(mod, f"{qual}.{chain[0]}" if qual else chain[0]) for mod, qual in self.class_bases.get(cls, [])]
+
+        refs = []
+        for mod, qual in self._lookup(root):
+            full = ".".join(([qual] if qual else []) + chain)
+            if mod is None and full not in self.defined:
+                continue
+            if full:
+                refs.append((mod, full))
+        return refs
+
+    def _add_edges(self, refs: list):
+        if refs and self.scopes:
+            self.graph.edges.setdefault(self.scopes[-1][0], set()).update(refs)
 
     def visit_ClassDef(self, node: ast.ClassDef):
-        name = node.name
+        name = self._qualname(node.name)
+        start, end = self._span(node)
+        self.graph.nodes[name] = {"type": "class", "start": start, "end": end}
         # Track inheritance as edges
-        bases = [b.id for b in node.bases if isinstance(b, ast.Name)]
-        self.graph.nodes[name] = {
-            "source": self.source_path, 
-            "code": ast.unparse(node), 
-            "type": "class"
-        }
+        bases = [ref for b in node.bases for ref in self._resolve(b)]
+        self.class_bases[name] = bases
         self.graph.edges.setdefault(name, set()).update(bases)
-        
-        old_scope = self.current_scope
-        self.current_scope = name
+
+        self.scopes.append((name, "class"))
         self.generic_visit(node)
-        self.current_scope = old_scope
+        self.scopes.pop()
 
     def visit_FunctionDef(self, node: ast.FunctionDef):
-        full_name = f"{self.current_scope}.{node.name}" if self.current_scope else node.name
-        self.graph.nodes[full_name] = {
-            "source": self.source_path, 
-            "code": ast.unparse(node), 
-            "type": "function"
-        }
-        
-        old_scope = self.current_scope
-        self.current_scope = full_name
+        full_name = self._qualname(node.name)
+        start, end = self._span(node)
+        self.graph.nodes[full_name] = {"type": "function", "start": start, "end": end}
+
+        self.scopes.append((full_name, "function"))
         self.generic_visit(node)
-        self.current_scope = old_scope
+        self.scopes.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
 
     def visit_Call(self, node: ast.Call):
-        callee = None
-        if isinstance(node.func, ast.Name):
-            callee = node.func.id
-        elif isinstance(node.func, ast.Attribute):
-            callee = node.func.attr
-            
-        if callee and self.current_scope:
-            self.graph.edges.setdefault(self.current_scope, set()).add(callee)
-        self.generic_visit(node)
\ No newline at end of file
+        self._add_edges(self._resolve(node.func))
+        self.generic_visit(node)
@@ -0,0 +1,141 @@
+import os
+import pickle
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger("graph-cache")
+
+# Bump when the shape of a parsed file fragment changes so stale rows are ignored.
+FRAGMENT_VERSION = 3
+
+
+def blob_sha(content: str) -> str:
+    """Same SHA-1 git assigns to a blob, so local content matches tree listings."""
+    data = content.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class GraphCache:
+    """SQLite-backed store of per-file parse fragments keyed by (blob sha, path).
+
+    The database is shared by every worker on the host, so a file parsed once
+    is never parsed again until its blob changes. Fragments unused for `max_age`
+    seconds, and the least recently used beyond `max_bytes`, are pruned.
+    """
+
+    # Reads refresh a fragment's last use at most this often, to keep them read-only.
+    TOUCH_INTERVAL = 3600
+    PRUNE_INTERVAL = 600
+
+    def __init__(self, path: str = None, max_age: float = None, max_bytes: int = None):
+        self.path = path or os.getenv("GRAPH_CACHE_PATH", ".graph_cache.sqlite")
+        self.max_age = max_age or float(os.getenv("GRAPH_CACHE_MAX_AGE", str(14 * 86400)))
+        self.max_bytes = max_bytes or int(os.getenv("GRAPH_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+        self._local = threading.local()
+        self._pruned_at = 0.0
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fragments ("
+                "sha TEXT NOT NULL, path TEXT NOT NULL, version INTEGER NOT NULL, "
+                "data BLOB NOT NULL, size INTEGER NOT NULL DEFAULT 0, used_at REAL NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (sha, path, version))"
+            )
+            if "used_at" not in {row[1] for row in conn.execute("PRAGMA table_info(fragments)")}:
+                conn.execute("ALTER TABLE fragments ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE fragments ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+                conn.execute("UPDATE fragments SET size = length(data), used_at = ?", (time.time(),))
+            conn.execute("CREATE INDEX IF NOT EXISTS fragments_used_at ON fragments (used_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def has(self, path: str, sha: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM fragments WHERE sha = ? AND path = ? AND version = ?",
+            (sha, path, FRAGMENT_VERSION),
+        ).fetchone()
+        return row is not None
+
+    def get(self, path: str, sha: str):
+        return self.get_many([(path, sha)]).get((path, sha))
+
+    def has_many(self, keys: list) -> set:
+        """The given (path, sha) pairs that are cached, in one query per 500 blobs."""
+        return {(path, sha) for path, sha, *_ in self._select(keys, "")}
+
+    def get_many(self, keys: list) -> dict:
+        """Fragments for the given (path, sha) pairs that are cached, keyed by pair."""
+        found, stale = {}, []
+        now = time.time()
+        conn = self._conn()
+        for path, sha, data, used_at in self._select(keys, ", data, used_at"):
+            try:
+                found[(path, sha)] = pickle.loads(data)
+            except Exception as e:
+                logger.error(f"Corrupt graph cache entry for {path}@{sha}: {e}")
+                continue
+            if used_at < now - self.TOUCH_INTERVAL:
+                stale.append((now, sha, path, FRAGMENT_VERSION))
+        if stale:
+            with conn:
+                conn.executemany("UPDATE fragments SET used_at = ? WHERE sha = ? AND path = ? AND version = ?", stale)
+        return found
+
+    def _select(self, keys: list, columns: str) -> list:
+        """(path, sha, *columns) rows for the cached pairs among `keys`."""
+        wanted = set(keys)
+        shas = sorted({sha for _, sha in wanted})
+        rows = []
+        for k in range(0, len(shas), 500):  # stay under SQLite's bound-parameter limit
+            part = shas[k:k + 500]
+            rows += [row for row in self._conn().execute(
+                f"SELECT path, sha{columns} FROM fragments "
+                f"WHERE version = ? AND sha IN ({','.join('?' * len(part))})",
+                (FRAGMENT_VERSION, *part),
+            ) if (row[0], row[1]) in wanted]
+        return rows
+
+    def put(self, path: str, sha: str, fragment: dict):
+        self.put_many([(path, sha, fragment)])
+
+    def put_many(self, items: list):
+        """Stores (path, sha, fragment) triples in one transaction."""
+        now = time.time()
+        rows = []
+        for path, sha, fragment in items:
+            data = pickle.dumps(fragment, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((sha, path, FRAGMENT_VERSION, data, len(data), now))
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO fragments (sha, path, version, data, size, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+        if now - self._pruned_at > self.PRUNE_INTERVAL:
+            self._pruned_at = now
+            self.prune()
+
+    def prune(self) -> int:
+        """Drops expired or outdated fragments, then the least recently used over `max_bytes`."""
+        with self._conn() as conn:
+            removed = conn.execute(
+                "DELETE FROM fragments WHERE used_at < ? OR version != ?",
+                (time.time() - self.max_age, FRAGMENT_VERSION),
+            ).rowcount
+            removed += conn.execute(
+                "DELETE FROM fragments WHERE rowid IN (SELECT rowid FROM ("
+                "SELECT rowid, SUM(size) OVER (ORDER BY used_at DESC, rowid DESC) AS total FROM fragments"
+                ") WHERE total > ?)",
+                (self.max_bytes,),
+            ).rowcount
+        if removed:
+            logger.info(f"Pruned {removed} graph cache fragments")
+        return removed
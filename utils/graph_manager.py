@@ -1,64 +1,574 @@
+import os
+import re
 import ast
+import asyncio
 import logging
-from .graph_builder import GraphBuilder
+import multiprocessing
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from .graph_builder import GraphBuilder, module_name
+from .graph_cache import blob_sha
 
 logger = logging.getLogger("graph-manager")
 
+NODE_TYPES = ("", "class", "function")
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def parse_file(path: str, content: str) -> dict:
+    """Parses one file into a cacheable fragment of byte spans and symbol references."""
+    text = content.encode("utf-8")
+    tree = ast.parse(content)
+    graph = GraphBuilder(path, text).build(tree)
+    return {
+        "text": text,
+        "nodes": [(name, n["type"], n["start"], n["end"]) for name, n in graph.nodes.items()],
+        "edges": [(caller, ref) for caller, refs in graph.edges.items() for ref in refs],
+        "imports": graph.imports,
+    }
+
+
+def parse_chunk(items: list) -> list:
+    """Pool entry point: (path, sha, fragment, error) for a batch of (path, sha, content)."""
+    results = []
+    for path, sha, content in items:
+        try:
+            results.append((path, sha, parse_file(path, content), None))
+        except Exception as e:
+            results.append((path, sha, None, str(e)))
+    return results
+
+
+_parse_executor = None
+
+
+def _get_parse_executor(workers: int) -> ProcessPoolExecutor:
+    global _parse_executor
+    if _parse_executor is None:
+        _parse_executor = ProcessPoolExecutor(
+            max_workers=workers,
+            # spawn, as in the static analyzer: the web worker already runs threads.
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _parse_executor
+
+
+def shutdown_parse_pool():
+    global _parse_executor
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait=False, cancel_futures=True)
+        _parse_executor = None
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+def node_key(path: str, qualname: str) -> str:
+    return f"{path}::{qualname}"
+
+
+def _contained(source: bytes, text: str) -> bool:
+    return source.decode("utf-8", "replace").strip() in text
+
+
+class FileEntry:
+    """One indexed file: its text plus nodes and edges as interned-id arrays.
+
+    Edge targets are ids into the manager's reference table; they are resolved to
+    nodes when the index is frozen, because they may point into other files.
+    """
+    __slots__ = ("sha", "text", "imports", "node_ids", "node_types", "node_starts", "node_ends",
+                 "edge_src", "edge_dst")
+
+    def __init__(self, sha: str, text: bytes, imports: dict):
+        self.sha = sha
+        self.text = text
+        self.imports = imports
+        self.node_ids = array("I")
+        self.node_types = bytearray()
+        self.node_starts = array("I")
+        self.node_ends = array("I")
+        self.edge_src = array("I")
+        self.edge_dst = array("I")
+
+
+class GraphIndex:
+    """Frozen CSR view over every file: adjacency is two flat arrays per direction."""
+    __slots__ = ("size", "paths", "texts", "node_file", "node_type", "node_start", "node_end",
+                 "fwd_offsets", "fwd_targets", "rev_offsets", "rev_targets")
+
+    def __init__(self, size: int, entries: list, resolve):
+        self.size = size
+        self.paths = [path for path, _ in entries]
+        self.texts = [entry.text for _, entry in entries]
+        self.node_file = array("i", [-1]) * size
+        self.node_type = bytearray(size)
+        self.node_start = array("I", [0]) * size
+        self.node_end = array("I", [0]) * size
+
+        fwd, rev = set(), set()
+        for file_index, (_, entry) in enumerate(entries):
+            for k, node_id in enumerate(entry.node_ids):
+                self.node_file[node_id] = file_index
+                self.node_type[node_id] = entry.node_types[k]
+                self.node_start[node_id] = entry.node_starts[k]
+                self.node_end[node_id] = entry.node_ends[k]
+
+        for _, entry in entries:
+            for s, ref in zip(entry.edge_src, entry.edge_dst):
+                d = resolve(ref, self.has_node)
+                if d >= 0 and d != s:
+                    fwd.add((s << 32) | d)
+                    rev.add((d << 32) | s)
+
+        self.fwd_offsets, self.fwd_targets = self._csr(size, fwd)
+        self.rev_offsets, self.rev_targets = self._csr(size, rev)
+
+    @staticmethod
+    def _csr(size: int, pairs: set) -> tuple:
+        keys = sorted(pairs)
+        offsets = array("I", [0]) * (size + 1)
+        for key in keys:
+            offsets[(key >> 32) + 1] += 1
+        for i in range(size):
+            offsets[i + 1] += offsets[i]
+        targets = array("I", [key & 0xFFFFFFFF for key in keys])
+        return offsets, targets
+
+    def neighbors(self, node_id: int, reverse: bool = False):
+        offsets, targets = (self.rev_offsets, self.rev_targets) if reverse else (self.fwd_offsets, self.fwd_targets)
+        return targets[offsets[node_id]:offsets[node_id + 1]]
+
+    def has_node(self, node_id: int) -> bool:
+        return self.node_file[node_id] >= 0
+
+    def source(self, node_id: int) -> bytes:
+        return self.texts[self.node_file[node_id]][self.node_start[node_id]:self.node_end[node_id]]
+
+
 class GraphManager:
-    def __init__(self):
-        self.nodes = {}
-        self.edges = {}          # Outgoing: What this node calls
-        self.reverse_edges = {}  # Incoming: What calls this node
+    def __init__(self, cache=None, context_budget: int = None):
+        self.cache = cache       # Optional GraphCache shared across workers
+        self.files = {}          # path -> FileEntry
+        self.names = []          # interned node names; position is the node id
+        self._ids = {}           # "path::qualname" -> id
+        self.refs = []           # interned symbol references; position is the ref id
+        self._ref_ids = {}       # ("file", path, qualname) | ("module", module, qualname) -> ref id
+        self._index = None       # GraphIndex, rebuilt lazily after files change
+        self._resolve = None     # ref id -> node id for the current index
+        self._by_qualname = {}   # qualname -> node ids, rebuilt with the index
+        # Upper bound, in bytes of source, for each context string handed to the LLM.
+        self.context_budget = context_budget or int(os.getenv("GRAPH_CONTEXT_BUDGET", "32000"))
+        # Parse processes for async builds (0 parses on a thread) and files per pool task.
+        self.build_workers = int(os.getenv("GRAPH_BUILD_WORKERS", str(os.cpu_count() or 1)))
+        self.parse_chunk_size = int(os.getenv("GRAPH_PARSE_CHUNK", "64"))
+
+    def has_blob(self, path: str, sha: str) -> bool:
+        """True when the file at this blob SHA can be indexed without its content."""
+        current = self.files.get(path)
+        if current and current.sha == sha:
+            return True
+        return bool(self.cache and self.cache.has(path, sha))
+
+    async def known_blobs(self, blobs: list) -> set:
+        """The (path, sha) pairs `has_blob` would vouch for, with one cache query run
+        on a thread instead of one per blob on the event loop."""
+        unknown = []
+        known = set()
+        for path, sha in blobs:
+            current = self.files.get(path)
+            if current and current.sha == sha:
+                known.add((path, sha))
+            else:
+                unknown.append((path, sha))
+        if self.cache and unknown:
+            known |= await asyncio.to_thread(self.cache.has_many, unknown)
+        return known
 
     def build_from_contents(self, repo_contents: list):
-        """Builds a deterministic map from GitHub file list."""
-        self.nodes.clear()
-        self.edges.clear()
-        self.reverse_edges.clear()
+        """Brings the map in line with the given file list, re-parsing only changed blobs.
 
+        Entries may omit "content" when `has_blob` or `known_blobs` already vouched for their SHA.
+        """
+        seen = set()
         for file_data in repo_contents:
-            try:
-                tree = ast.parse(file_data["content"])
-                visitor = GraphBuilder(file_data["path"])
-                visitor.visit(tree)
-                
-                self.nodes.update(visitor.graph.nodes)
-                for caller, callees in visitor.graph.edges.items():
-                    self.edges.setdefault(caller, set()).update(callees)
-                    for callee in callees:
-                        self.reverse_edges.setdefault(callee, set()).add(caller)
-            except Exception as e:
-                logger.error(f"Error parsing {file_data['path']}: {e}")
-
-    def get_context(self, code_snippet: str, hops: int = 2) -> str:
+            seen.add(file_data["path"])
+            self.add_file(file_data)
+
+        for path in [p for p in self.files if p not in seen]:
+            self.remove_file(path)
+
+    async def build_from_contents_async(self, repo_contents: list):
+        """build_from_contents with parsing moved off the event loop."""
+        await self.build_from_stream(_iterate(repo_contents))
+
+    async def build_from_stream(self, files):
+        """Same as build_from_contents, but consumes an async iterator as files arrive.
+
+        Changed files are batched into chunks: each chunk is first looked up in the
+        cache on a thread, and what is not cached is parsed in a process pool while
+        the download continues; fragments are merged as chunks finish.
+        """
+        loop = asyncio.get_running_loop()
+        seen, changed, batch, pending = set(), [], [], set()
+        max_pending = max(1, self.build_workers) * 2
+        pooled = False
+
+        def submit(items):
+            nonlocal pooled
+            pooled = True
+            return loop.run_in_executor(_get_parse_executor(self.build_workers), parse_chunk, items)
+
+        async def parse_uncached():
+            nonlocal batch, changed, pending
+            batch += await asyncio.to_thread(self._reuse_many, changed)
+            changed = []
+            while len(batch) >= self.parse_chunk_size and self.build_workers > 0:
+                if len(pending) >= max_pending:
+                    # Backpressure: hold the download until a worker frees up.
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for future in done:
+                        await self._merge_parsed(future.result())
+                pending.add(submit(batch[:self.parse_chunk_size]))
+                batch = batch[self.parse_chunk_size:]
+
+        async for file_data in files:
+            path = file_data["path"]
+            seen.add(path)
+            sha = file_data.get("sha") or blob_sha(file_data["content"])
+            current = self.files.get(path)
+            if current and current.sha == sha:
+                continue
+            changed.append((path, sha, file_data.get("content")))
+            if len(changed) >= self.parse_chunk_size:
+                await parse_uncached()
+
+        if changed:
+            await parse_uncached()
+        if batch:
+            # A handful of changed files is not worth a trip through the pool.
+            if pooled or (self.build_workers > 0 and len(batch) >= self.parse_chunk_size):
+                pending.add(submit(batch))
+            else:
+                await self._merge_parsed(await asyncio.to_thread(parse_chunk, batch))
+        for future in asyncio.as_completed(pending):
+            await self._merge_parsed(await future)
+
+        for path in [p for p in self.files if p not in seen]:
+            self.remove_file(path)
+
+    def add_file(self, file_data: dict):
+        path = file_data["path"]
+        sha = file_data.get("sha") or blob_sha(file_data["content"])
+        if self._reuse(path, sha, file_data):
+            return
+        try:
+            fragment = parse_file(path, file_data["content"])
+        except Exception as e:
+            logger.error(f"Error parsing {path}: {e}")
+            return
+        if self.cache:
+            self.cache.put(path, sha, fragment)
+        self.add_fragment(path, sha, fragment)
+
+    def _reuse(self, path: str, sha: str, file_data: dict) -> bool:
+        """True when the file needs no parsing: unchanged, cached, or lacking content."""
+        current = self.files.get(path)
+        if current and current.sha == sha:
+            return True
+        fragment = self.cache.get(path, sha) if self.cache else None
+        if fragment is not None:
+            self.add_fragment(path, sha, fragment)
+            return True
+        if file_data.get("content") is None:
+            logger.error(f"No content or cached fragment for {path}@{sha}")
+            return True
+        return False
+
+    def _reuse_many(self, items: list) -> list:
+        """_reuse for a batch of (path, sha, content) with one cache query; returns those to parse."""
+        cached = self.cache.get_many([(path, sha) for path, sha, _ in items]) if self.cache else {}
+        todo = []
+        for path, sha, content in items:
+            fragment = cached.get((path, sha))
+            if fragment is not None:
+                self.add_fragment(path, sha, fragment)
+            elif content is None:
+                logger.error(f"No content or cached fragment for {path}@{sha}")
+            else:
+                todo.append((path, sha, content))
+        return todo
+
+    async def _merge_parsed(self, results: list):
+        parsed = []
+        for path, sha, fragment, error in results:
+            if fragment is None:
+                logger.error(f"Error parsing {path}: {error}")
+                continue
+            parsed.append((path, sha, fragment))
+            self.add_fragment(path, sha, fragment)
+        if self.cache and parsed:
+            # Pickling, the commit and the occasional prune stay off the event loop.
+            await asyncio.to_thread(self.cache.put_many, parsed)
+
+    def add_fragment(self, path: str, sha: str, fragment: dict):
+        entry = FileEntry(sha, fragment["text"], fragment["imports"])
+        for name, node_type, start, end in fragment["nodes"]:
+            entry.node_ids.append(self._intern(node_key(path, name)))
+            entry.node_types.append(NODE_TYPES.index(node_type))
+            entry.node_starts.append(start)
+            entry.node_ends.append(end)
+        for caller, (module, qualname) in fragment["edges"]:
+            ref = ("file", path, qualname) if module is None else ("module", module, qualname)
+            entry.edge_src.append(self._intern(node_key(path, caller)))
+            entry.edge_dst.append(self._intern_ref(ref))
+        self.files[path] = entry
+        self._index = None
+
+    def remove_file(self, path: str):
+        if self.files.pop(path, None) is not None:
+            self._index = None
+
+    def _intern(self, name: str) -> int:
+        node_id = self._ids.get(name)
+        if node_id is None:
+            node_id = len(self.names)
+            self._ids[name] = node_id
+            self.names.append(name)
+        return node_id
+
+    def _intern_ref(self, ref: tuple) -> int:
+        ref_id = self._ref_ids.get(ref)
+        if ref_id is None:
+            ref_id = len(self.refs)
+            self._ref_ids[ref] = ref_id
+            self.refs.append(ref)
+        return ref_id
+
+    @property
+    def index(self) -> GraphIndex:
+        if self._index is None:
+            self._resolve = self._resolver()
+            self._index = GraphIndex(len(self.names), sorted(self.files.items()), self._resolve)
+            self._build_lookup()
+        return self._index
+
+    def _resolver(self):
+        """Maps reference ids to node ids (-1 when unresolved) for the current file set."""
+        modules = {}
+        for path in sorted(self.files):
+            name = module_name(path)
+            modules.setdefault(name, path)
+            if name.startswith("src."):
+                modules.setdefault(name[4:], path)
+        resolved = {}
+
+        def lookup(path, qualname, has_node):
+            node_id = self._ids.get(node_key(path, qualname))
+            return node_id if node_id is not None and has_node(node_id) else -1
+
+        def from_module(module, qualname, has_node, depth=0):
+            # "pkg.mod" + "Cls.run" may mean module pkg.mod, or pkg.mod.Cls, etc.
+            parts = qualname.split(".") if qualname else []
+            for k in range(len(parts)):
+                mod = ".".join(p for p in [module] + parts[:k] if p)
+                path = modules.get(mod)
+                if path is None:
+                    continue
+                node_id = lookup(path, ".".join(parts[k:]), has_node)
+                if node_id >= 0:
+                    return node_id
+                # Follow re-exports such as `from .impl import run` in a package __init__.
+                reexport = self.files[path].imports.get(parts[k])
+                if reexport and depth < 4:
+                    target_mod, target_qual = reexport
+                    rest = ".".join(([target_qual] if target_qual else []) + parts[k + 1:])
+                    node_id = from_module(target_mod, rest, has_node, depth + 1)
+                    if node_id >= 0:
+                        return node_id
+            return -1
+
+        def resolve(ref_id, has_node):
+            node_id = resolved.get(ref_id)
+            if node_id is None:
+                kind, target, qualname = self.refs[ref_id]
+                if kind == "file":
+                    node_id = lookup(target, qualname, has_node)
+                else:
+                    node_id = from_module(target, qualname, has_node)
+                resolved[ref_id] = node_id
+            return node_id
+
+        return resolve
+
+    def _build_lookup(self):
+        """qualname -> node ids across files, for snippets whose path is unknown."""
+        index = self._index
+        self._by_qualname = {}
+        for node_id, name in enumerate(self.names):
+            if index.has_node(node_id):
+                self._by_qualname.setdefault(name.split("::", 1)[1], []).append(node_id)
+
+    def get_context(self, code_snippet: str, hops: int = 2, budget: int = None, path: str = None) -> str:
         """Forward RAG: Finds what the snippet calls."""
-        targets = self._get_defined_names(code_snippet)
-        return self._walk(targets, self.edges, hops, "DEPENDENCY")
+        targets = self._find_targets(code_snippet, path)
+        return self._walk(targets, False, hops, "DEPENDENCY", budget)
 
-    def get_impact_analysis(self, code_snippet: str, hops: int = 1) -> str:
+    def get_impact_analysis(self, code_snippet: str, hops: int = 1, budget: int = None, path: str = None) -> str:
         """Reverse RAG: Finds what calls this code."""
-        targets = self._get_defined_names(code_snippet)
-        return self._walk(targets, self.reverse_edges, hops, "IMPACTED NODE")
+        targets = self._find_targets(code_snippet, path)
+        return self._walk(targets, True, hops, "IMPACTED NODE", budget)
+
+    def _find_targets(self, snippet: str, path: str = None) -> list:
+        """Node ids for the snippet's definitions, preferring the file it came from."""
+        targets = []
+        for qualname in self._get_defined_names(snippet):
+            if path is not None:
+                node_id = self._node_id(path, qualname)
+                if node_id >= 0:
+                    targets.append(node_id)
+                    continue
+            targets.extend(self._nodes_named(qualname))
+        return targets
+
+    def _referenced_targets(self, snippet: str, path: str = None) -> list:
+        """Nodes the snippet's identifiers name in its file's scope: local definitions or imports."""
+        if path not in self.files:
+            return []
+        targets = []
+        for name in sorted(set(IDENTIFIER.findall(snippet))):
+            node_id = self._node_id(path, name)
+            if node_id < 0:
+                node_id = self._imported_node(path, name)
+            if node_id >= 0:
+                targets.append(node_id)
+        return targets
+
+    # Node lookups used by the queries; SnapshotGraph answers them from a mapped file.
+
+    def _node_id(self, path: str, qualname: str) -> int:
+        node_id = self._ids.get(node_key(path, qualname))
+        return node_id if node_id is not None and self.index.has_node(node_id) else -1
+
+    def _nodes_named(self, qualname: str) -> list:
+        self.index
+        return self._by_qualname.get(qualname, [])
+
+    def _node_name(self, node_id: int) -> str:
+        return self.names[node_id]
+
+    def _imported_node(self, path: str, name: str) -> int:
+        """Node an imported name in `path` refers to, or -1."""
+        binding = self.files[path].imports.get(name)
+        if binding is None:
+            return -1
+        module, qualname = binding
+        index = self.index
+        return self._resolve(self._intern_ref(("module", module, qualname)), index.has_node)
 
     def _get_defined_names(self, snippet):
         try:
             tree = ast.parse(snippet)
-            return [n.name for n in ast.walk(tree) if isinstance(n, (ast.FunctionDef, ast.ClassDef))]
         except: return []
+        names = []
+
+        def collect(node, prefix):
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    names.append(prefix + child.name)
+                    collect(child, f"{prefix}{child.name}.")
+                else:
+                    collect(child, prefix)
+
+        collect(tree, "")
+        return names
 
-    def _walk(self, start_nodes, edge_map, max_hops, label):
-        context, visited = [], set()
-        queue = [(t, 0) for t in start_nodes if t in self.nodes or t in edge_map]
+    def get_fan_in(self, code_snippet: str, path: str = None) -> int:
+        """Distinct direct callers of the snippet's definitions."""
+        index = self.index
+        targets = self._find_targets(code_snippet, path)
+        callers = set()
+        for node_id in targets:
+            callers.update(index.neighbors(node_id, reverse=True))
+        return len(callers - set(targets))
+
+    def get_context_chunks(self, code_snippet: str, hops: int = 2, impact_hops: int = 1,
+                           budget: int = None, path: str = None) -> list:
+        """Dependency and impact nodes as separate chunks tagged with their hop distance.
+
+        The snippet's own definitions come first at hop 0, except those whose source
+        the snippet already contains (an editor buffer applied to the graph before
+        its review); each walk still stops at `budget` bytes so a hub node cannot
+        make this unbounded.
+        """
+        targets = self._find_targets(code_snippet, path)
+        walks = ((False, hops, "DEPENDENCY"), (True, impact_hops, "IMPACTED NODE"))
+        root_label, offset = "BASE DEFINITION", 0
+        if not targets:
+            # A hunk from inside a function defines nothing; start from the names it uses.
+            targets = self._referenced_targets(code_snippet, path)
+            walks = ((False, hops - 1, "DEPENDENCY"),)
+            root_label, offset = None, 1
+
+        chunks, seen, emitted = [], set(), set()
+        for reverse, max_hops, label in walks:
+            for node_id, dist, text in self._walk_nodes(targets, reverse, max_hops, label, budget, root_label,
+                                                        known=code_snippet, emitted=emitted):
+                if node_id not in seen:
+                    seen.add(node_id)
+                    chunks.append({"name": self._node_name(node_id), "hop": dist + offset, "text": text})
+        return chunks
+
+    def _walk(self, start_nodes, reverse, max_hops, label, budget=None):
+        """BFS from the snippet's names, stopping once `budget` bytes of source are used."""
+        return "\n\n".join(text for _, _, text in self._walk_nodes(start_nodes, reverse, max_hops, label, budget))
+
+    def _walk_nodes(self, start_nodes, reverse, max_hops, label, budget=None, root_label=None, known=None,
+                    emitted=None):
+        """Yields (node_id, hop, formatted source) breadth-first until `budget` bytes are used.
+
+        Start nodes whose source is part of `known`, and members of a class already
+        in `emitted` (names yielded so far, updated here), are walked through but
+        not yielded: their source is already in the prompt.
+        """
+        emitted = set() if emitted is None else emitted
+        index = self.index
+        budget = budget or self.context_budget
+        used = 0
+
+        queue = deque()
+        visited = set()
+        for node_id in start_nodes:
+            if node_id not in visited:
+                visited.add(node_id)
+                queue.append((node_id, 0))
 
         while queue:
-            name, dist = queue.pop(0)
-            if name in visited or dist > max_hops: continue
-            visited.add(name)
-
-            node = self.nodes.get(name)
-            if node:
-                context.append(f"--- {label}: {name} ({node['source']}) ---\n{node['code']}")
-            
-            for neighbor in edge_map.get(name, []):
-                queue.append((neighbor, dist + 1))
-        return "\n\n".join(context)
\ No newline at end of file
+            node_id, dist = queue.popleft()
+            if index.has_node(node_id) and not self._repeated(node_id, dist, known, emitted):
+                source = index.source(node_id)
+                name = self._node_name(node_id)
+                qualname = name.split("::", 1)[1]
+                node_label = root_label if dist == 0 and root_label else label
+                header = f"--- {node_label}: {qualname} ({index.paths[index.node_file[node_id]]}) ---\n"
+                used += len(header) + len(source)
+                if used > budget:
+                    break
+                emitted.add(name)
+                yield node_id, dist, header + source.decode("utf-8", "replace")
+
+            if dist < max_hops:
+                for neighbor in index.neighbors(node_id, reverse):
+                    if neighbor not in visited:
+                        visited.add(neighbor)
+                        queue.append((neighbor, dist + 1))
+
+    def _repeated(self, node_id: int, dist: int, known: str, emitted: set) -> bool:
+        if dist == 0 and known and _contained(self.index.source(node_id), known):
+            return True
+        path, qualname = self._node_name(node_id).split("::", 1)
+        parts = qualname.split(".")
+        return any(node_key(path, ".".join(parts[:k])) in emitted for k in range(1, len(parts)))
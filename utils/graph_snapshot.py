@@ -0,0 +1,395 @@
+import os
+import sys
+import json
+import mmap
+import fcntl
+import struct
+import asyncio
+import hashlib
+import logging
+from array import array
+from collections import OrderedDict
+from .graph_manager import GraphManager, node_key
+
+logger = logging.getLogger("graph-snapshot")
+
+MAGIC = b"CRGS"
+SNAPSHOT_VERSION = 1
+# Order of the binary sections after the JSON header; all but the blobs are uint32 arrays.
+SECTIONS = ("name_offsets", "node_file", "node_type", "node_start", "node_end", "qual_order",
+            "fwd_offsets", "fwd_targets", "rev_offsets", "rev_targets",
+            "binding_offsets", "binding_nodes", "text_offsets", "names", "bindings", "text")
+BLOBS = ("node_type", "names", "bindings", "text")
+
+
+def write_snapshot(graph: GraphManager, path: str):
+    """Serializes the graph's frozen index to `path` atomically.
+
+    Layout: magic, header length, a JSON header (paths, blob shas, section
+    offsets), then 8-byte aligned sections. Nodes are renumbered in name order
+    so lookups are a bisect over the mapped name table; imports are stored
+    already resolved, as sorted "path::alias" -> node id bindings.
+    """
+    index = graph.index
+    old_ids = sorted((i for i in range(index.size) if index.has_node(i)), key=graph._node_name)
+    new_id = {old: new for new, old in enumerate(old_ids)}
+    names = [graph._node_name(i) for i in old_ids]
+
+    sections = {
+        "node_file": array("I", (index.node_file[i] for i in old_ids)),
+        "node_type": bytes(index.node_type[i] for i in old_ids),
+        "node_start": array("I", (index.node_start[i] for i in old_ids)),
+        "node_end": array("I", (index.node_end[i] for i in old_ids)),
+        "qual_order": array("I", sorted(range(len(names)), key=lambda i: (names[i].split("::", 1)[1], i))),
+    }
+    sections["name_offsets"], sections["names"] = _string_table(names)
+    for direction, reverse in (("fwd", False), ("rev", True)):
+        offsets, targets = array("I", [0]), array("I")
+        for old in old_ids:
+            targets.extend(sorted(new_id[t] for t in index.neighbors(old, reverse)))
+            offsets.append(len(targets))
+        sections[f"{direction}_offsets"], sections[f"{direction}_targets"] = offsets, targets
+
+    bindings = []
+    for file_path in index.paths:
+        for alias in graph.files[file_path].imports:
+            node_id = graph._imported_node(file_path, alias)
+            if node_id >= 0:
+                bindings.append((node_key(file_path, alias), new_id[node_id]))
+    bindings.sort()
+    sections["binding_offsets"], sections["bindings"] = _string_table([key for key, _ in bindings])
+    sections["binding_nodes"] = array("I", (node_id for _, node_id in bindings))
+
+    text_offsets = array("I", [0])
+    for text in index.texts:
+        text_offsets.append(text_offsets[-1] + len(text))
+    sections["text_offsets"] = text_offsets
+    sections["text"] = b"".join(index.texts)
+
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "byteorder": sys.byteorder,
+        "nodes": len(names),
+        "files": {p: graph.files[p].sha for p in index.paths},
+        "sections": {},
+    }
+    # Offsets depend on the header's own length, so size it with placeholders first.
+    layout = {name: [0, len(_raw(sections[name]))] for name in SECTIONS}
+    header["sections"] = layout
+    start = _aligned(8 + len(json.dumps(header)) + 16 * len(SECTIONS))
+    for name in SECTIONS:
+        layout[name][0] = start
+        start = _aligned(start + layout[name][1])
+    encoded = json.dumps(header).encode("utf-8")
+    if 8 + len(encoded) > layout[SECTIONS[0]][0]:
+        raise ValueError("snapshot header outgrew its reserved space")
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+        for name in SECTIONS:
+            f.write(b"\0" * (layout[name][0] - f.tell()))
+            f.write(_raw(sections[name]))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _string_table(strings: list) -> tuple:
+    offsets, blob = array("I", [0]), bytearray()
+    for s in strings:
+        blob += s.encode("utf-8")
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+
+def _raw(section) -> bytes:
+    return section.tobytes() if isinstance(section, array) else section
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+class SnapshotIndex:
+    """GraphIndex over a mapped snapshot: the same attributes and methods, backed
+    by memoryviews into the file instead of per-process arrays."""
+
+    def __init__(self, buffer: mmap.mmap, header: dict):
+        self._view = memoryview(buffer)
+        self.sections = {}
+        for name, (start, length) in header["sections"].items():
+            section = self._view[start:start + length]
+            self.sections[name] = section if name in BLOBS else section.cast("I")
+        self.size = header["nodes"]
+        self.paths = list(header["files"])
+        self.node_file = self.sections["node_file"]
+        self.node_type = self.sections["node_type"]
+        self.node_start = self.sections["node_start"]
+        self.node_end = self.sections["node_end"]
+        self.fwd_offsets, self.fwd_targets = self.sections["fwd_offsets"], self.sections["fwd_targets"]
+        self.rev_offsets, self.rev_targets = self.sections["rev_offsets"], self.sections["rev_targets"]
+        self.text_offsets, self.text = self.sections["text_offsets"], self.sections["text"]
+
+    def neighbors(self, node_id: int, reverse: bool = False):
+        offsets, targets = (self.rev_offsets, self.rev_targets) if reverse else (self.fwd_offsets, self.fwd_targets)
+        return targets[offsets[node_id]:offsets[node_id + 1]]
+
+    def has_node(self, node_id: int) -> bool:
+        return 0 <= node_id < self.size
+
+    def source(self, node_id: int) -> bytes:
+        base = self.text_offsets[self.node_file[node_id]]
+        return self.text[base + self.node_start[node_id]:base + self.node_end[node_id]].tobytes()
+
+    def release(self):
+        for section in self.sections.values():
+            section.release()
+        self._view.release()
+
+
+class SnapshotGraph(GraphManager):
+    """Read-only GraphManager answering queries from a snapshot file.
+
+    Every worker maps the same file, so the pages are shared through the OS page
+    cache instead of each process holding its own copy of the graph.
+    """
+
+    def __init__(self, path: str, context_budget: int = None):
+        super().__init__(context_budget=context_budget)
+        self.path = path
+        with open(path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header = self._read_header()
+        except Exception:
+            self._buffer.close()
+            raise
+        self.files = header["files"]  # path -> blob sha
+        self._index = SnapshotIndex(self._buffer, header)
+        sections = self._index.sections
+        self._names = (sections["name_offsets"], sections["names"])
+        self._bindings = (sections["binding_offsets"], sections["bindings"])
+        self._qual_order = sections["qual_order"]
+
+    def _read_header(self) -> dict:
+        """The snapshot's header; ValueError if the file is foreign, from another version, truncated or empty."""
+        if self._buffer[:4] != MAGIC:
+            raise ValueError(f"{self.path} is not a graph snapshot")
+        try:
+            (length,) = struct.unpack_from("<I", self._buffer, 4)
+            header = json.loads(self._buffer[8:8 + length])
+            version, byteorder, sections, files = (
+                header["version"], header["byteorder"], header["sections"], header["files"])
+        except (struct.error, KeyError, TypeError) as e:
+            raise ValueError(f"{self.path} has a corrupt header: {e}") from e
+        if version != SNAPSHOT_VERSION or byteorder != sys.byteorder:
+            raise ValueError(f"{self.path} was written by an incompatible version")
+        if any(start + size > len(self._buffer) for start, size in sections.values()):
+            raise ValueError(f"{self.path} is truncated")
+        if not files:
+            # Never written any more; one from before then recorded a failed fetch.
+            raise ValueError(f"{self.path} has no files")
+        return header
+
+    @property
+    def index(self) -> SnapshotIndex:
+        return self._index
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._buffer)
+
+    def has_blob(self, path: str, sha: str) -> bool:
+        return self.files.get(path) == sha
+
+    async def known_blobs(self, blobs: list) -> set:
+        return {(path, sha) for path, sha in blobs if self.files.get(path) == sha}
+
+    def add_fragment(self, path: str, sha: str, fragment: dict):
+        raise TypeError("graph snapshots are read-only")
+
+    def remove_file(self, path: str):
+        raise TypeError("graph snapshots are read-only")
+
+    def close(self):
+        self._index.release()
+        self._names = self._bindings = self._qual_order = None
+        self._buffer.close()
+
+    def _node_id(self, path: str, qualname: str) -> int:
+        offsets, blob = self._names
+        return _find(offsets, blob, node_key(path, qualname).encode("utf-8"))
+
+    def _nodes_named(self, qualname: str) -> list:
+        offsets, blob = self._names
+        order = self._qual_order
+        wanted = qualname.encode("utf-8")
+
+        def qualname_at(k):
+            name = _string_at(offsets, blob, order[k])
+            return name[name.index(b"::") + 2:]
+
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if qualname_at(mid) < wanted:
+                lo = mid + 1
+            else:
+                hi = mid
+        matches = []
+        while lo < len(order) and qualname_at(lo) == wanted:
+            matches.append(order[lo])
+            lo += 1
+        return matches
+
+    def _node_name(self, node_id: int) -> str:
+        offsets, blob = self._names
+        return _string_at(offsets, blob, node_id).decode("utf-8")
+
+    def _imported_node(self, path: str, name: str) -> int:
+        offsets, blob = self._bindings
+        k = _find(offsets, blob, node_key(path, name).encode("utf-8"))
+        return self._index.sections["binding_nodes"][k] if k >= 0 else -1
+
+
+def _readable(path: str) -> bool:
+    try:
+        SnapshotGraph(path).close()
+    except (FileNotFoundError, ValueError):
+        return False
+    return True
+
+
+def _string_at(offsets, blob, k: int) -> bytes:
+    return blob[offsets[k]:offsets[k + 1]].tobytes()
+
+
+def _find(offsets, blob, wanted: bytes) -> int:
+    """Position of `wanted` in a sorted string table, or -1."""
+    lo, hi = 0, len(offsets) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _string_at(offsets, blob, mid) < wanted:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo if lo < len(offsets) - 1 and _string_at(offsets, blob, lo) == wanted else -1
+
+
+class SnapshotStore:
+    """Directory of graph snapshots keyed by (repo, base commit sha).
+
+    The first worker to need a snapshot builds it under an exclusive file lock;
+    workers arriving meanwhile wait on the lock and then map the finished file
+    instead of building their own.
+    """
+
+    def __init__(self, directory: str = None, keep: int = None, max_open: int = None):
+        self.directory = directory or os.getenv("GRAPH_SNAPSHOT_DIR", ".graph_snapshots")
+        self.keep = keep or int(os.getenv("GRAPH_SNAPSHOT_KEEP", "3"))  # per repo, by age
+        self.max_open = max_open or int(os.getenv("GRAPH_SNAPSHOT_MAX_OPEN", "16"))
+        self._open = OrderedDict()  # path -> SnapshotGraph
+        self._building = {}         # path -> asyncio.Lock, so one coroutine per process takes the file lock
+        os.makedirs(self.directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "SnapshotStore":
+        if os.getenv("GRAPH_SNAPSHOTS", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls()
+
+    def path_for(self, repo: str, sha: str) -> str:
+        return os.path.join(self.directory, f"{self._repo_prefix(repo)}-{sha}.v{SNAPSHOT_VERSION}.graph")
+
+    @staticmethod
+    def _repo_prefix(repo: str) -> str:
+        return hashlib.sha1(repo.encode("utf-8")).hexdigest()[:16]
+
+    def stats(self) -> dict:
+        graphs = list(self._open.values())
+        return {"open": len(graphs), "mapped_bytes": sum(g.size_bytes for g in graphs)}
+
+    async def get(self, repo: str, sha: str, build) -> SnapshotGraph:
+        """Maps the snapshot for (repo, sha), calling `await build()` for a
+        GraphManager and writing it first if no worker has yet."""
+        path = self.path_for(repo, sha)
+        graph = self._cached(path)
+        if graph is not None:
+            return graph
+
+        lock = self._building.setdefault(path, asyncio.Lock())
+        try:
+            async with lock:
+                graph = self._cached(path)
+                if graph is None:
+                    if not os.path.exists(path):
+                        built = await self._build_locked(repo, path, build)
+                        if built is not None:
+                            return built
+                    try:
+                        graph = await asyncio.to_thread(SnapshotGraph, path)
+                    except ValueError as e:
+                        logger.warning(f"Rebuilding unreadable snapshot {os.path.basename(path)}: {e}")
+                        built = await self._build_locked(repo, path, build)
+                        if built is not None:
+                            return built
+                        graph = await asyncio.to_thread(SnapshotGraph, path)
+                    self._remember(path, graph)
+        finally:
+            self._building.pop(path, None)
+        return graph
+
+    async def _build_locked(self, repo: str, path: str, build):
+        """Builds and writes the snapshot unless another worker did. Returns the built
+        graph itself when it has no files, which is never written: an empty graph is
+        more likely a failed fetch than a repository without Python code."""
+        fd = os.open(path + ".lock", os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            if await asyncio.to_thread(_readable, path):
+                logger.info(f"Snapshot {os.path.basename(path)} was built by another worker")
+                return None
+            graph = await build()
+            if not graph.files:
+                logger.warning(f"Not writing snapshot {os.path.basename(path)}: the graph has no files")
+                return graph
+            await asyncio.to_thread(write_snapshot, graph, path)
+            logger.info(f"Wrote snapshot {os.path.basename(path)} ({os.path.getsize(path)} bytes)")
+            self._prune(repo, keep=path)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _cached(self, path: str):
+        graph = self._open.get(path)
+        if graph is not None:
+            self._open.move_to_end(path)
+        return graph
+
+    def _remember(self, path: str, graph: SnapshotGraph):
+        self._open[path] = graph
+        while len(self._open) > self.max_open:
+            # Not closed here: a review may still hold it; unmapped when collected.
+            self._open.popitem(last=False)
+
+    def _prune(self, repo: str, keep: str):
+        """Deletes all but the newest `self.keep` snapshots of a repo. Workers that
+        already mapped a deleted file keep reading it until they let it go."""
+        prefix = self._repo_prefix(repo) + "-"
+        snapshots = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.startswith(prefix) and name.endswith(".graph")]
+        snapshots.sort(key=os.path.getmtime, reverse=True)
+        for old in snapshots[self.keep:]:
+            if old == keep:
+                continue
+            for stale in (old, old + ".lock"):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        graphs, self._open = list(self._open.values()), OrderedDict()
+        for graph in graphs:
+            graph.close()
@@ -0,0 +1,128 @@
+import os
+import time
+import inspect
+import asyncio
+import logging
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from . import tracing
+
+logger = logging.getLogger("metrics")
+
+# Seconds; spans from sub-millisecond graph lookups to multi-minute LLM calls.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# prometheus_client's multiprocess mode: with PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py
+# does, for the multi-worker deployment) every worker writes its values to files there and
+# a scrape renders the whole host, whichever worker answers it.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", "5"))
+
+_collectors = []  # callables or coroutine functions refreshing gauges right before a scrape
+
+
+def add_collector(collector):
+    _collectors.append(collector)
+
+
+async def collect():
+    for collector in _collectors:
+        try:
+            result = collector()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error(f"Metrics collector failed: {e}")
+
+
+async def collect_periodically(interval: float):
+    """Keeps this worker's gauges fresh for scrapes other workers answer."""
+    while True:
+        await asyncio.sleep(interval)
+        await collect()
+
+
+def render() -> bytes:
+    """Text exposition of the current values; `await collect()` first to refresh gauges."""
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+STAGE_SECONDS = Histogram(
+    "codereview_stage_seconds", "Time spent in each review pipeline stage.", ("stage",), buckets=DEFAULT_BUCKETS)
+GITHUB_REQUESTS = Counter(
+    "codereview_github_requests_total", "GitHub API responses by method and status.", ("method", "status"))
+GITHUB_RETRIES = Counter(
+    "codereview_github_retries_total", "GitHub requests retried after rate limiting.")
+LLM_REQUESTS = Counter(
+    "codereview_llm_requests_total", "Chat completion calls by pipeline stage and model.", ("stage", "model"))
+LLM_TOKENS = Counter(
+    "codereview_llm_tokens_total", "Tokens reported in completion usage.", ("stage", "model", "kind"))
+PROMPT_CONTEXT_TOKENS = Counter(
+    "codereview_prompt_context_tokens_total",
+    "Repository context tokens per LLM call, sent vs dropped by the packing budget.", ("result",))
+AUDIT_DECISIONS = Counter(
+    "codereview_audit_decisions_total", "Auditor pass taken per reviewed shard: full, light or skip.", ("path",))
+REVIEW_SCOPES = Counter(
+    "codereview_pr_reviews_total",
+    "PR reviews by scope: full diff, only the commits since the last review, or already up to date.", ("scope",))
+REVIEW_JOBS = Counter(
+    "codereview_review_jobs_total", "Queued review jobs finished, by final state.", ("state",))
+
+tracing.add_listener(lambda stage, seconds: STAGE_SECONDS.labels(stage=stage).observe(seconds))
+
+
+def record_usage(stage: str, model: str, usage):
+    """Counts one completion and its token usage; usage may be None (e.g. streams without it)."""
+    LLM_REQUESTS.labels(stage=stage, model=model).inc()
+    if usage is None:
+        return
+    LLM_TOKENS.labels(stage=stage, model=model, kind="prompt").inc(usage.prompt_tokens or 0)
+    LLM_TOKENS.labels(stage=stage, model=model, kind="completion").inc(usage.completion_tokens or 0)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) if details else None
+    if cached:
+        LLM_TOKENS.labels(stage=stage, model=model, kind="cached").inc(cached)
+
+
+_otel_provider = None
+
+
+def enable_otel():
+    """Mirrors stage timings as OpenTelemetry spans when OTEL_EXPORTER_OTLP_ENDPOINT is set.
+
+    Optional: requires opentelemetry-sdk and the OTLP HTTP exporter to be installed.
+    """
+    global _otel_provider
+    if _otel_provider is not None or not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    except ImportError:
+        logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk is not installed")
+        return
+
+    service = os.getenv("OTEL_SERVICE_NAME", "code-reviewer-ai")
+    _otel_provider = TracerProvider(resource=Resource.create({"service.name": service}))
+    _otel_provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    tracer = _otel_provider.get_tracer("code-reviewer")
+
+    def export(stage: str, seconds: float):
+        end = time.time_ns()
+        span = tracer.start_span(stage, start_time=end - int(seconds * 1e9))
+        span.end(end_time=end)
+
+    tracing.add_listener(export)
+    logger.info(f"Exporting stage spans over OTLP as {service}")
+
+
+def shutdown_otel():
+    if _otel_provider is not None:
+        _otel_provider.shutdown()
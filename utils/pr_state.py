@@ -0,0 +1,71 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger("pr-state")
+
+
+@dataclass
+class PRState:
+    head_sha: str                 # last head commit the bot reviewed
+    comment_id: Optional[int]     # the bot's review comment, edited on later pushes
+    review: dict                  # ReviewResponse shown in that comment (findings on head_sha lines)
+    updated_at: float = 0.0
+
+
+class PRStateStore:
+    """Host-wide SQLite record of what the bot last reviewed on each PR, so a push
+    only needs the commits since then reviewed."""
+
+    def __init__(self, path: str, max_age: float = 30 * 86400):
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pr_state ("
+                "repo TEXT NOT NULL, pr_number INTEGER NOT NULL, head_sha TEXT NOT NULL, "
+                "comment_id INTEGER, review TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (repo, pr_number))"
+            )
+
+    @classmethod
+    def from_env(cls):
+        if os.getenv("INCREMENTAL_REVIEW", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            os.getenv("PR_STATE_PATH", ".pr_state.sqlite"),
+            max_age=float(os.getenv("PR_STATE_MAX_AGE", str(30 * 86400))),
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, repo: str, pr_number: int) -> Optional[PRState]:
+        row = self._conn().execute(
+            "SELECT head_sha, comment_id, review, updated_at FROM pr_state WHERE repo = ? AND pr_number = ?",
+            (repo, pr_number),
+        ).fetchone()
+        if row is None:
+            return None
+        return PRState(head_sha=row[0], comment_id=row[1], review=json.loads(row[2]), updated_at=row[3])
+
+    def put(self, repo: str, pr_number: int, state: PRState):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pr_state (repo, pr_number, head_sha, comment_id, review, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (repo, pr_number, state.head_sha, state.comment_id, json.dumps(state.review), now),
+            )
+            conn.execute("DELETE FROM pr_state WHERE updated_at < ?", (now - self.max_age,))
@@ -0,0 +1,93 @@
+import os
+import re
+import keyword
+import logging
+from dataclasses import dataclass
+
+logger = logging.getLogger("prompt-packer")
+
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "6000"))
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "gpt-4o")
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """tiktoken encoding for the review model, or None when unavailable.
+
+    tiktoken downloads its BPE tables on first use, so an offline worker without a
+    warm TIKTOKEN_CACHE_DIR falls back to the ~4 characters per token estimate.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            try:
+                _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable ({e.__class__.__name__}); estimating tokens from length")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def identifiers(code: str) -> set:
+    return {name for name in _IDENTIFIER.findall(code) if not keyword.iskeyword(name)}
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int          # tokens of the packed context
+    total_tokens: int    # tokens of every candidate chunk, i.e. the unpacked context
+    chunks_used: int
+    chunks_total: int
+
+    @property
+    def saved(self) -> int:
+        return self.total_tokens - self.tokens
+
+
+def pack_context(chunks: list, changed_code: str, budget: int = None) -> PackedContext:
+    """Greedily keeps the closest, most relevant graph chunks that fit in `budget` tokens.
+
+    Chunks are ranked by hop distance, then by how many of the changed code's
+    identifiers they mention, then by size; a chunk too large for what is left is
+    skipped so smaller ones further down can still fit.
+    """
+    budget = PROMPT_CONTEXT_TOKENS if budget is None else budget
+    wanted = identifiers(changed_code)
+
+    ranked = []
+    for chunk in chunks:
+        tokens = count_tokens(chunk["text"])
+        relevance = len(wanted & identifiers(chunk["text"]))
+        ranked.append((chunk["hop"], -relevance, tokens, chunk))
+    ranked.sort(key=lambda item: item[:3])
+
+    kept, used, total = [], 0, 0
+    for _, _, tokens, chunk in ranked:
+        total += tokens
+        if used + tokens <= budget:
+            kept.append(chunk["text"])
+            used += tokens
+
+    return PackedContext(
+        text="\n\n".join(kept),
+        tokens=used,
+        total_tokens=total,
+        chunks_used=len(kept),
+        chunks_total=len(ranked),
+    )
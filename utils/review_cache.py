@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger("review-cache")
+
+
+class MemoryBackend:
+    """Per-process LRU dict with expiry timestamps."""
+    blocking = False
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: dict, ttl: float):
+        self._data[key] = (time.time() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """Host-wide store shared by all workers; LRU by last access time."""
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS reviews ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS reviews_last_used ON reviews (last_used)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM reviews WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute("DELETE FROM reviews WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE reviews SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict, ttl: float):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO reviews (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            conn.execute("DELETE FROM reviews WHERE expires_at < ?", (now,))
+            conn.execute(
+                "DELETE FROM reviews WHERE key IN ("
+                "SELECT key FROM reviews ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM reviews").fetchone()[0]
+
+
+class ReviewCache:
+    """Content-addressed store of finished reviews plus the reviewer draft behind them."""
+
+    def __init__(self, backend, ttl: float = 86400):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        kind = os.getenv("REVIEW_CACHE_BACKEND", "memory")
+        ttl = float(os.getenv("REVIEW_CACHE_TTL", "86400"))
+        size = int(os.getenv("REVIEW_CACHE_SIZE", "1024"))
+        if kind == "none":
+            return None
+        if kind == "sqlite":
+            return cls(SQLiteBackend(os.getenv("REVIEW_CACHE_PATH", ".review_cache.sqlite"), size), ttl)
+        return cls(MemoryBackend(size), ttl)
+
+    @staticmethod
+    def make_key(**parts) -> str:
+        blob = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    async def _call(self, fn, *args):
+        """SQLite calls go to a thread; the in-memory backend is only touched from the loop."""
+        if self.backend.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def get(self, key: str):
+        try:
+            value = await self._call(self.backend.get, key)
+        except Exception as e:
+            logger.error(f"Review cache read failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, review: dict, draft: dict):
+        try:
+            await self._call(self.backend.set, key, {"review": review, "draft": draft}, self.ttl)
+        except Exception as e:
+            logger.error(f"Review cache write failed: {e}")
+
+    async def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entries": await self._call(len, self.backend),
+        }
@@ -0,0 +1,92 @@
+import os
+import logging
+from dataclasses import dataclass, field
+from typing import Optional
+
+logger = logging.getLogger("review-policy")
+
+FULL, LIGHT, SKIP = "full", "light", "skip"
+SEVERE_TYPES = ("bug", "security")
+
+
+@dataclass
+class AuditDecision:
+    path: str
+    model: Optional[str]
+    reasons: list = field(default_factory=list)
+
+    def __str__(self) -> str:
+        model = f" on {self.model}" if self.model else ""
+        return f"Audit: {self.path}{model} ({'; '.join(self.reasons)})"
+
+
+class ReviewPolicy:
+    """Decides per shard whether the auditor runs on the main model, a cheaper one, or not at all.
+
+    Signals: size of the changed code, the draft's finding count and severity,
+    whether its lines agree with pylint's, and how many callers the change has.
+    """
+
+    def __init__(self, mode: str = "adaptive", full_model: str = "gpt-4o", light_model: str = "gpt-4o-mini",
+                 skip_max_lines: int = 20, light_max_lines: int = 150, full_fan_in: int = 5,
+                 full_severe_findings: int = 3):
+        self.mode = mode
+        self.full_model = full_model
+        self.light_model = light_model
+        self.skip_max_lines = skip_max_lines
+        self.light_max_lines = light_max_lines
+        self.full_fan_in = full_fan_in
+        self.full_severe_findings = full_severe_findings
+
+    @classmethod
+    def from_env(cls, full_model: str, light_model: str) -> "ReviewPolicy":
+        mode = os.getenv("AUDIT_POLICY", "adaptive")
+        if mode not in ("adaptive", FULL, LIGHT, SKIP):
+            logger.warning(f"Unknown AUDIT_POLICY {mode!r}; auditing every review in full")
+            mode = FULL
+        return cls(
+            mode=mode,
+            full_model=full_model,
+            light_model=light_model,
+            skip_max_lines=int(os.getenv("AUDIT_SKIP_MAX_LINES", "20")),
+            light_max_lines=int(os.getenv("AUDIT_LIGHT_MAX_LINES", "150")),
+            full_fan_in=int(os.getenv("AUDIT_FULL_FAN_IN", "5")),
+            full_severe_findings=int(os.getenv("AUDIT_FULL_SEVERE_FINDINGS", "3")),
+        )
+
+    def decide(self, code: str, draft: dict, static_data: dict, fan_in: int = 0) -> AuditDecision:
+        if self.mode != "adaptive":
+            return self._decision(self.mode, [f"AUDIT_POLICY={self.mode}"])
+
+        lines = sum(1 for line in code.split("\n") if line.strip())
+        findings = [f for f in draft.get("findings") or [] if isinstance(f, dict)]
+        severe = [f for f in findings if str(f.get("type", f.get("category", ""))).lower() in SEVERE_TYPES]
+        static_lines = {issue.get("line") for issue in (static_data or {}).get("pylint_issues", [])}
+        complex_blocks = (static_data or {}).get("complexity", [])
+        agreed = sum(1 for f in findings if _near(f.get("line", f.get("line_number")), static_lines))
+        stats = f"{lines} lines, {len(findings)} findings, {len(severe)} severe, fan-in {fan_in}"
+
+        if any(str(f.get("type", f.get("category", ""))).lower() == "security" for f in findings):
+            return self._decision(FULL, ["security finding", stats])
+        if lines > self.light_max_lines:
+            return self._decision(FULL, ["large change", stats])
+        if fan_in >= self.full_fan_in and findings:
+            return self._decision(FULL, ["findings in widely used code", stats])
+        unbacked = sum(1 for f in severe if not _near(f.get("line", f.get("line_number")), static_lines))
+        if len(severe) >= self.full_severe_findings and unbacked:
+            return self._decision(FULL, [f"{unbacked} severe findings not backed by static analysis", stats])
+
+        static_clean = not static_lines and not complex_blocks
+        if not findings and static_clean and lines <= self.skip_max_lines and fan_in < self.full_fan_in:
+            return self._decision(SKIP, ["no findings and static analysis clean", stats])
+        return self._decision(LIGHT, [f"{agreed}/{len(findings)} findings match static lines", stats])
+
+    def _decision(self, path: str, reasons: list) -> AuditDecision:
+        model = {FULL: self.full_model, LIGHT: self.light_model}.get(path)
+        return AuditDecision(path=path, model=model, reasons=reasons)
+
+
+def _near(line, static_lines: set, slack: int = 1) -> bool:
+    if not isinstance(line, int):
+        return False
+    return any(isinstance(s, int) and abs(s - line) <= slack for s in static_lines)
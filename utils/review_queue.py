@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+from .metrics import REVIEW_JOBS
+from .tracing import stage
+
+logger = logging.getLogger("review-queue")
+
+QUEUED, RUNNING, DONE, FAILED, SUPERSEDED = "queued", "running", "done", "failed", "superseded"
+
+
+@dataclass
+class ReviewJob:
+    repo: str
+    pr_number: int
+    payload: dict
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    state: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+
+class MemoryQueueBackend:
+    """Per-process queue: one deque per repo, served round-robin.
+
+    A PR's next job waits until its running one finishes, so two reviews of
+    the same PR never overlap (within this process).
+    """
+
+    blocking = False
+    lease = None  # jobs cannot outlive their process, so nothing to re-claim
+
+    def __init__(self, history: int = 200):
+        self.history = history
+        self.jobs = OrderedDict()   # id -> ReviewJob, insertion ordered
+        self.pending = {}           # repo -> deque(job ids)
+        self.rotation = deque()     # repos with queued work, next to serve on the left
+        self.running = set()        # (repo, pr_number) of running jobs
+
+    def push(self, job: ReviewJob) -> ReviewJob:
+        queue = self.pending.setdefault(job.repo, deque())
+        for job_id in list(queue):
+            older = self.jobs[job_id]
+            if older.pr_number == job.pr_number:
+                older.state, older.finished_at = SUPERSEDED, time.time()
+                queue.remove(job_id)
+        if not queue and job.repo not in self.rotation:
+            self.rotation.append(job.repo)
+        queue.append(job.id)
+        self.jobs[job.id] = job
+        self._trim()
+        return job
+
+    def claim(self) -> Optional[ReviewJob]:
+        for _ in range(len(self.rotation)):
+            repo = self.rotation.popleft()
+            queue = self.pending.get(repo)
+            if not queue:
+                self.pending.pop(repo, None)
+                continue
+            job_id = next((i for i in queue if (repo, self.jobs[i].pr_number) not in self.running), None)
+            if job_id is None:
+                self.rotation.append(repo)
+                continue
+            queue.remove(job_id)
+            if queue:
+                self.rotation.append(repo)
+            else:
+                del self.pending[repo]
+            job = self.jobs[job_id]
+            job.state, job.started_at = RUNNING, time.time()
+            self.running.add((repo, job.pr_number))
+            return job
+        return None
+
+    def heartbeat(self, job: ReviewJob):
+        pass
+
+    def finish(self, job: ReviewJob, state: str, error: str = None):
+        job.state, job.finished_at, job.error = state, time.time(), error
+        self.running.discard((job.repo, job.pr_number))
+
+    def stats(self, limit: int = 50) -> dict:
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.state] = counts.get(job.state, 0) + 1
+        recent = [
+            {k: v for k, v in asdict(j).items() if k != "payload"}
+            for j in list(reversed(self.jobs.values()))[:limit]
+        ]
+        return {"depth": counts.get(QUEUED, 0), "states": counts, "jobs": recent}
+
+    def _trim(self):
+        finished = [j.id for j in self.jobs.values() if j.state not in (QUEUED, RUNNING)]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+
+class SQLiteQueueBackend:
+    """Durable queue shared by every worker on the host.
+
+    A running job whose worker has not sent a heartbeat for `lease` seconds
+    (the worker died) is claimable again, so restarts do not lose work. A
+    queued job is not claimed while another job of the same PR is running.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, lease: float = 900, history: int = 1000):
+        self.path = path
+        self.lease = lease
+        self.history = history
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, repo TEXT NOT NULL, pr_number INTEGER NOT NULL, "
+                "payload TEXT NOT NULL, state TEXT NOT NULL, created_at REAL NOT NULL, "
+                "started_at REAL, finished_at REAL, error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at)")
+            if "heartbeat_at" not in {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}:
+                conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def push(self, job: ReviewJob) -> ReviewJob:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE jobs SET state = ?, finished_at = ? WHERE repo = ? AND pr_number = ? AND state = ?",
+                (SUPERSEDED, time.time(), job.repo, job.pr_number, QUEUED),
+            )
+            conn.execute(
+                "INSERT INTO jobs (id, repo, pr_number, payload, state, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job.id, job.repo, job.pr_number, json.dumps(job.payload), job.state, job.created_at),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job
+
+    def claim(self) -> Optional[ReviewJob]:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Fairness: prefer the repo with the fewest running jobs, then the oldest job.
+            # A PR with a live running job is skipped: its next job waits for it.
+            row = conn.execute(
+                "SELECT j.id, j.repo, j.pr_number, j.payload, j.created_at FROM jobs j "
+                "WHERE (j.state = ? OR (j.state = ? AND COALESCE(j.heartbeat_at, j.started_at) < ?)) "
+                "AND NOT EXISTS (SELECT 1 FROM jobs p WHERE p.repo = j.repo AND p.pr_number = j.pr_number "
+                "AND p.id != j.id AND p.state = ? AND COALESCE(p.heartbeat_at, p.started_at) >= ?) "
+                "ORDER BY (SELECT COUNT(*) FROM jobs r WHERE r.repo = j.repo AND r.state = ?), "
+                "j.created_at LIMIT 1",
+                (QUEUED, RUNNING, now - self.lease, RUNNING, now - self.lease, RUNNING),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute("UPDATE jobs SET state = ?, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                         (RUNNING, now, now, row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return ReviewJob(
+            id=row[0], repo=row[1], pr_number=row[2], payload=json.loads(row[3]),
+            state=RUNNING, created_at=row[4], started_at=now,
+        )
+
+    def heartbeat(self, job: ReviewJob):
+        """Extends the job's lease while its review is still running."""
+        self._conn().execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND state = ?",
+                             (time.time(), job.id, RUNNING))
+
+    def finish(self, job: ReviewJob, state: str, error: str = None):
+        job.state, job.finished_at, job.error = state, time.time(), error
+        conn = self._conn()
+        conn.execute(
+            "UPDATE jobs SET state = ?, finished_at = ?, error = ? WHERE id = ?",
+            (state, job.finished_at, error, job.id),
+        )
+        conn.execute(
+            "DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE state NOT IN (?, ?) "
+            "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (QUEUED, RUNNING, self.history),
+        )
+
+    def stats(self, limit: int = 50) -> dict:
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+        rows = conn.execute(
+            "SELECT id, repo, pr_number, state, created_at, started_at, finished_at, error "
+            "FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        keys = ("id", "repo", "pr_number", "state", "created_at", "started_at", "finished_at", "error")
+        return {"depth": counts.get(QUEUED, 0), "states": counts, "jobs": [dict(zip(keys, r)) for r in rows]}
+
+
+class ReviewQueue:
+    """Bounded pool of asyncio workers draining a pluggable job backend."""
+
+    MAX_BACKOFF = 30.0    # seconds between retries while the backend keeps failing
+    FINISH_ATTEMPTS = 5
+
+    def __init__(self, backend, handler, concurrency: int = 2, poll_interval: float = 1.0):
+        self.backend = backend
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._workers = []
+
+    @classmethod
+    def from_env(cls, handler):
+        kind = os.getenv("REVIEW_QUEUE_BACKEND", "memory")
+        concurrency = int(os.getenv("REVIEW_WORKERS", "2"))
+        if kind == "sqlite":
+            backend = SQLiteQueueBackend(
+                os.getenv("REVIEW_QUEUE_PATH", ".review_queue.sqlite"),
+                lease=float(os.getenv("REVIEW_JOB_LEASE", "900")),
+            )
+        else:
+            backend = MemoryQueueBackend()
+        return cls(backend, handler, concurrency)
+
+    async def start(self):
+        for i in range(self.concurrency):
+            self._workers.append(asyncio.create_task(self._work(i)))
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def enqueue(self, repo: str, pr_number: int, payload: dict) -> ReviewJob:
+        job = await self._call(self.backend.push, ReviewJob(repo=repo, pr_number=pr_number, payload=payload))
+        self._wakeup.set()
+        return job
+
+    async def status(self, jobs: bool = False) -> dict:
+        """Worker count, depth and jobs per state; `jobs` adds the recent jobs
+        with their repos and errors."""
+        stats = await self._call(self.backend.stats, 50 if jobs else 0)
+        if not jobs:
+            stats.pop("jobs")
+        return {"workers": self.concurrency, **stats}
+
+    async def _call(self, fn, *args):
+        """SQLite calls go to a thread; the in-memory backend is only touched from the loop."""
+        if self.backend.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def _work(self, worker_id: int):
+        failures = 0  # consecutive backend errors, for the back-off
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await self._call(self.backend.claim)
+            except Exception as e:
+                failures += 1
+                delay = min(self.poll_interval * 2 ** failures, self.MAX_BACKOFF)
+                logger.error(f"Queue worker {worker_id} could not claim a job: {e}; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            failures = 0
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heartbeat = asyncio.create_task(self._heartbeat(job)) if self.backend.lease else None
+            try:
+                with stage("review"):
+                    await self.handler(**job.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Review job {job.id} ({job.repo}#{job.pr_number}) failed: {e}")
+                await self._finish(job, FAILED, str(e))
+            else:
+                await self._finish(job, DONE)
+            finally:
+                if heartbeat is not None:
+                    heartbeat.cancel()
+
+    async def _finish(self, job: ReviewJob, state: str, error: str = None):
+        """Records the outcome, retrying a failing backend. A job never recorded stays
+        RUNNING until its lease expires, and another worker then reviews it again."""
+        for attempt in range(self.FINISH_ATTEMPTS):
+            try:
+                await self._call(self.backend.finish, job, state, error)
+                break
+            except Exception as e:
+                logger.error(f"Could not record review job {job.id} as {state}: {e}")
+                await asyncio.sleep(min(self.poll_interval * 2 ** attempt, self.MAX_BACKOFF))
+        REVIEW_JOBS.labels(state=state).inc()
+
+    async def _heartbeat(self, job: ReviewJob):
+        """Renews the job's lease a few times per lease period until the review ends."""
+        while True:
+            await asyncio.sleep(self.backend.lease / 3)
+            try:
+                await self._call(self.backend.heartbeat, job)
+            except Exception as e:
+                logger.warning(f"Heartbeat for review job {job.id} failed: {e}")
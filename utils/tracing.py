@@ -0,0 +1,53 @@
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger("tracing")
+
+# Spans of the trace the current task belongs to. Tasks spawned inside a trace
+# (asyncio.gather, create_task, to_thread) copy the context and share the list.
+_current = ContextVar("trace_spans", default=None)
+_listeners = []
+
+
+@contextmanager
+def trace():
+    """Collects (stage, seconds) for every stage finished inside the block."""
+    spans = []
+    token = _current.set(spans)
+    try:
+        yield spans
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Times one pipeline stage; a no-op beyond a clock read when nothing listens."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        spans = _current.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+        for listener in _listeners:
+            try:
+                listener(name, elapsed)
+            except Exception as e:
+                logger.error(f"Stage listener failed for {name}: {e}")
+
+
+def add_listener(listener):
+    """Registers listener(stage, seconds), called as each stage finishes anywhere."""
+    _listeners.append(listener)
+
+
+def totals(spans: list) -> dict:
+    """Sums spans per stage; shards reviewed in parallel add up, like billed time."""
+    result = {}
+    for name, seconds in spans:
+        result[name] = result.get(name, 0.0) + seconds
+    return result
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from .graph_manager import GraphManager
+from .graph_cache import blob_sha
+
+logger = logging.getLogger("workspace-sessions")
+
+
+class SessionNotFound(KeyError):
+    pass
+
+
+class WorkspaceSession:
+    """One editor workspace: its manifest (path -> blob sha) and the graph built from it."""
+
+    def __init__(self, session_id: str, manifest: dict, cache=None):
+        self.id = session_id
+        self.manifest = manifest
+        self.graph = GraphManager(cache=cache)
+        self.lock = asyncio.Lock()
+        self.last_used = time.time()
+
+    async def missing(self) -> list:
+        """Manifest paths whose blob is neither in the graph nor in the shared fragment cache."""
+        known = await self.graph.known_blobs(list(self.manifest.items()))
+        return sorted(p for p, sha in self.manifest.items() if (p, sha) not in known)
+
+    async def sync(self, uploads: dict = None):
+        """Brings the graph in line with the manifest, parsing only `uploads` (path -> content).
+
+        Uploaded content wins over a stale manifest hash, so a file edited after
+        the manifest was sent is indexed as uploaded.
+        """
+        uploads = uploads or {}
+        for path, content in uploads.items():
+            self.manifest[path] = blob_sha(content)
+        known = await self.graph.known_blobs([(p, sha) for p, sha in self.manifest.items() if p not in uploads])
+        files = []
+        for path, sha in self.manifest.items():
+            if path in uploads:
+                files.append({"path": path, "sha": sha, "content": uploads[path]})
+            elif (path, sha) in known:
+                files.append({"path": path, "sha": sha})
+        await self.graph.build_from_contents_async(files)
+        # Freeze here, off the loop, so the next review's lookup does not.
+        await asyncio.to_thread(lambda: self.graph.index)
+
+
+class WorkspaceSessions:
+    """Per-worker LRU of session graphs, backed by a host-wide SQLite table of manifests.
+
+    Any worker can serve any session: one it has not seen is rebuilt from the
+    manifest and the shared GraphCache, without the editor re-uploading files.
+    Sessions idle for longer than `ttl` are dropped.
+    """
+
+    def __init__(self, path: str, cache=None, max_sessions: int = 16, ttl: float = 3600,
+                 max_files: int = 20000, max_upload_bytes: int = 8 * 1024 * 1024):
+        self.path = path
+        self.cache = cache
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_files = max_files
+        self.max_upload_bytes = max_upload_bytes
+        self._sessions = OrderedDict()  # id -> WorkspaceSession
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, manifest TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    @classmethod
+    def from_env(cls, cache=None) -> "WorkspaceSessions":
+        return cls(
+            os.getenv("WORKSPACE_SESSIONS_PATH", ".workspace_sessions.sqlite"),
+            cache=cache,
+            max_sessions=int(os.getenv("WORKSPACE_MAX_SESSIONS", "16")),
+            ttl=float(os.getenv("WORKSPACE_SESSION_TTL", "3600")),
+            max_files=int(os.getenv("WORKSPACE_MAX_FILES", "20000")),
+            max_upload_bytes=int(os.getenv("WORKSPACE_MAX_UPLOAD_BYTES", str(8 * 1024 * 1024))),
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, session_id: str):
+        row = self._conn().execute(
+            "SELECT manifest FROM sessions WHERE id = ? AND updated_at >= ?",
+            (session_id, time.time() - self.ttl),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save(self, session: WorkspaceSession):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, manifest, updated_at) VALUES (?, ?, ?)",
+                (session.id, json.dumps(session.manifest), now),
+            )
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - self.ttl,))
+
+    def _filter(self, manifest: dict) -> dict:
+        manifest = {p: sha for p, sha in manifest.items() if p.endswith(".py")}
+        if len(manifest) > self.max_files:
+            raise ValueError(f"Workspace has {len(manifest)} Python files; the limit is {self.max_files}")
+        return manifest
+
+    async def create(self, manifest: dict) -> WorkspaceSession:
+        session = WorkspaceSession(uuid.uuid4().hex, self._filter(manifest), self.cache)
+        async with session.lock:
+            await session.sync()
+        await asyncio.to_thread(self._save, session)
+        self._remember(session)
+        return session
+
+    async def get(self, session_id: str) -> WorkspaceSession:
+        """The live session, rebuilt from its stored manifest if this worker lacks it."""
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            manifest = await asyncio.to_thread(self._load, session_id)
+            if manifest is None:
+                raise SessionNotFound(session_id)
+            session = WorkspaceSession(session_id, manifest, self.cache)
+            async with session.lock:
+                await session.sync()
+            self._remember(session)
+        session.last_used = time.time()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    async def update(self, session_id: str, changes: dict = None, uploads: dict = None,
+                     hold: bool = False) -> WorkspaceSession:
+        """Applies manifest changes (path -> sha, or None for a deleted file) and uploaded files.
+
+        With `hold`, the session comes back with its lock still held, so a review can
+        read the graph it just updated; the caller releases `session.lock`.
+        """
+        session = await self.get(session_id)
+        await session.lock.acquire()
+        try:
+            for path, sha in self._filter({p: s for p, s in (changes or {}).items() if s}).items():
+                session.manifest[path] = sha
+            for path, sha in (changes or {}).items():
+                if sha is None:
+                    session.manifest.pop(path, None)
+            uploads = {p: c for p, c in (uploads or {}).items() if p.endswith(".py") and isinstance(c, str)}
+            if sum(len(c.encode()) for c in uploads.values()) > self.max_upload_bytes:
+                raise ValueError(f"Upload exceeds {self.max_upload_bytes} bytes; send fewer files per request")
+            if len(session.manifest.keys() | uploads.keys()) > self.max_files:
+                raise ValueError(f"Workspace would exceed {self.max_files} Python files")
+            await session.sync(uploads)
+            await asyncio.to_thread(self._save, session)
+        except BaseException:
+            session.lock.release()
+            raise
+        if not hold:
+            session.lock.release()
+        return session
+
+    def _remember(self, session: WorkspaceSession):
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        while len(self._sessions) > self.max_sessions:
+            evicted, _ = self._sessions.popitem(last=False)
+            logger.info(f"Evicted workspace session {evicted[:8]} (LRU)")
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for session_id in [s.id for s in self._sessions.values() if s.last_used < cutoff]:
+            del self._sessions[session_id]
+
+    def stats(self) -> dict:
+        sessions = list(self._sessions.values())
+        return {"sessions": len(sessions), "files": sum(len(s.graph.files) for s in sessions)}